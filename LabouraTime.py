@@ -1,62 +1,34 @@
 # app_timer_hist.py
+import time
+_T_START = time.perf_counter()  # arranque en frío: se mide desde aquí
+
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
     QComboBox, QInputDialog, QMessageBox, QTreeWidget, QTreeWidgetItem,
-    QFileDialog, QTabWidget, QTableWidget, QTableWidgetItem, QDateEdit,
-    QDialog, QFormLayout, QLineEdit, QDateTimeEdit, QDialogButtonBox, QCheckBox
+    QFileDialog, QTabWidget, QTableView, QHeaderView, QDateEdit,
+    QDialog, QFormLayout, QLineEdit, QDateTimeEdit, QDialogButtonBox, QCheckBox,
+    QProgressBar, QTableWidget, QTableWidgetItem
+)
+from PySide6.QtCore import (
+    QTimer, Qt, QDate, QDateTime, QAbstractTableModel, QModelIndex,
+    QObject, Signal, QRunnable, QThreadPool, QFileSystemWatcher
 )
-from PySide6.QtCore import QTimer, Qt, QDate, QDateTime
-import sys, time, json, csv, uuid
+import sys, os, threading
 from datetime import datetime, date, time as dtime
-from pathlib import Path
-from collections import defaultdict
-
-DATA_FILE = Path("data.json")
-
-
-# ============== utils ==============
-def fmt_hms(seconds: int | float) -> str:
-    seconds = int(seconds)
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
-    s = seconds % 60
-    return f"{h:02d}:{m:02d}:{s:02d}"
-
-
-def ts_to_iso(ts: float) -> str:
-    return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="seconds")
-
-
-def recalc_totals_from_sessions(sessions):
-    sections = defaultdict(lambda: defaultdict(int))
-    for s in sessions:
-        sections[s["section"]][s["sub"]] += int(s["seconds"])
-    return sections
-
-
-def load_data():
-    if DATA_FILE.exists():
-        try:
-            raw = json.loads(DATA_FILE.read_text(encoding="utf-8"))
-            sessions = raw.get("sessions", [])
-            for s in sessions:
-                if "id" not in s:
-                    s["id"] = str(uuid.uuid4())
-            sections = recalc_totals_from_sessions(sessions)
-            current = raw.get("current", None)
-            return sections, current, sessions
-        except Exception as e:
-            print("WARN load_data:", e)
-    return defaultdict(lambda: defaultdict(int)), None, []
+from operator import attrgetter
 
+from laboura.core import (
+    QUERY_ENGINE, VERIFY_TOTALS, fmt_hms, day_of, Session, SessionList,
+    TotalsAggregate, SessionIndex, DayRollup, session_row_values,
+    write_totals_csv, write_sessions_csv, write_rollup_csv, open_store, apply_change,
+    remap_mapping, remap_key, find_overlaps, resolve_overlaps, recalc_totals_from_sessions,
+)
+from laboura.importer import read_import
+from laboura.profiling import PROFILER, ENABLED as PROFILING, CPROFILE_FILE, timed, span, count
 
-def save_data(sections, current, sessions):
-    payload = {
-        "sections": {s: dict(subs) for s, subs in sections.items()},
-        "current": current,
-        "sessions": sessions,
-    }
-    DATA_FILE.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+# LABOURA_TIMING=1 imprime los tiempos de arranque por fases
+STARTUP_TIMING = os.environ.get("LABOURA_TIMING") == "1"
+OVERLAP_LIST_MAX = 200  # solapes que se listan en el detalle del aviso
 
 
 # ============== diálogo de edición ==============
@@ -64,11 +36,11 @@ class EditSessionDialog(QDialog):
     def __init__(self, parent, session):
         super().__init__(parent)
         self.setWindowTitle("Editar sesión")
-        self.session = dict(session)
+        self.session = session
 
         lay = QFormLayout(self)
-        self.le_section = QLineEdit(self.session["section"])
-        self.le_sub = QLineEdit(self.session["sub"])
+        self.le_section = QLineEdit(self.session.section)
+        self.le_sub = QLineEdit(self.session.sub)
 
         self.dt_start = QDateTimeEdit(self)
         self.dt_start.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
@@ -77,8 +49,8 @@ class EditSessionDialog(QDialog):
         self.dt_end.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
         self.dt_end.setCalendarPopup(True)
 
-        self.dt_start.setDateTime(QDateTime.fromSecsSinceEpoch(int(self.session["start_ts"])))
-        self.dt_end.setDateTime(QDateTime.fromSecsSinceEpoch(int(self.session["end_ts"])))
+        self.dt_start.setDateTime(QDateTime.fromSecsSinceEpoch(int(self.session.start_ts)))
+        self.dt_end.setDateTime(QDateTime.fromSecsSinceEpoch(int(self.session.end_ts)))
 
         lay.addRow("Sección:", self.le_section)
         lay.addRow("Subdivisión:", self.le_sub)
@@ -102,14 +74,56 @@ class EditSessionDialog(QDialog):
             QMessageBox.warning(self, "Validación", "Fin debe ser posterior a Inicio.")
             return None
         seconds = int(t1 - t0)
-        out = dict(self.session)
-        out.update({
-            "section": section, "sub": sub,
-            "start_ts": float(t0), "end_ts": float(t1),
-            "start_iso": ts_to_iso(t0), "end_iso": ts_to_iso(t1),
-            "seconds": seconds
-        })
-        return out
+        return Session(self.session.uid, section, sub, t0, t1, seconds, self.session.user)
+
+
+# ============== diálogo de reagrupado ==============
+class RemapDialog(QDialog):
+    # Una fila por sección/subdivisión con su destino editable: renombrar,
+    # fusionar (mismo destino que otra) o mover a otra sección, todo de una vez
+    def __init__(self, parent, sections):
+        super().__init__(parent)
+        self.setWindowTitle("Reagrupar secciones y subdivisiones")
+        self.resize(720, 480)
+        keys = [(sec, sub) for sec in sorted(sections) for sub in sorted(sections[sec])]
+
+        lay = QVBoxLayout(self)
+        lay.addWidget(QLabel("Escribe el destino de las que quieras cambiar. "
+                             "Si el destino ya existe, se fusionan."))
+        self.table = QTableWidget(len(keys), 4, self)
+        self.table.setHorizontalHeaderLabels(
+            ["Sección", "Subdivisión", "Nueva sección", "Nueva subdivisión"])
+        for row, (sec, sub) in enumerate(keys):
+            for col, text in enumerate((sec, sub, sec, sub)):
+                item = QTableWidgetItem(text)
+                if col < 2:
+                    item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+                self.table.setItem(row, col, item)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        lay.addWidget(self.table)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        lay.addWidget(buttons)
+
+    def get_pairs(self):
+        # -> [[sección, sub, nueva sección, nueva sub], ...] o None si no es válido
+        pairs = []
+        for row in range(self.table.rowCount()):
+            sec, sub, new_sec, new_sub = (self.table.item(row, c).text().strip() for c in range(4))
+            if not new_sec or not new_sub:
+                QMessageBox.warning(self, "Validación", f"Destino vacío para '{sec} / {sub}'.")
+                return None
+            if (new_sec, new_sub) != (sec, sub):
+                pairs.append([sec, sub, new_sec, new_sub])
+        try:
+            remap_mapping(pairs)
+        except ValueError as e:
+            QMessageBox.warning(self, "Validación",
+                                f"{e}.\nHazlo en dos pasos (p. ej. un nombre intermedio).")
+            return None
+        return pairs
 
 # ============== tema / estilos ==============
 from PySide6.QtGui import QPalette, QColor
@@ -159,7 +173,7 @@ QTabBar::tab {
 }
 QTabBar::tab:selected { background: #1F252B; }
 
-QTreeWidget, QTableWidget {
+QTreeWidget, QTableView {
   background: #0F1419; color: #E6E6E6;
   border: 1px solid #2A2F36; border-radius: 12px;
   gridline-color: #2A2F36;
@@ -169,7 +183,7 @@ QHeaderView::section {
   padding: 6px 8px; border: 0px;
   border-right: 1px solid #2A2F36; border-bottom: 1px solid #2A2F36;
 }
-QTableWidget::item:selected, QTreeView::item:selected { background: #2B323B; }
+QTableView::item:selected, QTreeView::item:selected { background: #2B323B; }
 QCheckBox { spacing: 8px; }
 """
 
@@ -193,36 +207,437 @@ def apply_theme(app, dark=True):
     app.setStyleSheet(QSS)
 
 
+# ============== modelos de tabla ==============
+class _RowsTableModel(QAbstractTableModel):
+    # Modelo sobre una lista de filas: los textos se calculan al pintar y sólo
+    # para las celdas visibles; el orden usa claves numéricas (SortRole).
+    HEADERS = ()
+    SortRole = Qt.ItemDataRole.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self._sort = None
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = list(rows)
+        if self._sort is not None:
+            self._sort_rows(*self._sort)
+        self._invalidate()
+        self.endResetModel()
+
+    def row_at(self, row):
+        return self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.display(index.row(), index.column())
+        if role == self.SortRole:
+            return self.sort_key(index.column())(self.rows[index.row()])
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self._sort_rows(column, order)
+        self._invalidate()
+        self.layoutChanged.emit()
+
+    def _invalidate(self):
+        pass
+
+    def _sort_rows(self, column, order):
+        self._sort = (column, order)
+        self.rows.sort(key=self.sort_key(column),
+                       reverse=(order == Qt.SortOrder.DescendingOrder))
+
+    def display(self, row, col):
+        raise NotImplementedError
+
+    def sort_key(self, col):
+        raise NotImplementedError
+
+
+class SessionTableModel(_RowsTableModel):
+    HEADERS = ("ID", "Sección", "Subdivisión", "Inicio", "Fin", "HH:MM:SS", "Usuario")
+    _KEYS = ("id", "section", "sub", "start_ts", "end_ts", "seconds", "user")
+    # los textos (fechas ISO incluidas) sólo se guardan para filas ya pintadas
+    CACHE_ROWS = 4096
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cache = {}
+
+    def _invalidate(self):
+        self._cache = {}
+
+    def display(self, row, col):
+        vals = self._cache.get(row)
+        if vals is None:
+            if len(self._cache) >= self.CACHE_ROWS:
+                self._cache = {}
+            vals = self._cache[row] = session_row_values(self.rows[row])
+        return vals[col]
+
+    def sort_key(self, col):
+        if self._KEYS[col] == "user":
+            return lambda s: s.user or ""
+        return attrgetter(self._KEYS[col])
+
+
+class SummaryTableModel(_RowsTableModel):
+    # filas: (periodo, sección, subdivisión, segundos)
+    HEADERS = ("Periodo", "Sección", "Subdivisión", "HH:MM:SS")
+
+    def display(self, row, col):
+        r = self.rows[row]
+        return fmt_hms(r[3]) if col == 3 else r[col]
+
+    def sort_key(self, col):
+        return lambda r: r[col]
+
+
+class ProfileTableModel(_RowsTableModel):
+    # filas de PROFILER.rows(): (nombre, llamadas, total, media, máx, última) en s
+    HEADERS = ("Medida", "Llamadas", "Total ms", "Media ms", "Máx ms", "Última ms")
+
+    def display(self, row, col):
+        v = self.rows[row][col]
+        if col >= 2:
+            return f"{v * 1000:.1f}" if col == 2 else f"{v * 1000:.2f}"
+        return str(v)
+
+    def sort_key(self, col):
+        return lambda r: r[col]
+
+
+# ============== tareas en segundo plano ==============
+class TaskCancelled(Exception):
+    pass
+
+
+class _TaskSignals(QObject):
+    progress = Signal(int)
+    done = Signal(object, object)
+    failed = Signal(object, str)
+    finished = Signal(object)
+
+
+class BackgroundTask(QRunnable):
+    # Ejecuta fn(task) en un QThreadPool; las señales llegan al hilo de la GUI.
+    # fn puede llamar a task.progress()/task.check() para informar y cancelarse.
+    def __init__(self, fn, on_done=None, on_error=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.signals = _TaskSignals()
+        self._cancel = threading.Event()
+        self._pct = -1
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def progress(self, done, total):
+        self.check()
+        pct = int(done * 100 / total) if total else 100
+        if pct != self._pct:
+            self._pct = pct
+            self.signals.progress.emit(pct)
+
+    def run(self):
+        try:
+            result = self.fn(self)
+            if not self.cancelled():
+                self.signals.done.emit(self, result)
+        except TaskCancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self, str(e))
+        finally:
+            self.signals.finished.emit(self)
+
+
 # ============== app principal ==============
 class SectionTimerApp(QWidget):
+    POLL_MS = 10000
+    WATCH_DEBOUNCE_MS = 150
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Laboura Time")
-        self.sections, self.current, self.sessions = load_data()
+        self.store = open_store()
+        self.totals = TotalsAggregate()
+        self.sections = self.totals.sections
+        self.current, self.sessions = None, SessionList()
+        self.index = SessionIndex()
+        self.rollup = DayRollup()
+        self.columns = None
+        self.filtered_sessions = []
+        self.store.attach(lambda: (self.sections, self.current, self.sessions, self.rollup))
         self._running = False
         self._t0 = None
+        self._loaded = False
+        self.pool = QThreadPool(self)
+        self._tasks = set()
+        self._filter_task = None
+        self._reading_months = False
+        self.startup = {}  # hito -> ms desde _T_START
 
         self.tabs = QTabWidget()
         self.timer_tab = QWidget()
-        self.history_tab = QWidget()
+        self.history_tab = QWidget()  # se construye al abrirla por primera vez
+        self._history_built = False
         self._build_timer_tab(self.timer_tab)
-        self._build_history_tab(self.history_tab)
         self.tabs.addTab(self.timer_tab, "Timer")
         self.tabs.addTab(self.history_tab, "Histórico")
+        self.diag_tab = None
+        if PROFILING:
+            # LABOURA_PROFILE=1: tiempos de las rutas calientes
+            self.diag_tab = QWidget()
+            self._build_diag_tab(self.diag_tab)
+            self.tabs.addTab(self.diag_tab, "Diagnóstico")
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+
+        self.progress = QProgressBar()
+        self.progress.setTextVisible(False)
+        self.progress.setMaximumHeight(6)
+        self.progress.hide()
 
         root = QVBoxLayout(self)
         root.addWidget(self.tabs)
+        root.addWidget(self.progress)
 
         self.ui_timer = QTimer(self)
         self.ui_timer.setInterval(200)
         self.ui_timer.timeout.connect(self._update_label)
 
-        # init
-        self._refresh_sections()
-        self._refresh_subs()
+        # cambios hechos por fuera (otra instancia, un script, un
+        # sincronizador): avisos del sistema de ficheros agrupados en una
+        # sola lectura incremental; el temporizador es la red de seguridad
+        # para carpetas de red que no avisan
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_store_touched)
+        self.watcher.directoryChanged.connect(self._on_store_touched)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(self.WATCH_DEBOUNCE_MS)
+        self.watch_timer.timeout.connect(self._poll_changes)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.POLL_MS)
+        self.poll_timer.timeout.connect(self._poll_changes)
+
+        # init por fases: la cabecera (secciones + sesión en curso) ya, la
+        # carga completa en segundo plano y el histórico al abrir su pestaña
+        self._set_actions_enabled(False)
+        self.tabs.setTabEnabled(self.tabs.indexOf(self.history_tab), False)
+        self._load_header()
+        QTimer.singleShot(0, lambda: self._mark("ventana"))
+        self._run_task(self._load_in_background, self._on_loaded)
+
+    # ---------- carga / tareas ----------
+    def _mark(self, name):
+        self.startup[name] = (time.perf_counter() - _T_START) * 1000
+        if "ventana" in self.startup and "datos" in self.startup and STARTUP_TIMING:
+            print("Arranque: " + ", ".join(f"{k} {v:.0f} ms" for k, v in self.startup.items()))
+
+    def _load_header(self):
+        head = self.store.load_header()
+        if head is not None:
+            sections, self.current = head
+            # sólo nombres para los combos; los totales llegan con la carga completa
+            self.sections = sections
+            self._refresh_sections()
+            self._refresh_subs()
+            self._show_current()
+        self._mark("cabecera")
+
+    def _load_in_background(self, task):
+        sections, current, sessions = self.store.load()
+        task.check()
+        sessions = SessionList(sessions)
+        totals = TotalsAggregate(sections)
+        index = SessionIndex(sessions)
+        columns = None
+        if QUERY_ENGINE == "numpy":
+            from laboura.columnar import ColumnarEngine, np
+            if np is None:
+                print("WARN: LABOURA_ENGINE=numpy pero numpy no está instalado; se usa el motor python")
+            else:
+                columns = ColumnarEngine(sessions)
+        return totals, current, sessions, index, self.store.rollup, columns
+
+    def _on_loaded(self, result):
+        (self.totals, self.current, self.sessions,
+         self.index, self.rollup, self.columns) = result
+        if VERIFY_TOTALS:
+            self.totals.verify = self._full_totals
+        self.sections = self.totals.sections
+        self._loaded = True
+        sec, sub = self.cmb_section.currentText(), self.cmb_sub.currentText()
+        self._refresh_sections(select=sec)
+        self._refresh_subs(select=sub)
+        self._show_current()
+        self._set_actions_enabled(True)
+        self.tabs.setTabEnabled(self.tabs.indexOf(self.history_tab), True)
         self._rebuild_tree()
         self._refresh_history_filters()
         self.apply_history_filters()
+        self._watch_store()
+        self.poll_timer.start()
+        self._mark("datos")
+
+    def _watch_store(self):
+        # os.replace() y los borrados hacen que el watcher suelte el fichero:
+        # se vigila también la carpeta y se vuelven a añadir cuando reaparecen
+        paths = self.store.watch_paths()
+        want = {str(p) for p in paths if p.exists()}
+        want.add(str(paths[0].resolve().parent))
+        missing = want.difference(self.watcher.files(), self.watcher.directories())
+        if missing:
+            self.watcher.addPaths(sorted(missing))
+
+    def _on_store_touched(self, path):
+        self._watch_store()
+        if self._loaded:
+            self.watch_timer.start()
+
+    def _poll_changes(self):
+        if not self._loaded:
+            return
+        recs = self.store.poll_changes()
+        if recs is None:
+            # el registro de cambios ya no llega hasta nuestra foto: recarga
+            count("recargas completas")
+            self.poll_timer.stop()
+            self._loaded = False
+            self._set_actions_enabled(False)
+            self._run_task(self._load_in_background, self._on_loaded)
+            return
+        if not recs:
+            return
+        count("cambios externos aplicados", len(recs))
+        ops = {apply_change(rec, self.sessions, self.sections, self._mirror) for rec in recs}
+        if "current" in ops and not self._running:
+            # sesión en curso iniciada desde fuera (diario JSON)
+            self.current = [r for r in recs if r.get("op") == "current"][-1]["current"]
+            self._show_current()
+        if ops & {"rename_section", "rename_sub", "remap", "move", "add_section", "add_sub"}:
+            sec, sub = self.cmb_section.currentText(), self.cmb_sub.currentText()
+            self._refresh_sections(select=sec)
+            self._refresh_subs(select=sub)
+            self._refresh_history_filters()
+        self._rebuild_tree()
+        self.apply_history_filters()
+
+    def _full_totals(self):
+        # referencia del modo verificación: recálculo completo sobre las
+        # sesiones en memoria y las de los meses archivados (lento a propósito)
+        rows = list(self.sessions)
+        for _, _, part in self.store.read_months(self.store.archived_months()):
+            rows.extend(s for s in part if s.uid not in self.sessions)
+        return recalc_totals_from_sessions(rows)
+
+    def _set_actions_enabled(self, on):
+        # hasta tener la carga completa no se puede escribir en el almacén
+        for btn in (self.btn_add_section, self.btn_add_sub, self.btn_rename_section,
+                    self.btn_rename_sub, self.btn_remap, self.btn_export_totals):
+            btn.setEnabled(on)
+        self.btn_start.setEnabled(on and not self._running)
+        self.btn_stop.setEnabled(on and self._running)
+        if self._history_built:
+            for btn in (self.btn_edit, self.btn_delete, self.btn_move,
+                        self.btn_overlaps, self.btn_import):
+                btn.setEnabled(on)
+
+    def _show_current(self):
+        # refleja self.current (p. ej. una sesión que sigue en marcha)
+        cur = self.current
+        self._running = bool(cur and "start_ts" in cur)
+        self._t0 = float(cur["start_ts"]) if self._running else None
+        if self._running:
+            self._refresh_sections(select=cur["section"])
+            self._refresh_subs(select=cur["sub"])
+            self.ui_timer.start()
+            self._update_label()
+        else:
+            self.ui_timer.stop()
+            self.elapsed_label.setText("00:00:00")
+        self.btn_start.setEnabled(self._loaded and not self._running)
+        self.btn_stop.setEnabled(self._loaded and self._running)
+
+    def _on_tab_changed(self, i):
+        if self.diag_tab is not None:
+            if self.tabs.widget(i) is self.diag_tab:
+                self._refresh_diag()
+                self.diag_timer.start()
+            else:
+                self.diag_timer.stop()
+        if self.tabs.widget(i) is self.history_tab and not self._history_built:
+            self._build_history_tab(self.history_tab)
+            self._history_built = True
+            self._refresh_history_filters()
+            self.apply_history_filters()
+
+    def _mirror(self, op, *args):
+        # aplica la misma mutación a todas las estructuras derivadas
+        for m in (self.index, self.rollup, self.totals, self.columns):
+            if m is not None:
+                getattr(m, op)(*args)
+
+    def _run_task(self, fn, on_done, on_error=None):
+        # los slots son métodos de la ventana para que Qt los ejecute en su hilo
+        task = BackgroundTask(fn, on_done, on_error or self._on_task_error)
+        task.signals.done.connect(self._on_task_done)
+        task.signals.failed.connect(self._on_task_failed)
+        task.signals.progress.connect(self._on_task_progress)
+        task.signals.finished.connect(self._task_finished)
+        self._tasks.add(task)
+        # indeterminada hasta que la tarea informe de su progreso
+        self.progress.setRange(0, 0)
+        self.progress.show()
+        self.pool.start(task)
+        return task
+
+    def _on_task_progress(self, pct):
+        if self.progress.maximum() == 0:
+            self.progress.setRange(0, 100)
+        self.progress.setValue(pct)
+
+    def _on_task_done(self, task, result):
+        task.on_done(result)
+
+    def _on_task_failed(self, task, msg):
+        task.on_error(msg)
+
+    def _task_finished(self, task):
+        self._tasks.discard(task)
+        if not self._tasks:
+            self.progress.hide()
+
+    def _on_task_error(self, msg):
+        QMessageBox.critical(self, "Error", msg)
 
     # ---------- pestaña Timer ----------
     def _build_timer_tab(self, tab: QWidget):
@@ -235,6 +650,7 @@ class SectionTimerApp(QWidget):
         self.btn_add_sub = QPushButton("+ Subdivisión")
         self.btn_rename_section = QPushButton("Renombrar sección")
         self.btn_rename_sub = QPushButton("Renombrar subdivisión")
+        self.btn_remap = QPushButton("Reagrupar…")
 
         sel_row.addWidget(self.cmb_section)
         sel_row.addWidget(self.btn_add_section)
@@ -242,6 +658,7 @@ class SectionTimerApp(QWidget):
         sel_row.addWidget(self.cmb_sub)
         sel_row.addWidget(self.btn_add_sub)
         sel_row.addWidget(self.btn_rename_sub)
+        sel_row.addWidget(self.btn_remap)
 
         self.elapsed_label = QLabel("00:00:00", alignment=Qt.AlignCenter)
         ctrl_row = QHBoxLayout()
@@ -266,6 +683,7 @@ class SectionTimerApp(QWidget):
         self.btn_add_sub.clicked.connect(self.add_sub)
         self.btn_rename_section.clicked.connect(self.rename_section)
         self.btn_rename_sub.clicked.connect(self.rename_sub)
+        self.btn_remap.clicked.connect(self.remap_sections)
         self.cmb_section.currentIndexChanged.connect(self._on_section_change)
         self.btn_start.clicked.connect(self.start)
         self.btn_stop.clicked.connect(self.stop)
@@ -294,6 +712,7 @@ class SectionTimerApp(QWidget):
         self.btn_apply_filters = QPushButton("Aplicar filtros")
         self.btn_clear_filters = QPushButton("Limpiar")
         self.btn_export_sessions = QPushButton("Export Sessions CSV")
+        self.btn_export_summary = QPushButton("Export Summary CSV")
 
         filt2.addWidget(QLabel("Desde:")); filt2.addWidget(self.date_from)
         filt2.addWidget(QLabel("Hasta:")); filt2.addWidget(self.date_to)
@@ -304,32 +723,29 @@ class SectionTimerApp(QWidget):
         filt2.addWidget(self.btn_apply_filters)
         filt2.addWidget(self.btn_clear_filters)
         filt2.addWidget(self.btn_export_sessions)
+        filt2.addWidget(self.btn_export_summary)
 
         # acciones
         actions = QHBoxLayout()
         self.btn_edit = QPushButton("Editar sesión")
         self.btn_delete = QPushButton("Borrar seleccionadas")
+        self.btn_move = QPushButton("Mover a…")
+        self.btn_overlaps = QPushButton("Solapes…")
+        self.btn_import = QPushButton("Importar…")
         actions.addWidget(self.btn_edit)
+        actions.addWidget(self.btn_move)
         actions.addWidget(self.btn_delete)
         actions.addStretch(1)
+        actions.addWidget(self.btn_overlaps)
+        actions.addWidget(self.btn_import)
 
         # tablas: sesiones (6 cols) + resumen (4 cols)
-        self.tbl_sessions = QTableWidget(0, 6)
-        self.tbl_sessions.setHorizontalHeaderLabels(
-            ["ID", "Sección", "Subdivisión", "Inicio", "Fin", "HH:MM:SS"]
-        )
-        self.tbl_sessions.setSortingEnabled(True)
-        self.tbl_sessions.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-        self.tbl_sessions.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.sessions_model = SessionTableModel(self)
+        self.tbl_sessions = self._make_table(self.sessions_model)
         self.tbl_sessions.setColumnHidden(0, True)
 
-        self.tbl_summary = QTableWidget(0, 4)
-        self.tbl_summary.setHorizontalHeaderLabels(
-            ["Periodo", "Sección", "Subdivisión", "HH:MM:SS"]
-        )
-        self.tbl_summary.setSortingEnabled(True)
-        self.tbl_summary.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-        self.tbl_summary.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.summary_model = SummaryTableModel(self)
+        self.tbl_summary = self._make_table(self.summary_model)
         self.tbl_summary.hide()
 
         layout.addLayout(filt1)
@@ -342,12 +758,102 @@ class SectionTimerApp(QWidget):
         self.btn_apply_filters.clicked.connect(self.apply_history_filters)
         self.btn_clear_filters.clicked.connect(self.clear_history_filters)
         self.btn_export_sessions.clicked.connect(self.export_sessions_csv)
+        self.btn_export_summary.clicked.connect(self.export_summary_csv)
         self.btn_edit.clicked.connect(self.edit_selected_session)
         self.btn_delete.clicked.connect(self.delete_selected_sessions)
+        self.btn_move.clicked.connect(self.move_selected_sessions)
+        self.btn_overlaps.clicked.connect(self.check_overlaps)
+        self.btn_import.clicked.connect(self.import_sessions)
+        for btn in (self.btn_edit, self.btn_delete, self.btn_move,
+                    self.btn_overlaps, self.btn_import):
+            btn.setEnabled(self._loaded)  # la pestaña puede abrirse durante una recarga
         self.cmb_group.currentIndexChanged.connect(self.apply_history_filters)
         self.chk_merge.stateChanged.connect(self.apply_history_filters)
 
+    def _make_table(self, model):
+        view = QTableView()
+        view.setModel(model)
+        view.setSortingEnabled(True)
+        view.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        view.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        # filas de alto fijo: la vista sólo pide datos de las filas visibles
+        vh = view.verticalHeader()
+        vh.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vh.setDefaultSectionSize(vh.fontMetrics().height() + 10)
+        # ajustar columnas midiendo una muestra y no todas las filas
+        view.horizontalHeader().setResizeContentsPrecision(200)
+        return view
+
+    # ---------- pestaña Diagnóstico ----------
+    def _build_diag_tab(self, tab: QWidget):
+        layout = QVBoxLayout(tab)
+        self.lbl_startup = QLabel()
+        self.lbl_counters = QLabel()
+        self.lbl_caches = QLabel()
+        self.lbl_caches.setWordWrap(True)
+        self.profile_model = ProfileTableModel(self)
+        self.tbl_profile = self._make_table(self.profile_model)
+        self.tbl_profile.sortByColumn(2, Qt.SortOrder.DescendingOrder)
+
+        actions = QHBoxLayout()
+        self.btn_diag_refresh = QPushButton("Actualizar")
+        self.btn_diag_reset = QPushButton("Reiniciar")
+        self.btn_cprofile = QPushButton()
+        actions.addWidget(self.btn_diag_refresh)
+        actions.addWidget(self.btn_diag_reset)
+        actions.addStretch(1)
+        actions.addWidget(self.btn_cprofile)
+
+        layout.addWidget(self.lbl_startup)
+        layout.addWidget(self.tbl_profile)
+        layout.addWidget(self.lbl_counters)
+        layout.addWidget(self.lbl_caches)
+        layout.addLayout(actions)
+
+        self.btn_diag_refresh.clicked.connect(self._refresh_diag)
+        self.btn_diag_reset.clicked.connect(self._reset_diag)
+        self.btn_cprofile.clicked.connect(self._toggle_cprofile)
+        # con la pestaña abierta se actualiza sola
+        self.diag_timer = QTimer(self)
+        self.diag_timer.setInterval(1000)
+        self.diag_timer.timeout.connect(self._refresh_diag)
+        self._refresh_diag()
+
+    def _refresh_diag(self):
+        startup = ", ".join(f"{k} {v:.0f} ms" for k, v in self.startup.items())
+        self.lbl_startup.setText(f"Arranque: {startup or '—'}")
+        self.profile_model.set_rows(PROFILER.rows())
+        self.tbl_profile.resizeColumnsToContents()
+        counters = ", ".join(f"{k}: {n}" for k, n in sorted(PROFILER.counters.items()))
+        self.lbl_counters.setText(counters)
+        self.lbl_counters.setVisible(bool(counters))
+        caches = ", ".join(
+            f"{name}: {size} entradas" + ("" if rate is None else f", {rate:.0f}% aciertos")
+            + f" ({misses} fallos)"
+            for name, hits, misses, rate, size, maxsize in PROFILER.cache_rows())
+        self.lbl_caches.setText(f"Cachés — {caches}")
+        self.btn_cprofile.setText(
+            "Guardar cProfile…" if PROFILER.cprofile_running else "Iniciar cProfile")
+
+    def _reset_diag(self):
+        PROFILER.reset()
+        self._refresh_diag()
+
+    def _toggle_cprofile(self):
+        # perfila el hilo de la interfaz; las tareas en segundo plano salen
+        # en la tabla de tiempos
+        if not PROFILER.cprofile_running:
+            PROFILER.start_cprofile()
+        else:
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Guardar cProfile", CPROFILE_FILE or "laboura.prof",
+                "cProfile (*.prof);;All Files (*)")
+            if path:
+                PROFILER.stop_cprofile(path)
+        self._refresh_diag()
+
     # ---------- helpers UI ----------
+    @timed("_rebuild_tree")
     def _rebuild_tree(self):
         self.tree.clear()
         for sec in sorted(self.sections.keys()):
@@ -380,6 +886,8 @@ class SectionTimerApp(QWidget):
                 self.cmb_sub.setCurrentIndex(idx)
 
     def _refresh_history_filters(self):
+        if not self._history_built:
+            return
         self.cmb_hist_section.blockSignals(True)
         self.cmb_hist_section.clear()
         self.cmb_hist_section.addItem("Todas")
@@ -409,7 +917,7 @@ class SectionTimerApp(QWidget):
                 QMessageBox.information(self, "Info", "Esa sección ya existe.")
             else:
                 _ = self.sections[name]
-                save_data(self.sections, self.current, self.sessions)
+                self.store.add_section(name)
                 self._refresh_sections(select=name)
                 self._refresh_subs()
                 self._rebuild_tree()
@@ -427,7 +935,7 @@ class SectionTimerApp(QWidget):
                 QMessageBox.information(self, "Info", "Ya existe esa subdivisión.")
             else:
                 self.sections[sec][name] = 0
-                save_data(self.sections, self.current, self.sessions)
+                self.store.add_sub(sec, name)
                 self._refresh_subs(select=name)
                 self._rebuild_tree()
                 self._refresh_history_filters()
@@ -444,7 +952,7 @@ class SectionTimerApp(QWidget):
         self._running = True
         self._t0 = time.time()
         self.current = {"section": sec, "sub": sub, "start_ts": self._t0}
-        save_data(self.sections, self.current, self.sessions)
+        self.store.set_current(self.current)
         self.btn_start.setEnabled(False)
         self.btn_stop.setEnabled(True)
         self.ui_timer.start()
@@ -455,23 +963,19 @@ class SectionTimerApp(QWidget):
         self._running = False
         self.ui_timer.stop()
         t1 = time.time()
-        elapsed = int(t1 - self._t0)
         sec = self.current["section"]
         sub = self.current["sub"]
-        self.sessions.append({
-            "id": str(uuid.uuid4()),
-            "section": sec, "sub": sub,
-            "start_ts": float(self._t0), "end_ts": float(t1),
-            "start_iso": ts_to_iso(self._t0), "end_iso": ts_to_iso(t1),
-            "seconds": elapsed
-        })
-        self.sections = recalc_totals_from_sessions(self.sessions)
+        session = Session.new(sec, sub, self._t0, t1, self.store.user)
+        self.sessions.append(session)
+        self._mirror("add", session)
+        self.store.add_session(session)
         self._t0 = None
         self.current = None
         self.elapsed_label.setText("00:00:00")
         self.btn_start.setEnabled(True)
         self.btn_stop.setEnabled(False)
-        save_data(self.sections, self.current, self.sessions)
+        # escribe ya la sesión y todo lo pendiente (no espera a FLUSH_MS)
+        self.store.set_current(None)
         self._rebuild_tree()
         if self.tabs.currentWidget() is self.history_tab:
             self.apply_history_filters()
@@ -483,6 +987,20 @@ class SectionTimerApp(QWidget):
     def _on_section_change(self):
         self._refresh_subs()
 
+    def closeEvent(self, event):
+        for task in list(self._tasks):
+            if task is self._filter_task:
+                task.cancel()
+        self.pool.waitForDone()
+        self._loaded = False  # avisos pendientes del watcher ya no leen el almacén
+        self.watch_timer.stop()
+        self.poll_timer.stop()
+        self.store.close()
+        if CPROFILE_FILE and PROFILER.cprofile_running:
+            PROFILER.stop_cprofile(CPROFILE_FILE)
+            print(f"cProfile: {CPROFILE_FILE}")
+        super().closeEvent(event)
+
     # ---------- renombrar ----------
     def rename_section(self):
         old = self.cmb_section.currentText()
@@ -493,11 +1011,14 @@ class SectionTimerApp(QWidget):
         new = (new or "").strip()
         if not ok or not new or new == old:
             return
-        for s in self.sessions:
-            if s["section"] == old:
-                s["section"] = new
-        self.sections = recalc_totals_from_sessions(self.sessions)
-        save_data(self.sections, self.current, self.sessions)
+        if self.store.SHARED:
+            # base compartida: se aplica en orden de commit con el resto
+            self.store.rename_section(old, new)
+            self._poll_changes()
+        else:
+            with self.totals.deferred_check():
+                self._mirror("rename_section", old, new)
+                self.store.rename_section(old, new)
         self._refresh_sections(select=new)
         self._refresh_subs()
         self._rebuild_tree()
@@ -515,17 +1036,45 @@ class SectionTimerApp(QWidget):
         sub_new = (sub_new or "").strip()
         if not ok or not sub_new or sub_new == sub_old:
             return
-        for s in self.sessions:
-            if s["section"] == sec and s["sub"] == sub_old:
-                s["sub"] = sub_new
-        self.sections = recalc_totals_from_sessions(self.sessions)
-        save_data(self.sections, self.current, self.sessions)
+        if self.store.SHARED:
+            self.store.rename_sub(sec, sub_old, sub_new)
+            self._poll_changes()
+        else:
+            with self.totals.deferred_check():
+                self._mirror("rename_sub", sec, sub_old, sub_new)
+                self.store.rename_sub(sec, sub_old, sub_new)
         self._refresh_subs(select=sub_new)
         self._rebuild_tree()
         self._refresh_history_filters()
         self.apply_history_filters()
         QMessageBox.information(self, "Renombrar subdivisión", f"Subdivisión renombrada a '{sub_new}'.")
 
+    def remap_sections(self):
+        dlg = RemapDialog(self, self.sections)
+        if dlg.exec() != QDialog.Accepted:
+            return
+        pairs = dlg.get_pairs()
+        if not pairs:
+            return
+        mapping = remap_mapping(pairs)
+        sec, sub = self.cmb_section.currentText(), self.cmb_sub.currentText()
+        sec, sub = remap_key(mapping, (sec, sub)) or (sec, sub)
+        if self.store.SHARED:
+            # como los renombrados: primero la base, luego en orden de commit
+            self.store.remap(pairs)
+            self._poll_changes()
+        else:
+            # índice, cubo, totales y columnas se re-clavean sólo donde cambia algo
+            with self.totals.deferred_check():
+                self._mirror("remap", mapping)
+                self.store.remap(pairs)
+            self._rebuild_tree()
+            self._refresh_history_filters()
+            self.apply_history_filters()
+        self._refresh_sections(select=sec)
+        self._refresh_subs(select=sub)
+        QMessageBox.information(self, "Reagrupar", f"{len(pairs)} subdivisión(es) reagrupada(s).")
+
     # ---------- filtros histórico / agrupación ----------
     def _collect_filters(self):
         sec = self.cmb_hist_section.currentText()
@@ -534,104 +1083,162 @@ class SectionTimerApp(QWidget):
         dto = self.date_to.date()
         start_ts = datetime.combine(date(dfrom.year(), dfrom.month(), dfrom.day()), dtime.min).timestamp()
         end_ts = datetime.combine(date(dto.year(), dto.month(), dto.day()), dtime.max).timestamp()
+        sec = None if sec == "Todas" else sec
+        sub = None if sub == "Todas" else sub
         return sec, sub, start_ts, end_ts
 
+    def _summary_fn(self, mode, filters, merge_subs, columns=None):
+        # función de worker que agrupa con el motor activo. Lee una copia
+        # hecha aquí: _mirror() sigue modificando el original mientras tanto
+        sec_filter, sub_filter, start_ts, end_ts = filters
+        if columns is None and self.columns is not None:
+            columns = self.columns.snapshot()
+        rollup = self.rollup.snapshot() if columns is None else None
+
+        def summarize(task):
+            if columns is not None:
+                return columns.summarize(
+                    mode, sec_filter, sub_filter, start_ts, end_ts, merge_subs, task)
+            # el rango de fechas del filtro cae justo en límites de día
+            return rollup.summarize(
+                mode, sec_filter, sub_filter, day_of(start_ts), day_of(end_ts),
+                merge_subs, task,
+            )
+        return summarize
+
     def apply_history_filters(self):
-        self.filtered_sessions = []
-        sec_filter, sub_filter, start_ts, end_ts = self._collect_filters()
-        for s in self.sessions:
-            cond_sec = (sec_filter == "Todas") or (s["section"] == sec_filter)
-            cond_sub = (sub_filter == "Todas") or (s["sub"] == sub_filter)
-            in_range = (s["start_ts"] >= start_ts) and (s["start_ts"] <= end_ts)
-            if cond_sec and cond_sub and in_range:
-                self.filtered_sessions.append(s)
+        if not self._loaded or not self._history_built:
+            return
+        filters = self._collect_filters()
+        months = self.store.archived_months(filters[2], filters[3])
+        if months:
+            # meses archivados del rango: se cargan y se vuelve a filtrar
+            if not self._reading_months:
+                self._reading_months = True
+                store = self.store
+                self._run_task(lambda task: store.read_months(months), self._on_months_read,
+                               self._on_months_failed)
+            return
+        mode = self.cmb_group.currentText()
+        # el hilo consulta copias: los originales cambian con cada _mirror()
+        columns = self.columns.snapshot() if self.columns is not None else None
+        query = columns.query if columns is not None else self.index.snapshot().query
+        summarize = None
+        if mode != "Sin agrupar":
+            summarize = self._summary_fn(mode, filters, self.chk_merge.isChecked(), columns)
+
+        def work(task):
+            with span("histórico: filtro + resumen (hilo)"):
+                rows = query(*filters)
+                task.check()
+                return rows, summarize(task) if summarize is not None else None
+
+        # una petición nueva sustituye a la pendiente
+        if self._filter_task is not None:
+            self._filter_task.cancel()
+        task = self._filter_task = self._run_task(
+            work, lambda result: self._on_filtered(task, result)
+        )
+        task.t0 = time.perf_counter()
+
+    def _on_months_failed(self, msg):
+        self._reading_months = False
+        self._on_task_error(msg)
+
+    def _on_months_read(self, parts):
+        self._reading_months = False
+        self._adopt_months(parts)
+        self.apply_history_filters()
+
+    def _adopt_months(self, parts):
+        new = self.store.adopt_months(parts, self.sessions.get)
+        for s in new:
+            self.sessions.append(s)
+        # sólo las vistas de sesiones: totales y cubo ya cuentan lo archivado
+        self.index.add_many(new)
+        if self.columns is not None:
+            for s in new:
+                self.columns.add(s)
+
+    def _on_filtered(self, task, result):
+        if task is not self._filter_task:
+            return
+        self._filter_task = None
+        self.filtered_sessions, summary = result
         self._fill_history_table(self.filtered_sessions)
-        self._maybe_fill_summary(self.filtered_sessions)
+        self._maybe_fill_summary(summary)
+        if PROFILING:
+            # de la llamada (clic, combo) a las tablas rellenas
+            PROFILER.record("apply_history_filters", time.perf_counter() - task.t0)
 
     def clear_history_filters(self):
         self._refresh_history_filters()
         self.apply_history_filters()
 
+    @timed("_fill_history_table")
     def _fill_history_table(self, sessions):
-        self.tbl_sessions.setRowCount(0)
-        self.tbl_sessions.setSortingEnabled(False)
-        for s in sessions:
-            row = self.tbl_sessions.rowCount()
-            self.tbl_sessions.insertRow(row)
-            secs = int(s["seconds"])
-            vals = [
-                s["id"],
-                s["section"],
-                s["sub"],
-                s.get("start_iso") or ts_to_iso(s["start_ts"]),
-                s.get("end_iso") or ts_to_iso(s["end_ts"]),
-                fmt_hms(secs)
-            ]
-            for col, v in enumerate(vals):
-                item = QTableWidgetItem(v)
-                # Orden correcto por HH:MM:SS usando segundos como clave oculta
-                if col == 5:
-                    item.setData(Qt.ItemDataRole.UserRole, secs)
-                self.tbl_sessions.setItem(row, col, item)
-        self.tbl_sessions.setSortingEnabled(True)
+        self.sessions_model.set_rows(sessions)
         self.tbl_sessions.resizeColumnsToContents()
 
-    def _period_key(self, ts: float, mode: str) -> str:
-        dt = datetime.fromtimestamp(ts)
-        if mode == "Día":
-            return dt.strftime("%Y-%m-%d")
-        if mode == "Semana":
-            iso = dt.isocalendar()
-            return f"{iso.year}-W{iso.week:02d}"
-        if mode == "Mes":
-            return dt.strftime("%Y-%m")
-        return ""
-
-    def _maybe_fill_summary(self, sessions):
-        mode = self.cmb_group.currentText()
-        if mode == "Sin agrupar":
+    @timed("_maybe_fill_summary")
+    def _maybe_fill_summary(self, rows):
+        if rows is None:
             self.tbl_summary.hide()
             return
-
-        merge_subs = self.chk_merge.isChecked()
-        agg = defaultdict(int)
-        for s in sessions:
-            period = self._period_key(s["start_ts"], mode)
-            key = (period, s["section"], "(Todas)" if merge_subs else s["sub"])
-            agg[key] += int(s["seconds"])
-
-        self.tbl_summary.setRowCount(0)
-        self.tbl_summary.setSortingEnabled(False)
-        for (period, sec, sub), secs in sorted(agg.items()):
-            row = self.tbl_summary.rowCount()
-            self.tbl_summary.insertRow(row)
-            secs = int(secs)
-            vals = [period, sec, sub, fmt_hms(secs)]
-            for col, v in enumerate(vals):
-                item = QTableWidgetItem(v)
-                # ordenar por HH:MM:SS usando segundos como clave oculta
-                if col == 3:
-                    item.setData(Qt.ItemDataRole.UserRole, secs)
-                self.tbl_summary.setItem(row, col, item)
-        self.tbl_summary.setSortingEnabled(True)
+        self.summary_model.set_rows(rows)
         self.tbl_summary.resizeColumnsToContents()
         self.tbl_summary.show()
 
+    # ---------- importar ----------
+    def import_sessions(self):
+        if not self._loaded:
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Importar sesiones", "",
+            "Registros (*.csv *.csv.gz *.jsonl *.json *.json.gz);;All Files (*)")
+        if not path:
+            return
+        # leer y descartar repetidas en segundo plano; aplicar, aquí y de una vez
+        store, index = self.store, self.index.snapshot()
+        self._run_task(
+            lambda task: read_import(path, store, task=task, index=index),
+            self._on_import_read,
+            lambda msg: QMessageBox.critical(self, "Importar", f"No se puede importar:\n{msg}"),
+        )
+
+    def _on_import_read(self, result):
+        new = result.sessions
+        if new:
+            self.sessions.extend(new)
+            self._mirror("add_many", new)
+            self.store.import_sessions(new)
+            sec, sub = self.cmb_section.currentText(), self.cmb_sub.currentText()
+            self._refresh_sections(select=sec)
+            self._refresh_subs(select=sub)
+            self._refresh_history_filters()
+            self._rebuild_tree()
+            self.apply_history_filters()
+        msg = result.summary()
+        if result.errors:
+            msg += "\n\n" + "\n".join(f"Fila {row}: {err}" for row, err in result.errors[:5])
+        QMessageBox.information(self, "Importar", msg)
+
     # ---------- editar / borrar sesiones ----------
-    def _get_selected_session_ids(self):
-        ids = []
+    def _get_selected_session_uids(self):
+        uids = []
         for idx in self.tbl_sessions.selectionModel().selectedRows():
-            sid = self.tbl_sessions.item(idx.row(), 0).text()
-            ids.append(sid)
-        return ids
+            uids.append(self.sessions_model.row_at(idx.row()).uid)
+        return uids
 
     def edit_selected_session(self):
-        ids = self._get_selected_session_ids()
-        if len(ids) != 1:
+        if not self._loaded:
+            return
+        uids = self._get_selected_session_uids()
+        if len(uids) != 1:
             QMessageBox.information(self, "Editar sesión", "Selecciona exactamente una fila.")
             return
-        sid = ids[0]
-        sess = next((s for s in self.sessions if s["id"] == sid), None)
+        uid = uids[0]
+        sess = self.sessions.get(uid)
         if not sess:
             QMessageBox.warning(self, "Editar sesión", "No se encontró la sesión.")
             return
@@ -640,88 +1247,219 @@ class SectionTimerApp(QWidget):
             updated = dlg.get_result()
             if not updated:
                 return
-            for i, s in enumerate(self.sessions):
-                if s["id"] == sid:
-                    self.sessions[i] = updated
-                    break
-            self.sections = recalc_totals_from_sessions(self.sessions)
-            save_data(self.sections, self.current, self.sessions)
+            clash = self._overlapping(updated)
+            if clash:
+                other = clash[0]
+                ans = QMessageBox.question(
+                    self, "Editar sesión",
+                    f"La sesión se solapa con {len(clash)} sesión(es), p. ej. "
+                    f"{other.section} / {other.sub} ({other.start_iso} – {other.end_iso}).\n"
+                    "¿Guardarla igualmente?",
+                    QMessageBox.Yes | QMessageBox.No,
+                )
+                if ans != QMessageBox.Yes:
+                    return
+            self.sessions.replace(updated)
+            self._mirror("replace", sess, updated)
+            self.store.update_session(updated)
             self._rebuild_tree()
             self.apply_history_filters()
             QMessageBox.information(self, "Editar sesión", "Sesión actualizada.")
 
+    def _overlapping(self, s):
+        # meses archivados del intervalo: se cargan antes (son segmentos
+        # pequeños) para que la comprobación vea todas las sesiones
+        months = self.store.archived_months(s.start_ts, s.end_ts)
+        if months:
+            self._adopt_months(self.store.read_months(months))
+        return self.index.overlapping(s.start_ts, s.end_ts, s.user, skip=s.uid)
+
+    # ---------- solapes ----------
+    def check_overlaps(self):
+        if not self._loaded:
+            return
+        # todo el histórico: primero los meses archivados, luego el barrido
+        months = self.store.archived_months()
+        if months:
+            store = self.store
+            self._run_task(lambda task: store.read_months(months), self._on_overlap_months)
+        else:
+            self._find_overlaps()
+
+    def _on_overlap_months(self, parts):
+        self._adopt_months(parts)
+        self._find_overlaps()
+
+    def _find_overlaps(self):
+        snapshot = list(self.sessions)
+
+        def work(task):
+            found = find_overlaps(snapshot)
+            task.check()
+            return found, resolve_overlaps(snapshot) if found else ([], [])
+        self._run_task(work, lambda result: self._on_overlaps(snapshot, *result))
+
+    def _on_overlaps(self, snapshot, found, fix):
+        if not found:
+            QMessageBox.information(self, "Solapes", "No hay sesiones que se solapen.")
+            return
+        lines = [f"{a.start_iso} – {a.end_iso}  {a.section} / {a.sub}\n"
+                 f"{b.start_iso} – {b.end_iso}  {b.section} / {b.sub}  ({fmt_hms(secs)})"
+                 for a, b, secs in found[:OVERLAP_LIST_MAX]]
+        if len(found) > OVERLAP_LIST_MAX:
+            lines.append(f"… y {len(found) - OVERLAP_LIST_MAX} más")
+        changed, deleted = fix
+        box = QMessageBox(self)
+        box.setWindowTitle("Solapes")
+        box.setText(f"{len(found)} pareja(s) de sesiones se solapan.\n"
+                    f"Recortar/fusionar modifica {len(changed)} sesión(es) y borra {len(deleted)}: "
+                    "las de la misma sección/subdivisión se funden, el resto se recorta "
+                    "al fin de la anterior.")
+        box.setDetailedText("\n\n".join(lines))
+        btn_fix = box.addButton("Recortar/fusionar", QMessageBox.AcceptRole)
+        box.addButton(QMessageBox.Close)
+        box.exec()
+        if box.clickedButton() is not btn_fix:
+            return
+        # si algo ha cambiado mientras tanto (otro proceso, una edición) se repite
+        before = {s.uid: s for s in snapshot}
+        touched = [s.uid for s in changed] + deleted
+        if any(self.sessions.get(u) is not before[u] for u in touched):
+            QMessageBox.warning(self, "Solapes", "Las sesiones han cambiado; vuelve a comprobar.")
+            return
+        if changed:
+            old = self.sessions.replace_many(changed)
+            self._mirror("replace_many", old, changed)
+            self.store.update_sessions(changed)
+        if deleted:
+            removed = self.sessions.remove_many(deleted)
+            self._mirror("remove_many", removed)
+            self.store.delete_sessions([s.id for s in removed])
+        self._rebuild_tree()
+        self.apply_history_filters()
+        QMessageBox.information(
+            self, "Solapes", f"{len(changed)} sesión(es) ajustada(s), {len(deleted)} borrada(s).")
+
+    def move_selected_sessions(self):
+        if not self._loaded:
+            return
+        uids = self._get_selected_session_uids()
+        if not uids:
+            QMessageBox.information(self, "Mover sesiones", "Selecciona una o más filas.")
+            return
+        sec, ok = QInputDialog.getItem(
+            self, "Mover sesiones", f"Sección de destino para {len(uids)} sesión(es):",
+            sorted(self.sections), 0, True)
+        sec = (sec or "").strip()
+        if not ok or not sec:
+            return
+        sub, ok = QInputDialog.getItem(
+            self, "Mover sesiones", f"Subdivisión de destino en '{sec}':",
+            sorted(self.sections.get(sec, ())), 0, True)
+        sub = (sub or "").strip()
+        if not ok or not sub:
+            return
+        old = [s for s in map(self.sessions.get, uids)
+               if s is not None and (s.section, s.sub) != (sec, sub)]
+        if old:
+            new = [s.moved(sec, sub) for s in old]
+            self.sessions.replace_many(new)
+            self._mirror("replace_many", old, new)
+            self.store.move_sessions([s.id for s in old], sec, sub)
+            self._refresh_sections(select=self.cmb_section.currentText())
+            self._refresh_subs(select=self.cmb_sub.currentText())
+            self._refresh_history_filters()
+            self._rebuild_tree()
+            self.apply_history_filters()
+        QMessageBox.information(self, "Mover sesiones", f"{len(old)} sesión(es) movida(s) a '{sec} / {sub}'.")
+
     def delete_selected_sessions(self):
-        ids = self._get_selected_session_ids()
-        if not ids:
+        if not self._loaded:
+            return
+        uids = self._get_selected_session_uids()
+        if not uids:
             QMessageBox.information(self, "Borrar sesiones", "Selecciona una o más filas.")
             return
         ans = QMessageBox.question(
             self, "Borrar sesiones",
-            f"¿Seguro que quieres borrar {len(ids)} sesión(es)?",
+            f"¿Seguro que quieres borrar {len(uids)} sesión(es)?",
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No
         )
         if ans != QMessageBox.Yes:
             return
-        self.sessions = [s for s in self.sessions if s["id"] not in ids]
-        self.sections = recalc_totals_from_sessions(self.sessions)
-        save_data(self.sections, self.current, self.sessions)
+        removed = self.sessions.remove_many(uids)
+        self._mirror("remove_many", removed)
+        self.store.delete_sessions([s.id for s in removed])
         self._rebuild_tree()
         self.apply_history_filters()
         QMessageBox.information(self, "Borrar sesiones", "Sesión(es) eliminada(s).")
 
     # ---------- CSV ----------
+    def _ask_csv_path(self, title, default):
+        path, selected = QFileDialog.getSaveFileName(
+            self, title, default, "CSV Files (*.csv);;CSV gzip (*.csv.gz);;All Files (*)"
+        )
+        if path and selected.startswith("CSV gzip") and not path.endswith(".gz"):
+            path += ".gz"
+        return path
+
     def export_totals_csv(self):
         if not self.sections:
             QMessageBox.information(self, "Export CSV", "No hay datos para exportar.")
             return
-        path, _ = QFileDialog.getSaveFileName(
-            self, "Guardar Totals CSV", "times_totals.csv", "CSV Files (*.csv);;All Files (*)"
-        )
+        path = self._ask_csv_path("Guardar Totals CSV", "times_totals.csv")
         if not path:
             return
-        try:
-            total_all = 0
-            with open(path, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                w.writerow(["Section", "Subdivision", "Seconds", "HH:MM:SS"])
-                for sec in sorted(self.sections.keys()):
-                    for sub, secs in sorted(self.sections[sec].items()):
-                        secs = int(secs)
-                        w.writerow([sec, sub, secs, fmt_hms(secs)])
-                        total_all += secs
-                w.writerow([])
-                w.writerow(["TOTAL", "", total_all, fmt_hms(total_all)])
-            QMessageBox.information(self, "Export CSV", f"Exportado:\n{path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Export CSV", f"Error exportando:\n{e}")
+        sections = {sec: dict(subs) for sec, subs in self.sections.items()}
+        self._run_export(lambda task: write_totals_csv(path, sections, task), path)
 
     def export_sessions_csv(self):
-        rows = self.tbl_sessions.rowCount()
-        if rows == 0:
-            QMessageBox.information(self, "Export CSV", "No hay sesiones en la tabla para exportar.")
+        # se lee del almacén con los filtros actuales, no de la tabla
+        if not self._loaded or not len(self.sessions):
+            QMessageBox.information(self, "Export CSV", "No hay sesiones para exportar.")
             return
-        path, _ = QFileDialog.getSaveFileName(
-            self, "Guardar Sessions CSV", "times_sessions.csv", "CSV Files (*.csv);;All Files (*)"
+        path = self._ask_csv_path("Guardar Sessions CSV", "times_sessions.csv")
+        if not path:
+            return
+        filters = self._collect_filters()
+        store = self.store
+        total = len(self.filtered_sessions)
+        self._run_export(
+            lambda task: write_sessions_csv(path, store.iter_sessions(*filters), task, total),
+            path,
         )
+
+    def export_summary_csv(self):
+        # resumen agrupado (cubo por días); "Sin agrupar" exporta por día
+        if not self._loaded or not len(self.sessions):
+            QMessageBox.information(self, "Export CSV", "No hay sesiones para exportar.")
+            return
+        path = self._ask_csv_path("Guardar Summary CSV", "times_summary.csv")
         if not path:
             return
-        try:
-            with open(path, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                # Notar que aquí exportamos SIN “Seconds”
-                w.writerow(["ID", "Section", "Subdivision", "Start", "End", "HH:MM:SS"])
-                for r in range(rows):
-                    w.writerow([self.tbl_sessions.item(r, c).text() for c in range(6)])
-            QMessageBox.information(self, "Export CSV", f"Exportado:\n{path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Export CSV", f"Error exportando:\n{e}")
+        mode = self.cmb_group.currentText()
+        if mode == "Sin agrupar":
+            mode = "Día"
+        summarize = self._summary_fn(mode, self._collect_filters(), self.chk_merge.isChecked())
+        self._run_export(lambda task: write_rollup_csv(path, summarize(task), task), path)
+
+    def _run_export(self, fn, path):
+        self._run_task(
+            fn,
+            lambda _: QMessageBox.information(self, "Export CSV", f"Exportado:\n{path}"),
+            lambda msg: QMessageBox.critical(self, "Export CSV", f"Error exportando:\n{msg}"),
+        )
 
 
 # ============== run ==============
 if __name__ == "__main__":
+    if CPROFILE_FILE:
+        PROFILER.start_cprofile()
     app = QApplication(sys.argv)
     apply_theme(app, dark=True)
     w = SectionTimerApp()
     w.resize(1020, 640)
     w.show()
+    # salidas sin closeEvent (cierre de sesión del sistema...)
+    app.aboutToQuit.connect(w.store.flush)
     sys.exit(app.exec())
@@ -0,0 +1,19 @@
+# Núcleo de Laboura Time sin dependencias de Qt (la GUI es LabouraTime.py).
+from .core import (
+    Session, SessionList, TotalsAggregate, SessionIndex, DayRollup,
+    open_store, load_data, save_data,
+    read_payload, recalc_totals_from_sessions, filter_sessions, period_key, summarize_sessions,
+    write_totals_csv, write_sessions_csv, write_rollup_csv, remap_mapping,
+    find_overlaps, resolve_overlaps,
+)
+from .archive import MonthArchive
+from .store_json import JournalStore, convert_data
+from .store_sqlite import SqliteStore
+
+__all__ = [
+    "Session", "SessionList", "TotalsAggregate", "SessionIndex", "DayRollup",
+    "JournalStore", "SqliteStore", "MonthArchive", "open_store", "load_data", "save_data",
+    "read_payload", "convert_data", "recalc_totals_from_sessions", "filter_sessions", "period_key", "summarize_sessions",
+    "write_totals_csv", "write_sessions_csv", "write_rollup_csv", "remap_mapping",
+    "find_overlaps", "resolve_overlaps",
+]
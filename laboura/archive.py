@@ -0,0 +1,280 @@
+# laboura/archive.py
+# Histórico archivado: los meses cerrados salen de data.json a un segmento
+# comprimido por mes, con un manifiesto de totales y renombrados pendientes.
+import sys, os, time, json, gzip, threading
+from datetime import datetime, date
+from pathlib import Path
+from collections import defaultdict
+from operator import attrgetter
+
+from . import formats
+from .core import (
+    Session, day_of, day_period, recalc_totals_from_sessions, remap_mapping, remap_key,
+    remap_sessions, _write_atomic,
+)
+from .profiling import timed
+
+
+# ============== histórico archivado por meses ==============
+def month_of(ts):
+    return day_period(day_of(ts), "Mes")
+
+
+def _sessions_sig(sessions):
+    # huella del contenido de un mes (válida dentro del mismo proceso)
+    return len(sessions), sum(hash(s.astuple()) for s in sessions)
+
+
+def _apply_renames(sessions, renames, after):
+    for rec in renames:
+        if rec["seq"] <= after:
+            continue
+        if rec["op"] == "remap":
+            remap_sessions(sessions, remap_mapping(rec["pairs"]))
+        elif rec["op"] == "rename_section":
+            new = sys.intern(rec["new"])
+            for s in sessions:
+                if s.section == rec["old"]:
+                    s.section = new
+        else:
+            new = sys.intern(rec["new"])
+            for s in sessions:
+                if s.section == rec["section"] and s.sub == rec["old"]:
+                    s.sub = new
+
+
+def _rename_totals(totals, rec):
+    # totales {sección: {sub: segundos}} de un segmento (o las secciones declaradas)
+    if rec["op"] == "remap":
+        mapping = remap_mapping(rec["pairs"])
+        moves = []
+        for sec in {k[0] for k in mapping}:
+            subs = totals.get(sec)
+            if subs is None:
+                continue
+            for sub in list(subs):
+                new = remap_key(mapping, (sec, sub))
+                if new is not None:
+                    moves.append((new, subs.pop(sub)))
+            if not subs:
+                del totals[sec]
+        for (sec, sub), secs in moves:
+            dst = totals.setdefault(sec, {})
+            dst[sub] = dst.get(sub, 0) + secs
+    elif rec["op"] == "rename_section":
+        subs = totals.pop(rec["old"], None)
+        if subs:
+            dst = totals.setdefault(rec["new"], {})
+            for sub, secs in subs.items():
+                dst[sub] = dst.get(sub, 0) + secs
+    else:
+        subs = totals.get(rec["section"], {})
+        if rec["old"] in subs:
+            secs = subs.pop(rec["old"])
+            subs[rec["new"]] = subs.get(rec["new"], 0) + secs
+
+
+class MonthArchive:
+    # Los meses cerrados salen de data.json a un segmento comprimido por mes
+    # (data.archive/AAAA-MM.json.gz) que sólo se reescribe si se edita algo de
+    # ese mes. manifest.json guarda por segmento nº de sesiones, segundos,
+    # primer/último inicio y totales, y los renombrados posteriores a cada
+    # segmento (se aplican al leerlo). Los meses se cargan bajo demanda.
+    HOT_MONTHS = 1  # meses calientes: el actual (y los N-1 anteriores)
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.manifest_file = self.folder / "manifest.json"
+        self.lock = threading.Lock()
+        self.manifest = {"segments": {}, "renames": []}
+        try:
+            self.manifest.update(json.loads(self.manifest_file.read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print("WARN archive:", e)
+        self.loaded = {}           # mes cargado entero en memoria -> huella al leerlo
+        self.where = {}            # uid en memoria -> mes archivado que la guarda
+        self.drops = defaultdict(set)  # mes -> uids que hay que quitar de su segmento
+        self.pending = []          # renombrados aún no llevados al manifiesto
+
+    @property
+    def rename_seq(self):
+        renames = self.manifest["renames"]
+        return renames[-1]["seq"] if renames else 0
+
+    def cutoff_ts(self, now=None):
+        # inicio del primer mes caliente; lo anterior se archiva
+        d = date.fromtimestamp(now or time.time()).replace(day=1)
+        for _ in range(self.HOT_MONTHS - 1):
+            d = date.fromordinal(d.toordinal() - 1).replace(day=1)
+        return datetime(d.year, d.month, 1).timestamp()
+
+    def months(self, start_ts=None, end_ts=None):
+        # meses archivados y sin cargar con sesiones en el rango (por
+        # intervalo; los segmentos escritos antes de last_end, por el inicio)
+        out = []
+        with self.lock:
+            for m, seg in self.manifest["segments"].items():
+                if m in self.loaded:
+                    continue
+                if start_ts is not None and seg.get("last_end", seg["last_ts"]) < start_ts:
+                    continue
+                if end_ts is not None and seg["first_ts"] > end_ts:
+                    continue
+                out.append(m)
+        return sorted(out)
+
+    def note_rename(self, rec):
+        with self.lock:
+            if rec["seq"] > self.rename_seq:
+                self.pending.append(dict(rec))
+
+    def hint(self, uids):
+        # meses archivados que guardan estas sesiones (se reescribirán sin ellas)
+        months = set()
+        with self.lock:
+            for uid in uids:
+                m = self.where.get(uid)
+                if m is not None:
+                    self.drops[m].add(uid)
+                    months.add(m)
+        return sorted(months)
+
+    # ---------- lectura ----------
+    @timed("archivo: leer meses")
+    def read(self, months):
+        # -> [(mes, huella, sesiones)] sin las borradas pendientes de escribir;
+        # la huella es la del segmento tal cual (hilo de trabajo)
+        out = []
+        with self.lock:
+            renames = self.manifest["renames"] + self.pending
+            for m in months:
+                seg = self.manifest["segments"].get(m)
+                if seg is None:
+                    continue
+                sessions = self._read_segment(seg["file"], renames)
+                sig = _sessions_sig(sessions)
+                gone = self.drops.get(m)
+                if gone:
+                    sessions = [s for s in sessions if s.uid not in gone]
+                out.append((m, sig, sessions))
+        return out
+
+    def _read_segment(self, name, renames):
+        with gzip.open(self.folder / name, "rb") as f:
+            raw, _ = formats.loads(f.read())
+        sessions = [Session(*row) for row in raw["sessions"]]
+        _apply_renames(sessions, renames, raw.get("renames", 0))
+        return sessions
+
+    def find(self, uids, skip=()):
+        # meses que contienen alguno de estos uids (recorre los segmentos)
+        found = []
+        for m in sorted(self.manifest["segments"]):
+            if m in skip:
+                continue
+            for _, _, sessions in self.read([m]):
+                if any(s.uid in uids for s in sessions):
+                    found.append(m)
+        return found
+
+    def adopt(self, parts, present):
+        # hilo de la GUI: los meses pasan a estar cargados; devuelve las
+        # sesiones que aún no están en memoria (la versión en memoria manda)
+        new = []
+        with self.lock:
+            for m, sig, sessions in parts:
+                if m in self.loaded:
+                    continue
+                self.loaded[m] = sig
+                for s in sessions:
+                    self.where[s.uid] = m
+                    if present(s.uid) is None:
+                        new.append(s)
+        return new
+
+    def take(self):
+        # copia de lo que la próxima escritura debe llevar al disco; sigue
+        # pendiente (y se aplica a las lecturas) hasta que write() termina
+        with self.lock:
+            drops = {m: set(uids) for m, uids in self.drops.items()}
+            return drops, list(self.pending), dict(self.loaded)
+
+    # ---------- escritura ----------
+    @timed("archivo: escribir segmentos")
+    def write(self, groups, loaded, drops, pending, adopt=True):
+        # groups: mes -> sesiones en memoria de ese mes. Los meses de `loaded`
+        # están enteros en memoria; el resto se mezcla con su segmento.
+        self.folder.mkdir(exist_ok=True)
+        with self.lock:
+            segs = self.manifest["segments"]
+            renames = self.manifest["renames"] + [r for r in pending if r["seq"] > self.rename_seq]
+            last = renames[-1]["seq"] if renames else 0
+            written = {}
+            for m in sorted(set(groups) | set(loaded) | set(drops)):
+                mine = groups.get(m, [])
+                if m in loaded:
+                    if m in segs and loaded[m] == _sessions_sig(mine):
+                        continue
+                    rows = mine
+                else:
+                    base = self._read_segment(segs[m]["file"], renames) if m in segs else []
+                    skip = {s.uid for s in mine} | drops.get(m, set())
+                    rows = [s for s in base if s.uid not in skip] + mine
+                rows.sort(key=attrgetter("start_ts"))
+                self._write_segment(m, rows, last)
+                written[m] = rows
+            for m, seg in segs.items():
+                if m not in written:
+                    for rec in renames[len(self.manifest["renames"]):]:
+                        _rename_totals(seg["totals"], rec)
+            for m, rows in written.items():
+                if not rows:
+                    segs.pop(m, None)
+                    continue
+                segs[m] = {
+                    "file": f"{m}.json.gz",
+                    "count": len(rows),
+                    "seconds": sum(s.seconds for s in rows),
+                    "first_ts": rows[0].start_ts,
+                    "last_ts": rows[-1].start_ts,
+                    "last_end": max(s.end_ts for s in rows),
+                    "totals": {sec: dict(subs) for sec, subs in
+                               recalc_totals_from_sessions(rows).items()},
+                }
+            self.manifest["renames"] = renames
+            _write_atomic(self.manifest_file, json.dumps(self.manifest, ensure_ascii=False))
+            for m, uids in drops.items():
+                left = self.drops.get(m)
+                if left is not None:
+                    left -= uids
+                    if not left:
+                        del self.drops[m]
+            self.pending = [r for r in self.pending if r["seq"] > last]
+            for m, rows in written.items():
+                if not rows:
+                    (self.folder / f"{m}.json.gz").unlink(missing_ok=True)
+                if not adopt:
+                    continue
+                if m in loaded or m not in self.loaded and len(rows) == len(groups.get(m, ())):
+                    # todo el mes está en memoria: cuenta como cargado
+                    self.loaded[m] = _sessions_sig(groups.get(m, []))
+                for s in groups.get(m, ()):
+                    self.where[s.uid] = m
+        return written
+
+    def _write_segment(self, month, rows, renames):
+        if not rows:
+            return
+        payload = {
+            "month": month,
+            "renames": renames,
+            "sessions": [[s.id, s.section, s.sub, s.start_ts, s.end_ts, s.seconds, s.user]
+                         for s in rows],
+        }
+        path = self.folder / f"{month}.json.gz"
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(formats.dumps(payload, "json"))
+        os.replace(tmp, path)
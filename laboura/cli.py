@@ -0,0 +1,385 @@
+# laboura/cli.py
+# Línea de comandos sin Qt:
+#   python -m laboura {start,stop,report,export,import,remap,move,overlaps,convert} ...
+import argparse, sys, time
+from datetime import datetime, date, time as dtime
+
+from .core import (
+    STORE_BACKEND, fmt_hms, day_of, Session, SessionList, TotalsAggregate, SessionIndex,
+    open_store, apply_change, write_totals_csv, write_sessions_csv, write_rollup_csv,
+    filter_sessions, remap_mapping, remap_sessions, find_overlaps, resolve_overlaps,
+)
+from .store_json import convert_data
+from .formats import FORMATS
+from .importer import FIELDS, read_import
+from .profiling import PROFILER, ENABLED as PROFILING
+
+GROUP_MODES = {"none": None, "day": "Día", "week": "Semana", "month": "Mes"}
+
+
+class Workspace:
+    # El mismo estado en memoria que mantiene la ventana: el diario puede
+    # compactar en cualquier append y necesita una foto coherente.
+    def __init__(self, backend=None):
+        self.store = open_store(backend)
+        self.store.attach(lambda: (self.sections, self.current, self.sessions, self.rollup))
+        self.load()
+
+    def load(self):
+        sections, self.current, sessions = self.store.load()
+        self.totals = TotalsAggregate(sections)
+        self.sections = self.totals.sections
+        self.sessions = SessionList(sessions)
+        self.rollup = self.store.rollup
+
+    def mirror(self, op, *args):
+        # sin índice: los renombrados tocan las sesiones directamente
+        if op == "remap":
+            remap_sessions(self.sessions, args[0])
+        elif op == "rename_section":
+            old, new = args
+            new = sys.intern(new)
+            for s in self.sessions:
+                if s.section == old:
+                    s.section = new
+        elif op == "rename_sub":
+            sec, old, new = args
+            new = sys.intern(new)
+            for s in self.sessions:
+                if s.section == sec and s.sub == old:
+                    s.sub = new
+        for m in (self.rollup, self.totals):
+            getattr(m, op)(*args)
+
+    def poll(self):
+        # aplica los cambios de otros procesos; devuelve cuántos
+        recs = self.store.poll_changes()
+        if recs is None:
+            self.load()
+            return 0
+        for rec in recs:
+            apply_change(rec, self.sessions, self.sections, self.mirror)
+        return len(recs)
+
+    def ensure(self, section, sub):
+        if section not in self.sections:
+            _ = self.sections[section]
+            self.store.add_section(section)
+        if sub not in self.sections[section]:
+            self.sections[section][sub] = 0
+            self.store.add_sub(section, sub)
+
+    def add_session(self, session):
+        self.sessions.append(session)
+        self.mirror("add", session)
+        self.store.add_session(session)
+
+    def import_sessions(self, sessions):
+        self.sessions.extend(sessions)
+        self.mirror("add_many", sessions)
+        self.store.import_sessions(sessions)
+
+    def update_session(self, new):
+        old = self.sessions.replace(new)
+        self.mirror("replace", old, new)
+        self.store.update_session(new)
+
+    def update_sessions(self, sessions):
+        old = self.sessions.replace_many(sessions)
+        self.mirror("replace_many", old, sessions)
+        self.store.update_sessions(sessions)
+
+    def delete_sessions(self, uids):
+        removed = self.sessions.remove_many(uids)
+        self.mirror("remove_many", removed)
+        self.store.delete_sessions([s.id for s in removed])
+
+    def rename_sub(self, section, old, new):
+        if old == new:
+            return
+        if self.store.SHARED:
+            # se aplica en orden de commit, detrás de lo que otros ya escribieron
+            self.store.rename_sub(section, old, new)
+            self.poll()
+            return
+        self.mirror("rename_sub", section, old, new)
+        self.store.rename_sub(section, old, new)
+
+    def remap(self, pairs):
+        mapping = remap_mapping(pairs)  # ValueError antes de escribir nada
+        if self.store.SHARED:
+            self.store.remap(pairs)
+            self.poll()
+            return
+        self.mirror("remap", mapping)
+        self.store.remap(pairs)
+
+    def load_months(self, start_ts=None, end_ts=None):
+        # meses archivados del rango a memoria (totales y cubo ya los cuentan)
+        months = self.store.archived_months(start_ts, end_ts)
+        if months:
+            parts = self.store.read_months(months)
+            self.sessions.extend(self.store.adopt_months(parts, self.sessions.get))
+
+    def move_sessions(self, sessions, section, sub):
+        old = [s for s in sessions if (s.section, s.sub) != (section, sub)]
+        if old:
+            new = [s.moved(section, sub) for s in old]
+            self.sessions.replace_many(new)
+            self.mirror("replace_many", old, new)
+            self.store.move_sessions([s.id for s in old], section, sub)
+        return len(old)
+
+    def set_current(self, current):
+        self.current = current
+        self.store.set_current(current)
+
+    def close(self):
+        self.store.close()
+
+
+def _day_bounds(args):
+    start_ts = end_ts = None
+    if args.date_from:
+        start_ts = datetime.combine(date.fromisoformat(args.date_from), dtime.min).timestamp()
+    if args.date_to:
+        end_ts = datetime.combine(date.fromisoformat(args.date_to), dtime.max).timestamp()
+    return start_ts, end_ts
+
+
+def _summary(ws, args, mode):
+    # mode None -> un único periodo "" (totales del rango)
+    start_ts, end_ts = _day_bounds(args)
+    return ws.rollup.summarize(
+        mode, args.section, args.sub,
+        None if start_ts is None else day_of(start_ts),
+        None if end_ts is None else day_of(end_ts),
+        args.merge_subs,
+    )
+
+
+# ---------- órdenes ----------
+def cmd_start(ws, args):
+    if ws.current:
+        cur = ws.current
+        print(f"Ya está en marcha: {cur['section']} / {cur['sub']}", file=sys.stderr)
+        return 1
+    ws.ensure(args.section, args.sub)
+    ws.set_current({"section": args.section, "sub": args.sub, "start_ts": time.time()})
+    print(f"Iniciado: {args.section} / {args.sub}")
+    return 0
+
+
+def cmd_stop(ws, args):
+    cur = ws.current
+    if not cur or "start_ts" not in cur:
+        print("No hay ningún cronómetro en marcha.", file=sys.stderr)
+        return 1
+    session = Session.new(cur["section"], cur["sub"], cur["start_ts"], time.time(), ws.store.user)
+    ws.add_session(session)
+    ws.set_current(None)
+    print(f"Parado: {session.section} / {session.sub}  {fmt_hms(session.seconds)}")
+    return 0
+
+
+def cmd_report(ws, args):
+    mode = GROUP_MODES[args.by]
+    rows = _summary(ws, args, mode)
+    if mode is None:
+        rows = [(sec, sub, secs) for _, sec, sub, secs in rows]
+        header = ("Section", "Subdivision", "Seconds", "HH:MM:SS")
+    else:
+        header = ("Period", "Section", "Subdivision", "Seconds", "HH:MM:SS")
+    table = [header] + [(*r[:-1], str(r[-1]), fmt_hms(r[-1])) for r in rows]
+    total = sum(r[-1] for r in rows)
+    table.append(("TOTAL",) + ("",) * (len(header) - 3) + (str(total), fmt_hms(total)))
+    widths = [max(len(str(row[i])) for row in table) for i in range(len(header))]
+    out = sys.stdout
+    for n, row in enumerate(table):
+        if n == len(table) - 1:
+            out.write("  ".join("-" * w for w in widths) + "\n")
+        out.write("  ".join(str(v).ljust(w) for v, w in zip(row, widths)).rstrip() + "\n")
+    return 0
+
+
+def cmd_export(ws, args):
+    if args.what == "totals":
+        n = write_totals_csv(args.path, ws.sections)
+    elif args.what == "sessions":
+        n = write_sessions_csv(args.path, ws.store.iter_sessions(args.section, args.sub, *_day_bounds(args)))
+    else:
+        n = write_rollup_csv(args.path, _summary(ws, args, GROUP_MODES[args.by] or "Día"))
+    print(f"Exportado: {args.path} ({n} filas)")
+    return 0
+
+
+def cmd_import(ws, args):
+    mapping = {}
+    for item in args.map:
+        field, sep, column = item.partition("=")
+        if not sep or field not in FIELDS:
+            print(f"--map {item}: se espera CAMPO=COLUMNA con CAMPO en {', '.join(FIELDS)}",
+                  file=sys.stderr)
+            return 1
+        mapping[field] = column
+    # con SQLite cada mes ya es una consulta indexada
+    index = None if ws.store.SHARED else SessionIndex(ws.sessions)
+    try:
+        result = read_import(args.path, ws.store, mapping, index=index)
+    except (OSError, ValueError) as e:
+        print(f"No se puede importar {args.path}: {e}", file=sys.stderr)
+        return 1
+    for row, msg in result.errors:
+        print(f"  fila {row}: {msg}", file=sys.stderr)
+    if result.sessions and not args.dry_run:
+        ws.import_sessions(result.sessions)
+    print(("(prueba) " if args.dry_run else "") + result.summary())
+    return 0
+
+
+def _parse_key(text):
+    # "SECCIÓN" o "SECCIÓN/SUBDIVISIÓN"
+    sec, _, sub = text.partition("/")
+    return sec.strip(), sub.strip() or None
+
+
+def cmd_remap(ws, args):
+    pairs = []
+    for item in args.pairs:
+        old, sep, new = item.partition("=")
+        (sec, sub), (new_sec, new_sub) = _parse_key(old), _parse_key(new)
+        if not sep or not sec or not new_sec:
+            print(f"{item}: se espera SECCIÓN[/SUB]=SECCIÓN[/SUB]", file=sys.stderr)
+            return 1
+        pairs.append([sec, sub, new_sec, new_sub])
+    try:
+        ws.remap(pairs)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Reagrupadas: {len(pairs)}")
+    return 0
+
+
+def cmd_move(ws, args):
+    start_ts, end_ts = _day_bounds(args)
+    if args.section is None and start_ts is None and end_ts is None:
+        print("move necesita --section o un rango de fechas", file=sys.stderr)
+        return 1
+    ws.load_months(start_ts, end_ts)
+    sessions = filter_sessions(ws.sessions, args.section, args.sub, start_ts, end_ts)
+    n = ws.move_sessions(sessions, args.to_section, args.to_sub)
+    print(f"Movidas: {n} sesiones a {args.to_section} / {args.to_sub}")
+    return 0
+
+
+def cmd_overlaps(ws, args):
+    ws.load_months()
+    found = find_overlaps(ws.sessions)
+    for a, b, secs in found[:args.limit]:
+        print(f"{a.start_iso} – {a.end_iso}  {a.section} / {a.sub}  ×  "
+              f"{b.start_iso} – {b.end_iso}  {b.section} / {b.sub}  ({fmt_hms(secs)})")
+    if len(found) > args.limit:
+        print(f"… y {len(found) - args.limit} más")
+    print(f"Solapes: {len(found)}")
+    if found and args.fix:
+        changed, deleted = resolve_overlaps(ws.sessions)
+        if changed:
+            ws.update_sessions(changed)
+        if deleted:
+            ws.delete_sessions(deleted)
+        print(f"Ajustadas: {len(changed)}, borradas: {len(deleted)}")
+    return 0
+
+
+def cmd_convert(ws, args):
+    # sin Workspace: el almacén tiene que estar cerrado
+    if args.store != "json":
+        print("convert sólo se aplica al almacén json (data.json)", file=sys.stderr)
+        return 1
+    old = convert_data(args.format)
+    print(f"data.json: {old or 'nuevo'} -> {args.format}")
+    return 0
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="laboura", description="Laboura Time sin interfaz gráfica")
+    p.add_argument("--store", choices=("json", "sqlite"), default=STORE_BACKEND,
+                   help="almacén de datos (por defecto LABOURA_STORE o json)")
+    cmds = p.add_subparsers(dest="cmd", required=True)
+
+    s = cmds.add_parser("start", help="inicia el cronómetro")
+    s.add_argument("section")
+    s.add_argument("sub")
+    s.set_defaults(fn=cmd_start)
+
+    s = cmds.add_parser("stop", help="detiene el cronómetro y guarda la sesión")
+    s.set_defaults(fn=cmd_stop)
+
+    select = argparse.ArgumentParser(add_help=False)
+    select.add_argument("--section")
+    select.add_argument("--sub")
+    select.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    select.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+
+    filters = argparse.ArgumentParser(add_help=False, parents=[select])
+    filters.add_argument("--by", choices=tuple(GROUP_MODES), default="none")
+    filters.add_argument("--merge-subs", action="store_true", help="combina subdivisiones")
+
+    s = cmds.add_parser("report", parents=[filters], help="totales (opcionalmente por periodo)")
+    s.set_defaults(fn=cmd_report)
+
+    s = cmds.add_parser("export", parents=[filters], help="exporta a CSV (*.csv.gz comprimido)")
+    s.add_argument("what", choices=("totals", "sessions", "summary"))
+    s.add_argument("path")
+    s.set_defaults(fn=cmd_export)
+
+    s = cmds.add_parser("import", help="importa sesiones de un CSV/JSON de otro programa")
+    s.add_argument("path", help="*.csv, *.csv.gz, *.jsonl o *.json")
+    s.add_argument("--map", action="append", default=[], metavar="CAMPO=COLUMNA",
+                   help=f"columna de cada campo ({', '.join(FIELDS)}); por defecto se reconocen "
+                        "los nombres habituales")
+    s.add_argument("--dry-run", action="store_true", help="sólo cuenta, no importa")
+    s.set_defaults(fn=cmd_import)
+
+    s = cmds.add_parser("remap", help="renombra, fusiona o mueve secciones/subdivisiones en lote")
+    s.add_argument("pairs", nargs="+", metavar="ORIGEN=DESTINO",
+                   help="SECCIÓN[/SUB]=SECCIÓN[/SUB]; si el destino existe se fusionan")
+    s.set_defaults(fn=cmd_remap)
+
+    s = cmds.add_parser("move", parents=[select], help="mueve las sesiones seleccionadas a otra subdivisión")
+    s.add_argument("to_section")
+    s.add_argument("to_sub")
+    s.set_defaults(fn=cmd_move)
+
+    s = cmds.add_parser("overlaps", help="lista las sesiones que se solapan (mismo usuario)")
+    s.add_argument("--fix", action="store_true",
+                   help="funde las de la misma subdivisión y recorta o borra el resto")
+    s.add_argument("--limit", type=int, default=50, help="solapes que se listan (50)")
+    s.set_defaults(fn=cmd_overlaps)
+
+    s = cmds.add_parser("convert", help="cambia el formato de data.json (json/msgpack)")
+    s.add_argument("format", choices=tuple(FORMATS))
+    s.set_defaults(fn=cmd_convert, workspace=False)
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "workspace", True):
+        try:
+            return args.fn(None, args)
+        except (RuntimeError, OSError) as e:  # StoreLocked, formato sin instalar, sin data.json
+            print(e, file=sys.stderr)
+            return 1
+    try:
+        ws = Workspace(args.store)
+    except RuntimeError as e:  # StoreLocked, snapshot ilegible
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        return args.fn(ws, args)
+    finally:
+        ws.close()
+        if PROFILING:
+            print(PROFILER.report(), file=sys.stderr)
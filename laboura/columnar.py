@@ -0,0 +1,298 @@
+# laboura/columnar.py
+# Motor columnar opcional (numpy) para filtros y agrupaciones del histórico.
+from .core import DayBoundaries, day_period
+from .profiling import timed
+
+try:
+    import numpy as np
+except ImportError:  # motor columnar opcional
+    np = None
+
+
+class DayTable(DayBoundaries):
+    # La tabla de medianoches del núcleo, propia de cada motor, con su copia
+    # en numpy y las etiquetas de periodo por día.
+    def __init__(self):
+        super().__init__()
+        self._arr = None
+        self._labels = {}
+
+    def _grow(self, lo, hi):
+        changed = super()._grow(lo, hi)
+        if changed:
+            self._arr = None
+            self._labels = {}
+        return changed
+
+    def copy(self):
+        # la tabla se sustituye entera al crecer: se comparte
+        t = DayTable()
+        t._table, t._arr, t._labels = self._table, self._arr, dict(self._labels)
+        return t
+
+    def array(self):
+        if self._arr is None:
+            self._arr = np.asarray(self.midnights, dtype=np.float64)
+        return self._arr
+
+    def day_indices(self, ts):
+        # posiciones en la tabla (día - first) para un array de timestamps
+        return np.searchsorted(self.array(), ts, side="right") - 1
+
+    def split(self, start, end, seconds):
+        # day_split() vectorizado: (posición del día, segundos) de cada parte
+        # y el índice de su sesión. Las que no cruzan la medianoche (casi
+        # todas) salen tal cual; sólo las demás se expanden con np.repeat.
+        mids = self.array()
+        d0 = self.day_indices(start)
+        # el fin es exclusivo: acabar justo a medianoche no toca el día siguiente
+        d1 = np.maximum(np.searchsorted(mids, end, side="left") - 1, d0)
+        multi = np.flatnonzero(d1 > d0)
+        if not len(multi):
+            return d0, seconds.astype(np.int64), np.arange(len(start))
+        single = np.flatnonzero(d1 == d0)
+        counts = d1[multi] - d0[multi] + 1
+        owner = np.repeat(multi, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        day = d0[owner] + (np.arange(len(owner)) - first)
+        st, en = start[owner], end[owner]
+        secs = seconds[owner].astype(np.float64)
+        dur = en - st
+        # acumulado redondeado hasta el final de cada parte, como day_split()
+        last = day == d1[owner]
+        cum_hi = np.where(last, secs, np.round(secs * (mids[np.minimum(day + 1, len(mids) - 1)] - st) / dur))
+        cum_lo = np.where(day == d0[owner], 0.0, np.round(secs * (mids[day] - st) / dur))
+        parts = (cum_hi - cum_lo).astype(np.int64)
+        return (np.concatenate((d0[single], day)),
+                np.concatenate((seconds[single].astype(np.int64), parts)),
+                np.concatenate((single, owner)))
+
+    def labels(self, mode):
+        # (código de periodo por día de la tabla, etiquetas únicas ordenadas)
+        out = self._labels.get(mode)
+        if out is None:
+            per_day = [day_period(self.first + i, mode) for i in range(len(self.midnights))]
+            names = sorted(set(per_day))
+            code = {p: i for i, p in enumerate(names)}
+            out = self._labels[mode] = (np.asarray([code[p] for p in per_day], np.int64), names)
+        return out
+
+
+class ColumnarEngine:
+    # Espejo columnar de las sesiones (requiere numpy): start/end en float64,
+    # segundos en int32 y sección/subdivisión codificadas como enteros. Filtros
+    # y agrupaciones son máscaras + bincount con los mismos resultados que
+    # filter_sessions()/summarize_sessions() (y que el cubo por días).
+    def __init__(self, sessions=()):
+        sessions = list(sessions)
+        n = len(sessions)
+        cap = max(1024, n)
+        self.start = np.zeros(cap, np.float64)
+        self.end = np.zeros(cap, np.float64)
+        self.seconds = np.zeros(cap, np.int32)
+        self.sec = np.zeros(cap, np.int32)
+        self.sub = np.zeros(cap, np.int32)
+        self.alive = np.zeros(cap, np.bool_)
+        self.sec_names, self.sec_codes = [], {}
+        self.sub_names, self.sub_codes = [], {}
+        self.rows = sessions
+        self.pos = {s.uid: i for i, s in enumerate(sessions)}
+        self.n = n
+        self.dead = 0
+        self.days = DayTable()
+        if n:
+            self.start[:n] = np.fromiter((s.start_ts for s in sessions), np.float64, n)
+            self.end[:n] = np.fromiter((s.end_ts for s in sessions), np.float64, n)
+            self.seconds[:n] = np.fromiter((int(s.seconds) for s in sessions), np.int32, n)
+            self.sec[:n] = np.fromiter((self._code(self.sec_names, self.sec_codes, s.section)
+                                        for s in sessions), np.int32, n)
+            self.sub[:n] = np.fromiter((self._code(self.sub_names, self.sub_codes, s.sub)
+                                        for s in sessions), np.int32, n)
+            self.alive[:n] = True
+            self.days.ensure(float(self.start[:n].min()), float(self.end[:n].max()))
+
+    def __len__(self):
+        return self.n - self.dead
+
+    def snapshot(self):
+        # copia para query()/summarize() desde un hilo de trabajo mientras la
+        # GUI sigue modificando el original; sin `pos`, no admite cambios
+        snap = ColumnarEngine.__new__(ColumnarEngine)
+        n = snap.n = self.n
+        for name in ("start", "end", "seconds", "sec", "sub", "alive"):
+            setattr(snap, name, getattr(self, name)[:n].copy())
+        snap.sec_names, snap.sec_codes = self.sec_names[:], dict(self.sec_codes)
+        snap.sub_names, snap.sub_codes = self.sub_names[:], dict(self.sub_codes)
+        snap.rows = self.rows[:n]
+        snap.pos = None
+        snap.dead = self.dead
+        snap.days = self.days.copy()
+        return snap
+
+    @staticmethod
+    def _code(names, codes, name):
+        c = codes.get(name)
+        if c is None:
+            c = codes[name] = len(names)
+            names.append(name)
+        return c
+
+    def _write(self, i, s):
+        self.start[i] = s.start_ts
+        self.end[i] = s.end_ts
+        self.seconds[i] = int(s.seconds)
+        self.sec[i] = self._code(self.sec_names, self.sec_codes, s.section)
+        self.sub[i] = self._code(self.sub_names, self.sub_codes, s.sub)
+        self.alive[i] = True
+        self.rows[i] = s
+        self.pos[s.uid] = i
+        self.days.ensure(s.start_ts, s.end_ts)
+
+    def add(self, s):
+        if self.n == len(self.start):
+            # arrays nuevos: una consulta en curso sigue con los anteriores
+            cap = len(self.start) * 2
+            for name in ("start", "end", "seconds", "sec", "sub", "alive"):
+                old = getattr(self, name)
+                arr = np.zeros(cap, old.dtype)
+                arr[:self.n] = old[:self.n]
+                setattr(self, name, arr)
+        self.rows.append(None)
+        self.n += 1
+        self._write(self.n - 1, s)
+
+    def replace(self, old, new):
+        i = self.pos.pop(old.uid, None)
+        if i is None:
+            self.add(new)
+        else:
+            self._write(i, new)
+
+    def remove(self, s):
+        i = self.pos.pop(s.uid, None)
+        if i is not None:
+            self.alive[i] = False
+            self.rows[i] = None
+            self.dead += 1
+
+    def add_many(self, sessions):
+        for s in sessions:
+            self.add(s)
+
+    def remove_many(self, sessions):
+        for s in sessions:
+            self.remove(s)
+        if self.dead > 1024 and self.dead * 4 > self.n:
+            self.__init__([s for s in self.rows if s is not None])
+
+    def rename_section(self, old, new):
+        if old == new:
+            return
+        code = self.sec_codes.pop(old, None)
+        if code is None:
+            return
+        if new in self.sec_codes:
+            col = self.sec[:self.n]
+            col[col == code] = self.sec_codes[new]
+        else:
+            self.sec_names[code] = new
+            self.sec_codes[new] = code
+
+    def rename_sub(self, section, old, new):
+        sc, oc = self.sec_codes.get(section), self.sub_codes.get(old)
+        if old == new or sc is None or oc is None:
+            return
+        nc = self._code(self.sub_names, self.sub_codes, new)
+        n = self.n
+        self.sub[:n][(self.sec[:n] == sc) & (self.sub[:n] == oc)] = nc
+
+    def replace_many(self, old, new):
+        for o, s in zip(old, new):
+            self.replace(o, s)
+
+    def remap(self, mapping):
+        # máscaras sobre las columnas originales y después las asignaciones:
+        # primero las secciones enteras, luego las parejas exactas (mandan)
+        n = self.n
+        sec, sub = self.sec[:n], self.sub[:n]
+        changes = []
+        for (old_sec, old_sub), (new_sec, new_sub) in mapping.items():
+            sc = self.sec_codes.get(old_sec)
+            if sc is None or old_sub is not None and old_sub not in self.sub_codes:
+                continue
+            mask = sec == sc
+            if old_sub is not None:
+                mask &= sub == self.sub_codes[old_sub]
+            changes.append((old_sub is not None, mask, new_sec, new_sub))
+        changes.sort(key=lambda c: c[0])
+        for _, mask, new_sec, new_sub in changes:
+            sec[mask] = self._code(self.sec_names, self.sec_codes, new_sec)
+            if new_sub is not None:
+                sub[mask] = self._code(self.sub_names, self.sub_codes, new_sub)
+
+    def _mask(self, section, sub, start_ts, end_ts):
+        n = self.n
+        mask = self.alive[:n].copy()
+        st = self.start[:n]
+        if section is not None:
+            if section not in self.sec_codes:
+                return None
+            mask &= self.sec[:n] == self.sec_codes[section]
+        if sub is not None:
+            if sub not in self.sub_codes:
+                return None
+            mask &= self.sub[:n] == self.sub_codes[sub]
+        if start_ts is not None:
+            # también las que empezaron antes y seguían abiertas
+            mask &= (st >= start_ts) | (self.end[:n] > start_ts)
+        if end_ts is not None:
+            mask &= st <= end_ts
+        return np.flatnonzero(mask)
+
+    @timed("filtro (numpy)")
+    def query(self, section=None, sub=None, start_ts=None, end_ts=None):
+        idx = self._mask(section, sub, start_ts, end_ts)
+        if idx is None or not len(idx):
+            return []
+        idx = idx[np.argsort(self.start[idx], kind="stable")]
+        rows = self.rows
+        return [rows[i] for i in idx.tolist()]
+
+    @timed("resumen (numpy)")
+    def summarize(self, mode, section=None, sub=None, start_ts=None, end_ts=None,
+                  merge_subs=False, task=None):
+        idx = self._mask(section, sub, start_ts, end_ts)
+        if idx is None or not len(idx):
+            return []
+        day, secs, owner = self.days.split(self.start[idx], self.end[idx], self.seconds[idx])
+        # sólo las partes que caen en los días del rango
+        keep = None
+        if start_ts is not None:
+            keep = day >= self.days.day_indices(start_ts)
+        if end_ts is not None:
+            hi = day <= self.days.day_indices(end_ts)
+            keep = hi if keep is None else keep & hi
+        if keep is not None:
+            day, secs, owner = day[keep], secs[keep], owner[keep]
+        if not len(day):
+            return []
+        idx = idx[owner]
+        period_codes, labels = self.days.labels(mode)
+        pc = period_codes[day]
+        n_sec = max(1, len(self.sec_names))
+        n_sub = 1 if merge_subs else max(1, len(self.sub_names))
+        key = pc * n_sec + self.sec[idx]
+        if not merge_subs:
+            key = key * n_sub + self.sub[idx]
+        uniq, inv = np.unique(key, return_inverse=True)
+        sums = np.bincount(inv.ravel(), weights=secs)
+        if task is not None:
+            task.check()
+        out = []
+        for k, v in zip(uniq.tolist(), sums.tolist()):
+            k, b = divmod(k, n_sub)
+            p, c = divmod(k, n_sec)
+            out.append((labels[p], self.sec_names[c],
+                        "(Todas)" if merge_subs else self.sub_names[b], int(v)))
+        out.sort()
+        return out
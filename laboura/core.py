@@ -0,0 +1,1213 @@
+# laboura/core.py
+# Núcleo sin Qt: sesiones, agregados, exportación CSV y lo común a los
+# almacenes (snapshot, bloqueo, cambios de otros procesos). Los almacenes
+# están en store_json.py y store_sqlite.py; el histórico archivado, en archive.py.
+import sys, os, time, json, csv, gzip, uuid, threading, heapq, getpass
+from contextlib import contextmanager
+from datetime import datetime, date, time as dtime
+from functools import lru_cache
+from pathlib import Path
+from collections import defaultdict
+from itertools import islice
+from operator import attrgetter
+from bisect import bisect_left, bisect_right, insort
+
+from . import formats
+from .profiling import timed, register_cache
+
+DATA_FILE = Path("data.json")
+JOURNAL_FILE = Path("data.journal")
+DB_FILE = Path("data.db")
+# "json" (data.json + diario) o "sqlite" (data.db)
+STORE_BACKEND = os.environ.get("LABOURA_STORE", "json")
+# formato de un data.json nuevo: "json" o "msgpack" (requiere msgpack); uno
+# existente conserva el suyo hasta que se convierte (python -m laboura convert)
+DATA_FORMAT = os.environ.get("LABOURA_FORMAT", "json")
+# "python" (índice + cubo por días) o "numpy" (motor columnar, requiere numpy)
+QUERY_ENGINE = os.environ.get("LABOURA_ENGINE", "python")
+# SQLite en modo WAL (varios procesos en el mismo equipo); LABOURA_WAL=0 para
+# carpetas compartidas en red, donde WAL no es fiable
+SQLITE_WAL = os.environ.get("LABOURA_WAL", "1") == "1"
+
+
+# ============== utils ==============
+# Tablas, resúmenes y CSV formatean millones de duraciones, fechas y
+# periodos: cachés LRU acotadas (estadísticas en profiling.PROFILER.caches)
+HMS_CACHE = 1 << 16       # duraciones HH:MM:SS distintas
+PERIOD_CACHE = 1 << 15    # (día, modo) -> etiqueta de periodo
+
+
+def fmt_hms(seconds: int | float) -> str:
+    return _hms(int(seconds))
+
+
+@lru_cache(maxsize=HMS_CACHE)
+def _hms(seconds):
+    h = seconds // 3600
+    m = (seconds % 3600) // 60
+    s = seconds % 60
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+
+def ts_to_iso(ts: float) -> str:
+    # sin caché: cada inicio/fin es un segundo distinto y datetime (C) ya es
+    # más rápido que cualquier composición en Python
+    return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="seconds")
+
+
+def current_user():
+    # a quién se atribuyen las sesiones: LABOURA_USER o el usuario del sistema
+    user = os.environ.get("LABOURA_USER")
+    if user:
+        return user
+    try:
+        return getpass.getuser()
+    except Exception:
+        return None
+
+
+def session_uid(sid):
+    # UUID canónico -> 16 bytes; cualquier otro id se conserva como texto
+    if isinstance(sid, bytes):
+        return sid
+    try:
+        u = uuid.UUID(sid)
+    except (ValueError, AttributeError, TypeError):
+        return sid
+    return u.bytes if str(u) == sid else sid
+
+
+class Session:
+    # Registro compacto de una sesión: sin __dict__, sección/subdivisión
+    # internadas y el UUID como 16 bytes. Las fechas ISO se derivan al pedirlas.
+    # user: quién registró la sesión (None en datos anteriores)
+    __slots__ = ("uid", "section", "sub", "start_ts", "end_ts", "seconds", "user")
+
+    def __init__(self, id, section, sub, start_ts, end_ts, seconds, user=None):
+        self.uid = session_uid(id)
+        self.section = sys.intern(section)
+        self.sub = sys.intern(sub)
+        self.start_ts = float(start_ts)
+        self.end_ts = float(end_ts)
+        self.seconds = int(seconds)
+        self.user = sys.intern(user) if user else None
+
+    @classmethod
+    def new(cls, section, sub, start_ts, end_ts, user=None):
+        return cls(uuid.uuid4().bytes, section, sub, start_ts, end_ts, int(end_ts - start_ts), user)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get("id") or str(uuid.uuid4()), d["section"], d["sub"],
+                   d["start_ts"], d["end_ts"], d["seconds"], d.get("user"))
+
+    @classmethod
+    def from_tuple(cls, t):
+        s = cls.__new__(cls)
+        s.uid, s.section, s.sub, s.start_ts, s.end_ts, s.seconds, s.user = t
+        return s
+
+    @property
+    def id(self):
+        u = self.uid
+        return str(uuid.UUID(bytes=u)) if isinstance(u, bytes) else u
+
+    @property
+    def start_iso(self):
+        return ts_to_iso(self.start_ts)
+
+    @property
+    def end_iso(self):
+        return ts_to_iso(self.end_ts)
+
+    def astuple(self):
+        return (self.uid, self.section, self.sub, self.start_ts, self.end_ts, self.seconds, self.user)
+
+    def to_dict(self):
+        # mismo formato que siempre en data.json (incluye las fechas ISO)
+        d = {
+            "id": self.id,
+            "section": self.section, "sub": self.sub,
+            "start_ts": self.start_ts, "end_ts": self.end_ts,
+            "start_iso": self.start_iso, "end_iso": self.end_iso,
+            "seconds": self.seconds,
+        }
+        if self.user:
+            d["user"] = self.user
+        return d
+
+    def moved(self, section, sub):
+        # copia con otra sección/subdivisión (mismo uid)
+        return Session(self.uid, section, sub, self.start_ts, self.end_ts, self.seconds, self.user)
+
+    def retimed(self, start_ts, end_ts, seconds):
+        # copia con otro intervalo (mismo uid)
+        return Session(self.uid, self.section, self.sub, start_ts, end_ts, seconds, self.user)
+
+    def __repr__(self):
+        return (f"Session({self.id!r}, {self.section!r}, {self.sub!r}, "
+                f"{self.start_ts!r}, {self.end_ts!r}, {self.seconds!r}, {self.user!r})")
+
+
+class SessionList:
+    # Sesiones en orden de inserción con índice uid -> posición. Borrar deja
+    # una lápida (None) en su hueco; los huecos se compactan de golpe cuando
+    # pasan de COMPACT_MIN y de la mitad de la lista.
+    COMPACT_MIN = 1024
+
+    def __init__(self, sessions=()):
+        self._items = list(sessions)
+        self._pos = {s.uid: i for i, s in enumerate(self._items)}
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._items) - self._dead
+
+    def __iter__(self):
+        if not self._dead:
+            return iter(self._items)
+        return (s for s in self._items if s is not None)
+
+    def __contains__(self, uid):
+        return uid in self._pos
+
+    def get(self, uid):
+        i = self._pos.get(uid)
+        return None if i is None else self._items[i]
+
+    def append(self, session):
+        self._pos[session.uid] = len(self._items)
+        self._items.append(session)
+
+    def extend(self, sessions):
+        for s in sessions:
+            self.append(s)
+
+    def replace(self, session):
+        # sustituye la sesión con el mismo uid; devuelve la anterior
+        i = self._pos[session.uid]
+        old, self._items[i] = self._items[i], session
+        return old
+
+    def replace_many(self, sessions):
+        return [self.replace(s) for s in sessions]
+
+    def remove_many(self, uids):
+        removed = []
+        for uid in uids:
+            i = self._pos.pop(uid, None)
+            if i is None:
+                continue
+            removed.append(self._items[i])
+            self._items[i] = None
+        self._dead += len(removed)
+        if self._dead > self.COMPACT_MIN and self._dead * 2 > len(self._items):
+            self._compact()
+        return removed
+
+    def _compact(self):
+        self._items = [s for s in self._items if s is not None]
+        self._pos = {s.uid: i for i, s in enumerate(self._items)}
+        self._dead = 0
+
+
+class DayBoundaries:
+    # Medianoches locales de días consecutivos: los límites del día de un
+    # timestamp son una búsqueda binaria y los días de un array entero, un
+    # solo numpy.searchsorted. Crece bajo demanda a trozos; se sustituye
+    # entera y nunca se modifica, así que los hilos de trabajo la leen sin lock.
+    GROW_DAYS = 366        # margen al crecer
+    MAX_GAP = 366 * 50     # más lejos de la tabla: se calcula sin extenderla
+
+    def __init__(self):
+        self._table = (None, [])  # (primer día ordinal, medianoches hasta el día siguiente al último)
+        self._lock = threading.Lock()
+
+    @property
+    def first(self):
+        return self._table[0]
+
+    @property
+    def midnights(self):
+        return self._table[1]
+
+    @staticmethod
+    def _midnight(day):
+        return datetime.combine(date.fromordinal(day), dtime.min).timestamp()
+
+    def ensure(self, lo_ts, hi_ts):
+        # cubre [día(lo_ts), día(hi_ts) + 1]: el último día tiene también su límite final
+        self._grow(date.fromtimestamp(lo_ts).toordinal(), date.fromtimestamp(hi_ts).toordinal() + 1)
+
+    def _grow(self, lo, hi):
+        # True si la tabla ha cambiado
+        with self._lock:
+            first, mids = self._table
+            if first is None:
+                self._table = (lo, [self._midnight(d) for d in range(lo, hi + 1)])
+                return True
+            last = first + len(mids) - 1
+            if lo >= first and hi <= last:
+                return False
+            lo, hi = min(lo, first), max(hi, last)
+            self._table = (lo, [self._midnight(d) for d in range(lo, first)] + mids
+                           + [self._midnight(d) for d in range(last + 1, hi + 1)])
+            return True
+
+    def locate(self, ts):
+        # -> (día ordinal, su medianoche, la siguiente)
+        first, mids = self._table
+        i = bisect_right(mids, ts) - 1
+        if 0 <= i < len(mids) - 1:
+            return first + i, mids[i], mids[i + 1]
+        return self._miss(ts)
+
+    def _miss(self, ts):
+        day = date.fromtimestamp(ts).toordinal()
+        first, mids = self._table
+        if first is not None and not first - self.MAX_GAP < day < first + len(mids) + self.MAX_GAP:
+            return day, self._midnight(day), self._midnight(day + 1)
+        self._grow(day - self.GROW_DAYS, day + self.GROW_DAYS)
+        first, mids = self._table
+        return day, mids[day - first], mids[day - first + 1]
+
+
+def day_of(ts: float) -> int:
+    # día local como ordinal (date.toordinal). Para un timestamp suelto
+    # date.fromtimestamp (C) gana a la tabla; la tabla sirve para los límites
+    # de los días (motor columnar, repartos por intervalo)
+    return date.fromtimestamp(ts).toordinal()
+
+
+# límites de día compartidos por el cubo, los resúmenes y SQLite
+DAYS = DayBoundaries()
+
+
+def day_split(start_ts, end_ts, seconds):
+    # [(día, segundos)] de una sesión según su intervalo real [inicio, fin):
+    # a cada día le toca la parte proporcional de `seconds`, redondeada sobre
+    # el acumulado para que las partes sumen exactamente `seconds`. Casi todas
+    # caben en un día y salen con una sola búsqueda.
+    day, _, nxt = DAYS.locate(start_ts)
+    if end_ts <= nxt:
+        return ((day, seconds),)
+    dur = end_ts - start_ts
+    out, done = [], 0
+    while end_ts > nxt:
+        cum = round(seconds * (nxt - start_ts) / dur)
+        out.append((day, cum - done))
+        done = cum
+        day, _, nxt = DAYS.locate(nxt)
+    out.append((day, seconds - done))
+    return out
+
+
+@lru_cache(maxsize=PERIOD_CACHE)
+def day_period(day: int, mode: str) -> str:
+    # etiqueta de periodo (como period_key) para un día ordinal
+    d = date.fromordinal(day)
+    if mode == "Día":
+        return d.isoformat()
+    if mode == "Semana":
+        iso = d.isocalendar()
+        return f"{iso.year}-W{iso.week:02d}"
+    if mode == "Mes":
+        return f"{d.year}-{d.month:02d}"
+    return ""
+
+
+@timed("recalc_totals_from_sessions")
+def recalc_totals_from_sessions(sessions):
+    sections = defaultdict(lambda: defaultdict(int))
+    for s in sessions:
+        sections[s.section][s.sub] += int(s.seconds)
+    return sections
+
+
+# ---------- reagrupar secciones/subdivisiones en lote ----------
+RENAME_OPS = ("rename_section", "rename_sub", "remap")
+
+
+def remap_mapping(pairs):
+    # [[sección, sub, nueva sección, nueva sub], ...] -> {(sec, sub): (sec, sub)}
+    # sub None: toda la sección; nueva sub None: conserva la subdivisión. Si
+    # el destino ya existe se suman (fusión). Las parejas exactas van primero
+    # y mandan sobre las de su sección entera. Un destino no puede ser a la
+    # vez origen: así da igual aplicarlas a la vez o una detrás de otra.
+    exact, whole = {}, {}
+    for sec, sub, new_sec, new_sub in pairs:
+        if (sec, sub) in exact or (sec, sub) in whole:
+            raise ValueError(f"'{sec} / {sub or '*'}' aparece dos veces")
+        if new_sec == sec and new_sub in (None, sub):
+            continue
+        (whole if sub is None else exact)[(sec, sub)] = (new_sec, new_sub)
+    mapping = {**exact, **whole}
+    for (sec, sub), (new_sec, new_sub) in mapping.items():
+        if new_sub is not None:
+            chained = (new_sec, new_sub) in mapping
+        elif sub is not None:
+            chained = (new_sec, sub) in mapping
+        else:
+            chained = any(k[0] == new_sec for k in mapping)
+        if chained or (new_sec, None) in mapping:
+            raise ValueError(f"'{new_sec}' es destino y origen en el mismo cambio")
+    return mapping
+
+
+def remap_key(mapping, key):
+    # nueva (sección, subdivisión) de `key`; None si no cambia
+    new = mapping.get(key) or mapping.get((key[0], None))
+    if new is None:
+        return None
+    new = (new[0], key[1] if new[1] is None else new[1])
+    return None if new == key else new
+
+
+def remap_sessions(sessions, mapping):
+    # in situ; devuelve cuántas cambian
+    n = 0
+    for s in sessions:
+        new = remap_key(mapping, (s.section, s.sub))
+        if new is not None:
+            s.section, s.sub = sys.intern(new[0]), sys.intern(new[1])
+            n += 1
+    return n
+
+
+# ---------- solapes ----------
+# Dos sesiones del mismo usuario se solapan si sus intervalos [inicio, fin)
+# se cortan; las de usuarios distintos pueden coincidir sin problema.
+def _by_user(sessions):
+    groups = defaultdict(list)
+    for s in sessions:
+        groups[s.user].append(s)
+    for rows in groups.values():
+        rows.sort(key=attrgetter("start_ts", "end_ts"))
+    return groups
+
+
+@timed("buscar solapes")
+def find_overlaps(sessions):
+    # [(a, b, segundos solapados)] con a.start_ts <= b.start_ts: un barrido
+    # por inicio con un montículo de las sesiones abiertas, O(N log N + K)
+    out = []
+    for rows in _by_user(sessions).values():
+        active = []  # (fin, n, sesión)
+        for n, b in enumerate(rows):
+            while active and active[0][0] <= b.start_ts:
+                heapq.heappop(active)
+            for end, _, a in active:
+                secs = min(end, b.end_ts) - b.start_ts
+                if secs > 0:
+                    out.append((a, b, secs))
+            if b.end_ts > b.start_ts:
+                heapq.heappush(active, (b.end_ts, n, b))
+    return out
+
+
+def resolve_overlaps(sessions):
+    # -> (sesiones modificadas, uids a borrar). En orden de inicio, cada
+    # sesión se compara con la que más lejos llega de las anteriores: si es
+    # de la misma sección/subdivisión se funden en la primera; si queda
+    # tapada entera se borra; si no, se recorta su inicio hasta ese fin.
+    changed, deleted = {}, []
+    for rows in _by_user(sessions).values():
+        prev = None
+        for s in rows:
+            if prev is None or s.start_ts >= prev.end_ts:
+                prev = s
+                continue
+            if (s.section, s.sub) == (prev.section, prev.sub):
+                end = max(prev.end_ts, s.end_ts)
+                secs = min(prev.seconds + s.seconds, int(end - prev.start_ts))
+                prev = changed[prev.uid] = prev.retimed(prev.start_ts, end, secs)
+                changed.pop(s.uid, None)
+                deleted.append(s.uid)
+            elif s.end_ts <= prev.end_ts:
+                deleted.append(s.uid)
+            else:
+                cut = prev.end_ts - s.start_ts
+                s = changed[s.uid] = s.retimed(prev.end_ts, s.end_ts, max(0, int(s.seconds - cut)))
+                prev = s
+    return list(changed.values()), deleted
+
+
+# VERIFY_TOTALS=1 compara en cada cambio los totales incrementales con un
+# recálculo completo de todas las sesiones, también las archivadas
+VERIFY_TOTALS = os.environ.get("LABOURA_VERIFY_TOTALS") == "1"
+
+
+class TotalsAggregate:
+    # Totales sección/subdivisión mantenidos por deltas en vez de recalcular
+    # sobre todas las sesiones en cada cambio. `sections` se modifica in situ.
+    def __init__(self, sections=None, verify=None):
+        self.sections = defaultdict(lambda: defaultdict(int))
+        for sec, subs in (sections or {}).items():
+            _ = self.sections[sec]
+            for sub, secs in subs.items():
+                self.sections[sec][sub] += int(secs)
+        # verify: callable que devuelve los totales de referencia (modo verificación)
+        self.verify = verify
+
+    def add(self, s):
+        self.sections[s.section][s.sub] += int(s.seconds)
+        self._check()
+
+    def remove(self, s):
+        self.sections[s.section][s.sub] -= int(s.seconds)
+        self._check()
+
+    def add_many(self, sessions):
+        for s in sessions:
+            self.sections[s.section][s.sub] += int(s.seconds)
+        self._check()
+
+    def remove_many(self, sessions):
+        for s in sessions:
+            self.sections[s.section][s.sub] -= int(s.seconds)
+        self._check()
+
+    def replace(self, old, new):
+        self.sections[old.section][old.sub] -= int(old.seconds)
+        self.sections[new.section][new.sub] += int(new.seconds)
+        self._check()
+
+    def rename_section(self, old, new):
+        if old == new or old not in self.sections:
+            return
+        subs = self.sections.pop(old)
+        dst = self.sections[new]
+        for sub, secs in subs.items():
+            dst[sub] += secs
+        self._check()
+
+    def rename_sub(self, section, old, new):
+        subs = self.sections.get(section)
+        if old == new or subs is None or old not in subs:
+            return
+        subs[new] += subs.pop(old)
+        self._check()
+
+    def replace_many(self, old, new):
+        for s in old:
+            self.sections[s.section][s.sub] -= int(s.seconds)
+        for s in new:
+            self.sections[s.section][s.sub] += int(s.seconds)
+        self._check()
+
+    def remap(self, mapping):
+        # sólo las secciones de origen; las que se quedan vacías desaparecen
+        moves = []
+        for sec in {k[0] for k in mapping}:
+            subs = self.sections.get(sec)
+            if subs is None:
+                continue
+            for sub in list(subs):
+                new = remap_key(mapping, (sec, sub))
+                if new is not None:
+                    moves.append((new, subs.pop(sub)))
+            if not subs:
+                del self.sections[sec]
+        for (sec, sub), secs in moves:
+            self.sections[sec][sub] += secs
+        self._check()
+
+    def mismatches(self, full):
+        # Diferencias (sección, sub, incremental, referencia); los ceros se ignoran
+        out = []
+        for sec in set(self.sections) | set(full):
+            mine = self.sections.get(sec, {})
+            ref = full.get(sec, {})
+            for sub in set(mine) | set(ref):
+                a, b = mine.get(sub, 0), ref.get(sub, 0)
+                if a != b:
+                    out.append((sec, sub, a, b))
+        return sorted(out)
+
+    @contextmanager
+    def deferred_check(self):
+        # la comparación se hace al salir del bloque: un renombrado sólo llega
+        # a los meses archivados cuando el almacén lo escribe
+        verify, self.verify = self.verify, None
+        try:
+            yield
+        finally:
+            self.verify = verify
+        self._check()
+
+    def _check(self):
+        if self.verify is None:
+            return
+        bad = self.mismatches(self.verify())
+        if bad:
+            raise AssertionError(f"totales desincronizados: {bad[:5]}")
+
+
+# Las búsquedas por intervalo miran como mucho LONG_SESSION segundos antes
+# del inicio de la ventana; las sesiones más largas (raras: olvidos de parar
+# el cronómetro, importaciones) se guardan aparte y se revisan siempre.
+LONG_SESSION = 86400
+
+
+def _is_long(s):
+    return s.end_ts - s.start_ts > LONG_SESSION
+
+
+class _SortedRun:
+    # Sesiones ordenadas por start_ts (listas paralelas para poder usar bisect)
+    __slots__ = ("ts", "rows")
+
+    def __init__(self, rows=()):
+        self.rows = sorted(rows, key=lambda s: s.start_ts)
+        self.ts = [s.start_ts for s in self.rows]
+
+    def insert(self, s):
+        i = bisect_right(self.ts, s.start_ts)
+        self.ts.insert(i, s.start_ts)
+        self.rows.insert(i, s)
+
+    def remove(self, s):
+        lo = bisect_left(self.ts, s.start_ts)
+        hi = bisect_right(self.ts, s.start_ts, lo)
+        for i in range(lo, hi):
+            if self.rows[i].uid == s.uid:
+                del self.ts[i]
+                del self.rows[i]
+                return True
+        return False
+
+    def slice(self, start_ts=None, end_ts=None, reach=0.0):
+        # también las que empiezan hasta `reach` antes de start_ts y siguen
+        # abiertas en start_ts (filter_sessions)
+        hi = len(self.ts) if end_ts is None else bisect_right(self.ts, end_ts)
+        if start_ts is None:
+            return self.rows[:hi]
+        mid = bisect_left(self.ts, start_ts)
+        lo = bisect_left(self.ts, start_ts - reach, 0, mid)
+        head = [s for s in self.rows[lo:mid] if s.end_ts > start_ts]
+        return head + self.rows[mid:hi] if head else self.rows[mid:hi]
+
+    def merge(self, other):
+        self.rows = list(heapq.merge(self.rows, other.rows, key=lambda s: s.start_ts))
+        self.ts = [s.start_ts for s in self.rows]
+
+    def copy(self):
+        run = _SortedRun()
+        run.ts, run.rows = self.ts[:], self.rows[:]
+        return run
+
+
+class SessionIndex:
+    # Índice en memoria: todas las sesiones ordenadas por start_ts y una lista
+    # ordenada adicional por (sección, subdivisión). Un rango de fechas se
+    # resuelve con bisect y sólo se tocan las sesiones que coinciden.
+    BULK_REMOVE = 64
+
+    def __init__(self, sessions=()):
+        self.all = _SortedRun(sessions)
+        self.postings = {}
+        self.subs = defaultdict(set)
+        # uid -> sesiones de más de LONG_SESSION (también están en las listas)
+        self.long = {}
+        groups = defaultdict(list)
+        for s in self.all.rows:
+            groups[(s.section, s.sub)].append(s)
+            if _is_long(s):
+                self.long[s.uid] = s
+        for key, rows in groups.items():
+            self.postings[key] = _SortedRun(rows)
+            self.subs[key[0]].add(key[1])
+
+    def __len__(self):
+        return len(self.all.rows)
+
+    def snapshot(self):
+        # copia para consultar desde un hilo de trabajo mientras la GUI sigue
+        # modificando el original: listas propias, las mismas sesiones
+        snap = SessionIndex()
+        snap.all = self.all.copy()
+        snap.postings = {key: run.copy() for key, run in self.postings.items()}
+        snap.subs = defaultdict(set, {sec: set(subs) for sec, subs in self.subs.items()})
+        snap.long = dict(self.long)
+        return snap
+
+    def add(self, s):
+        self.all.insert(s)
+        if _is_long(s):
+            self.long[s.uid] = s
+        key = (s.section, s.sub)
+        run = self.postings.get(key)
+        if run is None:
+            run = self.postings[key] = _SortedRun()
+            self.subs[key[0]].add(key[1])
+        run.insert(s)
+
+    def add_many(self, sessions):
+        # p. ej. un mes del histórico archivado: se mezcla de una vez
+        if len(sessions) < self.BULK_REMOVE:
+            for s in sessions:
+                self.add(s)
+            return
+        groups = defaultdict(list)
+        for s in sessions:
+            groups[(s.section, s.sub)].append(s)
+            if _is_long(s):
+                self.long[s.uid] = s
+        self.all = _SortedRun(self.all.rows + list(sessions))
+        for key, rows in groups.items():
+            run = self.postings.get(key)
+            self.postings[key] = _SortedRun(run.rows + rows if run else rows)
+            self.subs[key[0]].add(key[1])
+
+    def remove(self, s):
+        self.all.remove(s)
+        self.long.pop(s.uid, None)
+        run = self.postings.get((s.section, s.sub))
+        if run is not None:
+            run.remove(s)
+
+    def remove_many(self, sessions):
+        if len(sessions) < self.BULK_REMOVE:
+            for s in sessions:
+                self.remove(s)
+            return
+        uids = {s.uid for s in sessions}
+        keys = {(s.section, s.sub) for s in sessions}
+        for uid in uids:
+            self.long.pop(uid, None)
+        self.all = _SortedRun(s for s in self.all.rows if s.uid not in uids)
+        for key in keys:
+            if key in self.postings:
+                self.postings[key] = _SortedRun(
+                    s for s in self.postings[key].rows if s.uid not in uids)
+
+    def replace(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def rename_section(self, old, new):
+        # Renombra in situ sólo las sesiones de esa sección
+        if old == new:
+            return
+        new = sys.intern(new)
+        for sub in self.subs.pop(old, set()):
+            run = self.postings.pop((old, sub))
+            for s in run.rows:
+                s.section = new
+            self._merge_into((new, sub), run)
+
+    def rename_sub(self, section, old, new):
+        if old == new:
+            return
+        run = self.postings.pop((section, old), None)
+        self.subs[section].discard(old)
+        if run is None:
+            return
+        new = sys.intern(new)
+        for s in run.rows:
+            s.sub = new
+        self._merge_into((section, new), run)
+
+    def replace_many(self, old, new):
+        self.remove_many(old)
+        self.add_many(new)
+
+    def remap(self, mapping):
+        # se sacan primero todas las listas de origen y luego se mezclan en
+        # su destino: sólo se tocan las sesiones que cambian de clave
+        moved = []
+        for sec in {k[0] for k in mapping}:
+            for sub in list(self.subs.get(sec, ())):
+                new = remap_key(mapping, (sec, sub))
+                if new is None:
+                    continue
+                self.subs[sec].discard(sub)
+                run = self.postings.pop((sec, sub), None)
+                if run is not None:
+                    moved.append((new, run))
+            if sec in self.subs and not self.subs[sec]:
+                del self.subs[sec]
+        for (sec, sub), run in moved:
+            sec, sub = sys.intern(sec), sys.intern(sub)
+            for s in run.rows:
+                s.section, s.sub = sec, sub
+            self._merge_into((sec, sub), run)
+
+    def _merge_into(self, key, run):
+        dst = self.postings.get(key)
+        if dst is None:
+            self.postings[key] = run
+        else:
+            dst.merge(run)
+        self.subs[key[0]].add(key[1])
+
+    def _long_before(self, start_ts, end_ts, keep):
+        # sesiones largas que empezaron antes de start_ts - LONG_SESSION y
+        # siguen abiertas en start_ts: van delante de lo que da slice()
+        edge = start_ts - LONG_SESSION
+        rows = [s for s in self.long.values()
+                if s.start_ts < edge and s.end_ts > start_ts
+                and (end_ts is None or s.start_ts <= end_ts) and keep(s)]
+        rows.sort(key=lambda s: s.start_ts)
+        return rows
+
+    def overlapping(self, start_ts, end_ts, user=None, skip=None):
+        # sesiones de `user` que se solapan con [start_ts, end_ts): las
+        # normales empiezan entre start_ts - LONG_SESSION y end_ts, dos bisect
+        # y esa ventana; las largas se miran aparte
+        run = self.all
+        lo = bisect_left(run.ts, start_ts - LONG_SESSION)
+        hi = bisect_left(run.ts, end_ts)
+        keep = lambda s: s.user == user and s.uid != skip
+        head = self._long_before(start_ts, end_ts, keep) if self.long else []
+        return head + [s for s in run.rows[lo:hi] if s.end_ts > start_ts and keep(s)]
+
+    @timed("filtro (índice)")
+    def query(self, section=None, sub=None, start_ts=None, end_ts=None):
+        rows = self._query(section, sub, start_ts, end_ts)
+        if start_ts is None or not self.long:
+            return rows
+        head = self._long_before(start_ts, end_ts, lambda s: (
+            (section is None or s.section == section) and (sub is None or s.sub == sub)))
+        return head + rows if head else rows
+
+    def _query(self, section, sub, start_ts, end_ts):
+        reach = LONG_SESSION
+        if section is None and sub is None:
+            return self.all.slice(start_ts, end_ts, reach)
+        if section is not None and sub is not None:
+            run = self.postings.get((section, sub))
+            return run.slice(start_ts, end_ts, reach) if run else []
+        if section is not None:
+            keys = [(section, x) for x in self.subs.get(section, ())]
+        else:
+            keys = [k for k in self.postings if k[1] == sub]
+        parts = [self.postings[k].slice(start_ts, end_ts, reach) for k in keys if k in self.postings]
+        if len(parts) == 1:
+            return parts[0]
+        return list(heapq.merge(*parts, key=lambda s: s.start_ts))
+
+
+class DayRollup:
+    # Cubo persistente de [segundos, nº sesiones] por (día, sección, subdivisión).
+    # Los resúmenes por día/semana/mes salen de aquí sin tocar las sesiones.
+    # Una sesión que cruza la medianoche se reparte entre sus días (day_split)
+    # y cuenta como sesión en cada uno de ellos.
+    VERSION = 2  # 1: todo al día de inicio
+
+    def __init__(self, sessions=()):
+        self.days = {}
+        self.order = []
+        for s in sessions:
+            self.add(s)
+
+    @classmethod
+    def from_rows(cls, rows):
+        r = cls()
+        for day, sec, sub, secs, n in rows:
+            r._add(day, sec, sub, secs, n)
+        return r
+
+    def rows(self):
+        return [[d, sec, sub, v[0], v[1]]
+                for d in self.order for (sec, sub), v in self.days[d].items()]
+
+    def snapshot(self):
+        # copia para resumir desde un hilo de trabajo (ver SessionIndex.snapshot)
+        snap = DayRollup()
+        snap.days = {d: {key: v[:] for key, v in bucket.items()} for d, bucket in self.days.items()}
+        snap.order = self.order[:]
+        return snap
+
+    def totals(self):
+        # totales sección/subdivisión de todo el histórico, también el archivado
+        out = defaultdict(lambda: defaultdict(int))
+        for bucket in self.days.values():
+            for (sec, sub), (secs, _) in bucket.items():
+                out[sec][sub] += secs
+        return out
+
+    def _add(self, day, sec, sub, secs, n):
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = {}
+            insort(self.order, day)
+        v = bucket.get((sec, sub))
+        if v is None:
+            bucket[(sec, sub)] = [secs, n]
+            return
+        v[0] += secs
+        v[1] += n
+        if v[1] <= 0:
+            del bucket[(sec, sub)]
+
+    def add(self, s):
+        for day, secs in day_split(s.start_ts, s.end_ts, int(s.seconds)):
+            self._add(day, s.section, s.sub, secs, 1)
+
+    def remove(self, s):
+        for day, secs in day_split(s.start_ts, s.end_ts, int(s.seconds)):
+            self._add(day, s.section, s.sub, -secs, -1)
+
+    def add_many(self, sessions):
+        for s in sessions:
+            self.add(s)
+
+    def remove_many(self, sessions):
+        for s in sessions:
+            self.remove(s)
+
+    def replace(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def replace_many(self, old, new):
+        self.remove_many(old)
+        self.add_many(new)
+
+    def remap(self, mapping):
+        # una pasada por los días; remap_mapping() garantiza que ninguna
+        # clave movida vuelve a coincidir
+        self._rekey(lambda k: remap_key(mapping, k) is not None,
+                    lambda k: remap_key(mapping, k))
+
+    def rename_section(self, old, new):
+        if old != new:
+            self._rekey(lambda k: k[0] == old, lambda k: (new, k[1]))
+
+    def rename_sub(self, section, old, new):
+        if old != new:
+            self._rekey(lambda k: k == (section, old), lambda k: (section, new))
+
+    def _rekey(self, match, newkey):
+        for bucket in self.days.values():
+            for key in [k for k in bucket if match(k)]:
+                v = bucket.pop(key)
+                dst = bucket.setdefault(newkey(key), [0, 0])
+                dst[0] += v[0]
+                dst[1] += v[1]
+
+    @timed("resumen (cubo por días)")
+    def summarize(self, mode, section=None, sub=None, start_day=None, end_day=None,
+                  merge_subs=False, task=None):
+        # Mismas filas que summarize_sessions() sobre las sesiones filtradas
+        lo = 0 if start_day is None else bisect_left(self.order, start_day)
+        hi = len(self.order) if end_day is None else bisect_right(self.order, end_day)
+        days = self.order[lo:hi]
+        agg = defaultdict(int)
+        for i, day in enumerate(days):
+            if task is not None and i % 512 == 0:
+                task.progress(i, len(days))
+            period = day_period(day, mode)
+            for (sec, sb), (secs, _) in list(self.days[day].items()):
+                if section is not None and sec != section:
+                    continue
+                if sub is not None and sb != sub:
+                    continue
+                agg[(period, sec, "(Todas)" if merge_subs else sb)] += secs
+        return [(period, sec, sb, int(secs)) for (period, sec, sb), secs in sorted(agg.items())]
+
+
+def filter_sessions(sessions, section=None, sub=None, start_ts=None, end_ts=None):
+    # el rango de fechas selecciona por intervalo: también entran las sesiones
+    # que empezaron antes de start_ts y seguían abiertas
+    out = []
+    for s in sessions:
+        if section is not None and s.section != section:
+            continue
+        if sub is not None and s.sub != sub:
+            continue
+        if start_ts is not None and s.start_ts < start_ts and s.end_ts <= start_ts:
+            continue
+        if end_ts is not None and s.start_ts > end_ts:
+            continue
+        out.append(s)
+    return out
+
+
+def period_key(ts: float, mode: str) -> str:
+    return day_period(day_of(ts), mode)
+
+
+register_cache("HH:MM:SS", _hms.cache_info)
+register_cache("periodos", day_period.cache_info)
+
+
+def summarize_sessions(sessions, mode, merge_subs=False, task=None, start_ts=None, end_ts=None):
+    # filas (periodo, sección, subdivisión, segundos) ordenadas; cada sesión
+    # repartida por días como en el cubo, sin los días fuera de start/end_ts
+    lo = None if start_ts is None else day_of(start_ts)
+    hi = None if end_ts is None else day_of(end_ts)
+    agg = defaultdict(int)
+    n = len(sessions)
+    for i, s in enumerate(sessions):
+        if task is not None and i % 4096 == 0:
+            task.progress(i, n)
+        sub = "(Todas)" if merge_subs else s.sub
+        for day, secs in day_split(s.start_ts, s.end_ts, int(s.seconds)):
+            if (lo is None or day >= lo) and (hi is None or day <= hi):
+                agg[(day_period(day, mode), s.section, sub)] += secs
+    return [(period, sec, sub, int(secs)) for (period, sec, sub), secs in sorted(agg.items())]
+
+
+def session_row_values(s):
+    # ID, Sección, Subdivisión, Inicio, Fin, HH:MM:SS, Usuario tal y como se muestran
+    return [
+        s.id,
+        s.section,
+        s.sub,
+        s.start_iso,
+        s.end_iso,
+        fmt_hms(s.seconds),
+        s.user or "",
+    ]
+
+
+# ---------- exportación CSV en streaming ----------
+CSV_CHUNK = 4096          # filas por writerows()
+CSV_BUFFER = 1 << 20      # buffer del fichero sin comprimir
+
+SESSIONS_CSV_HEADER = ["ID", "Section", "Subdivision", "Start", "End", "Seconds", "HH:MM:SS", "User"]
+TOTALS_CSV_HEADER = ["Section", "Subdivision", "Seconds", "HH:MM:SS"]
+ROLLUP_CSV_HEADER = ["Period", "Section", "Subdivision", "Seconds", "HH:MM:SS"]
+
+
+def open_csv(path):
+    # "*.gz" se comprime al vuelo
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6)
+    return open(path, "w", newline="", encoding="utf-8", buffering=CSV_BUFFER)
+
+
+def write_csv(path, header, rows, task=None, total=None):
+    # rows puede ser cualquier iterable/generador: se consume a trozos y nunca
+    # se materializa entero, así que la memoria no depende del número de filas
+    it = iter(rows)
+    done = 0
+    with open_csv(path) as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        while True:
+            chunk = list(islice(it, CSV_CHUNK))
+            if not chunk:
+                break
+            w.writerows(chunk)
+            done += len(chunk)
+            if task is not None:
+                if total:
+                    task.progress(done, total)
+                else:
+                    task.check()
+    return done
+
+
+def totals_csv_rows(sections):
+    total_all = 0
+    for sec in sorted(sections.keys()):
+        for sub, secs in sorted(sections[sec].items()):
+            secs = int(secs)
+            total_all += secs
+            yield [sec, sub, secs, fmt_hms(secs)]
+    yield []
+    yield ["TOTAL", "", total_all, fmt_hms(total_all)]
+
+
+def sessions_csv_rows(sessions):
+    for s in sessions:
+        yield [s.id, s.section, s.sub, s.start_iso, s.end_iso, s.seconds, fmt_hms(s.seconds),
+               s.user or ""]
+
+
+def rollup_csv_rows(rows):
+    # filas (periodo, sección, subdivisión, segundos) de summarize()
+    for period, sec, sub, secs in rows:
+        yield [period, sec, sub, secs, fmt_hms(secs)]
+
+
+@timed("export totales CSV")
+def write_totals_csv(path, sections, task=None):
+    return write_csv(path, TOTALS_CSV_HEADER, totals_csv_rows(sections), task)
+
+
+@timed("export sesiones CSV")
+def write_sessions_csv(path, sessions, task=None, total=None):
+    if total is None and hasattr(sessions, "__len__"):
+        total = len(sessions)
+    return write_csv(path, SESSIONS_CSV_HEADER, sessions_csv_rows(sessions), task, total)
+
+
+@timed("export resumen CSV")
+def write_rollup_csv(path, rows, task=None):
+    return write_csv(path, ROLLUP_CSV_HEADER, rollup_csv_rows(rows), task)
+
+
+def open_store(backend=None):
+    # importados aquí: los módulos de los almacenes importan este
+    backend = backend or STORE_BACKEND
+    if backend == "sqlite":
+        from .store_sqlite import SqliteStore
+        return SqliteStore()
+    if backend == "json":
+        from .store_json import JournalStore
+        return JournalStore()
+    raise ValueError(f"backend desconocido: {backend}")
+
+
+def load_data():
+    return open_store().load()
+
+
+def _write_atomic(path, data):
+    # se escribe a un temporal y se renombra (atómico); texto o bytes
+    tmp = path.with_name(path.name + ".tmp")
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+@timed("save_data")
+def save_data(sections, current, sessions, seq=0, path=None, rollup=None, fmt=None):
+    # Snapshot completo
+    payload = {
+        "seq": seq,
+        "sections": {s: dict(subs) for s, subs in sections.items()},
+        "current": current,
+        "sessions": [s.to_dict() for s in sessions],
+    }
+    if rollup is not None:
+        payload["rollup"] = rollup
+        payload["rollup_version"] = DayRollup.VERSION
+    _write_atomic(Path(path or DATA_FILE), formats.dumps(payload, fmt or DATA_FORMAT))
+
+
+def read_payload(path):
+    # -> (contenido del snapshot, formato detectado)
+    return formats.loads(Path(path).read_bytes())
+
+
+def save_header(sections, current, seq, path):
+    # Cabecera del snapshot para el arranque: sólo nombres de secciones y
+    # subdivisiones y la sesión en curso, sin histórico
+    payload = {
+        "seq": seq,
+        "sections": {s: sorted(subs) for s, subs in sections.items()},
+        "current": current,
+    }
+    _write_atomic(Path(path), json.dumps(payload, ensure_ascii=False))
+
+
+# ============== bloqueo entre procesos ==============
+class StoreLocked(RuntimeError):
+    pass
+
+
+class FileLock:
+    # Lock consultivo exclusivo sobre un fichero auxiliar, entre procesos del
+    # mismo equipo o de una carpeta compartida (fcntl en POSIX, msvcrt en Windows)
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fh = None
+
+    @property
+    def held(self):
+        return self._fh is not None
+
+    def acquire(self, blocking=True):
+        fh = open(self.path, "a+b")
+        while True:
+            try:
+                if os.name == "nt":
+                    import msvcrt
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if not blocking:
+                    fh.close()
+                    return False
+                time.sleep(0.01)
+        self._fh = fh
+        return True
+
+    def release(self):
+        fh, self._fh = self._fh, None
+        if fh is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# ============== cambios de otros procesos ==============
+def apply_change(rec, sessions, sections, mirror):
+    # Aplica un registro de poll_changes() a una SessionList, al dict de
+    # secciones y, vía mirror(op, *args), a las estructuras derivadas (índice,
+    # totales, cubo...). Es idempotente: repetir un cambio no lo duplica.
+    op = rec.get("op")
+    if op in ("add", "update"):
+        new = Session.from_dict(rec["session"])
+        old = sessions.get(new.uid)
+        if old is None:
+            sessions.append(new)
+            mirror("add", new)
+        else:
+            sessions.replace(new)
+            mirror("replace", old, new)
+    elif op == "import":
+        new = [s for s in map(Session.from_dict, rec["sessions"]) if s.uid not in sessions]
+        if new:
+            sessions.extend(new)
+            mirror("add_many", new)
+    elif op == "update_many":
+        new = list(map(Session.from_dict, rec["sessions"]))
+        known = [s for s in new if s.uid in sessions]
+        if known:
+            old = sessions.replace_many(known)
+            mirror("replace_many", old, known)
+        added = [s for s in new if s.uid not in sessions]
+        if added:
+            sessions.extend(added)
+            mirror("add_many", added)
+    elif op == "delete":
+        removed = sessions.remove_many([session_uid(i) for i in rec["ids"]])
+        if removed:
+            mirror("remove_many", removed)
+    elif op == "move":
+        old = [s for s in map(sessions.get, map(session_uid, rec["ids"]))
+               if s is not None and (s.section, s.sub) != (rec["section"], rec["sub"])]
+        if old:
+            new = [s.moved(rec["section"], rec["sub"]) for s in old]
+            sessions.replace_many(new)
+            mirror("replace_many", old, new)
+    elif op == "remap":
+        mirror("remap", remap_mapping(rec["pairs"]))
+    elif op == "rename_section":
+        mirror("rename_section", rec["old"], rec["new"])
+    elif op == "rename_sub":
+        mirror("rename_sub", rec["section"], rec["old"], rec["new"])
+    elif op == "add_section":
+        _ = sections[rec["name"]]
+    elif op == "add_sub":
+        sections[rec["section"]][rec["name"]] += 0
+    return op
@@ -0,0 +1,83 @@
+# laboura/formats.py
+# Serialización del snapshot (data.json) y de los segmentos archivados.
+# En disco hay dos formatos, JSON y msgpack; al leer se detecta por el
+# contenido y al escribir se conserva el del fichero salvo que se convierta.
+# JSON se codifica con orjson si está instalado (mismo texto, más rápido).
+import json
+
+try:
+    import orjson
+except ImportError:  # JSON rápido opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # formato binario opcional
+    msgpack = None
+
+
+class JsonFormat:
+    name = "json"
+
+    def available(self):
+        return True
+
+    def dumps(self, payload):
+        if orjson is not None:
+            return orjson.dumps(payload)
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def sniff(self, head):
+        return head.lstrip()[:1] in (b"{", b"[")
+
+
+class MsgpackFormat:
+    name = "msgpack"
+
+    def available(self):
+        return msgpack is not None
+
+    def dumps(self, payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def sniff(self, head):
+        # un mapa msgpack: fixmap (0x80-0x8f), map16 o map32
+        return bool(head) and (0x80 <= head[0] <= 0x8f or head[0] in (0xde, 0xdf))
+
+
+FORMATS = {f.name: f for f in (JsonFormat(), MsgpackFormat())}
+
+
+def get_format(name):
+    fmt = FORMATS.get(name)
+    if fmt is None:
+        raise ValueError(f"formato desconocido: {name} (disponibles: {', '.join(FORMATS)})")
+    if not fmt.available():
+        raise RuntimeError(f"el formato {name} requiere pip install {name}")
+    return fmt
+
+
+def detect(data):
+    head = data[:16]
+    for fmt in FORMATS.values():
+        if fmt.sniff(head):
+            return fmt.name
+    raise ValueError("formato de datos no reconocido")
+
+
+def dumps(payload, name="json"):
+    return get_format(name).dumps(payload)
+
+
+def loads(data):
+    # -> (payload, nombre del formato detectado)
+    name = detect(data)
+    return get_format(name).loads(data), name
@@ -0,0 +1,247 @@
+# laboura/importer.py
+# Importación masiva de registros de otros programas: CSV (*.csv, *.csv.gz),
+# JSON Lines (*.jsonl) o JSON (una lista de objetos o un data.json). Los
+# ficheros se leen por lotes, cada fila se traduce a una Session según el
+# mapeo de columnas y se descartan las que ya existen (misma sección,
+# subdivisión, inicio y fin al segundo). El resultado se aplica de una vez
+# con store.import_sessions(): una sola transacción / registro del diario.
+# Las sesiones nuevas que se solapan con otras del mismo usuario (del
+# fichero o ya guardadas) se cuentan en el informe, pero se importan igual.
+import csv, gzip, io, json, uuid
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from . import formats
+from .archive import month_of
+from .core import Session, find_overlaps, filter_sessions
+from .profiling import timed
+
+IMPORT_BATCH = 5000   # filas por lote al leer
+MAX_ERRORS = 20       # filas con error que se guardan para el informe
+
+FIELDS = ("section", "sub", "start", "end", "seconds", "user")
+REQUIRED = ("section", "sub", "start")
+# nombres de columna reconocidos sin mapeo explícito (sin mayúsculas)
+ALIASES = {
+    "section": ("section", "sección", "seccion", "project", "proyecto", "client", "cliente"),
+    "sub": ("subdivision", "subdivisión", "sub", "task", "tarea", "activity", "actividad"),
+    "start": ("start", "start_ts", "start_iso", "inicio", "begin", "desde"),
+    "end": ("end", "end_ts", "end_iso", "fin", "stop", "hasta"),
+    "seconds": ("seconds", "segundos", "duration", "duración", "duracion"),
+    "user": ("user", "usuario"),
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []      # (fila, mensaje) de las primeras filas inválidas
+        self.sessions = []    # sesiones nuevas, en el orden del fichero
+        self.overlaps = []    # (a, b, segundos) con al menos una sesión nueva
+
+    def summary(self):
+        text = (f"{self.read} filas leídas: {len(self.sessions)} nuevas, "
+                f"{self.duplicates} repetidas, {self.invalid} con errores")
+        if self.overlaps:
+            text += f"; {len(self.overlaps)} solapes con otras sesiones"
+        return text
+
+
+# ---------- lectura ----------
+def parse_time(value):
+    # segundos desde epoch o fecha ISO ("2024-05-01 09:30:00", "...T...Z");
+    # sin zona horaria se toma la hora local, como las exportaciones
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    return datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()
+
+
+def parse_duration(value):
+    # segundos o HH:MM:SS
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    if ":" in text:
+        h, m, s = (text.split(":") + ["0", "0"])[:3]
+        return int(h) * 3600 + int(m) * 60 + int(float(s))
+    return int(float(text))
+
+
+def _open_text(path):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt", newline="", encoding="utf-8-sig")
+    return open(path, newline="", encoding="utf-8-sig")
+
+
+def iter_records(path):
+    # -> dicts columna -> valor, de uno en uno
+    name = str(path).lower().removesuffix(".gz")
+    if name.endswith(".csv"):
+        with _open_text(path) as f:
+            yield from csv.DictReader(f)
+    elif name.endswith((".jsonl", ".ndjson")):
+        with _open_text(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        # una lista JSON no se puede leer por partes con la biblioteca
+        # estándar: para registros enormes, mejor CSV o JSON Lines
+        raw = Path(path).read_bytes()
+        if str(path).endswith(".gz"):
+            raw = gzip.GzipFile(fileobj=io.BytesIO(raw)).read()
+        data, _ = formats.loads(raw)
+        yield from data.get("sessions", []) if isinstance(data, dict) else data
+
+
+def resolve_mapping(columns, mapping=None):
+    # campo -> columna; lo que no venga en `mapping` se busca por ALIASES
+    mapping = dict(mapping or {})
+    lower = {c.strip().lower(): c for c in columns}
+    for field in FIELDS:
+        if field not in mapping:
+            for alias in ALIASES[field]:
+                if alias in lower:
+                    mapping[field] = lower[alias]
+                    break
+    missing = [f for f in REQUIRED if f not in mapping]
+    if "end" not in mapping and "seconds" not in mapping:
+        missing.append("end/seconds")
+    if missing:
+        raise ValueError(
+            f"faltan columnas para {', '.join(missing)} (columnas del fichero: {', '.join(columns)})")
+    return mapping
+
+
+def to_session(rec, mapping, user=None):
+    if not isinstance(rec, dict):
+        # p. ej. una lista de listas en vez de una lista de objetos
+        raise ValueError(f"se esperaba un objeto, no {type(rec).__name__}")
+    section = str(rec.get(mapping["section"]) or "").strip()
+    sub = str(rec.get(mapping["sub"]) or "").strip()
+    if not section or not sub:
+        raise ValueError("sección o subdivisión vacía")
+    start = parse_time(rec[mapping["start"]])
+    secs = rec.get(mapping["seconds"]) if "seconds" in mapping else None
+    end = rec.get(mapping["end"]) if "end" in mapping else None
+    if end not in (None, ""):
+        end = parse_time(end)
+    else:
+        if secs in (None, ""):
+            raise ValueError("sin fin ni duración")
+        end = start + parse_duration(secs)
+    seconds = int(end - start) if secs in (None, "") else parse_duration(secs)
+    if end < start or seconds < 0:
+        raise ValueError("el fin es anterior al inicio")
+    who = rec.get(mapping["user"]) if "user" in mapping else None
+    # siempre con id nuevo: el del otro programa (o de una exportación) no vale aquí
+    return Session(uuid.uuid4().bytes, section, sub, start, end, seconds, who or user)
+
+
+def iter_batches(path, mapping=None, user=None, result=None, batch=IMPORT_BATCH):
+    # -> listas de Session; las filas inválidas se cuentan en `result`
+    result = result if result is not None else ImportResult()
+    records = iter_records(path)
+    row = 0
+    resolved = None
+    while True:
+        chunk = list(islice(records, batch))
+        if not chunk:
+            return
+        if resolved is None:
+            # columnas de la primera fila que sea un objeto; las demás no
+            # llegan a usar el mapeo (to_session las rechaza antes)
+            first = next((rec for rec in chunk if isinstance(rec, dict)), None)
+            if first is not None:
+                resolved = resolve_mapping(list(first), mapping)
+        out = []
+        for rec in chunk:
+            row += 1
+            try:
+                out.append(to_session(rec, resolved, user))
+            except (KeyError, ValueError, TypeError) as e:
+                result.invalid += 1
+                if len(result.errors) < MAX_ERRORS:
+                    result.errors.append((row, str(e)))
+        result.read += len(chunk)
+        yield out
+
+
+# ---------- duplicados ----------
+def dedup_key(s):
+    # al segundo: lo exportado en ISO vuelve a coincidir con el original
+    return (s.section, s.sub, int(s.start_ts), int(s.end_ts))
+
+
+class DedupIndex:
+    # Claves (sección, subdivisión, inicio, fin) de las sesiones existentes,
+    # cargadas por meses la primera vez que un lote los toca (los meses
+    # archivados también). Con `index` (SessionIndex de lo que hay en memoria)
+    # cada mes es una consulta por intervalo; sin él, store.iter_sessions().
+    def __init__(self, store, index=None):
+        self.store = store
+        self.index = index
+        self.keys = set()
+        self.months = set()
+        self.existing = {}   # uid -> sesión guardada de esos meses (para los solapes)
+
+    def _load_month(self, month):
+        y, m = int(month[:4]), int(month[5:7])
+        lo = datetime(y, m, 1).timestamp()
+        hi = datetime(y + m // 12, m % 12 + 1, 1).timestamp()
+        for s in self._month_sessions(lo, hi):
+            self.keys.add(dedup_key(s))
+            # una sesión que cruza el cambio de mes sale en los dos
+            self.existing[s.uid] = s
+        self.months.add(month)
+
+    def _month_sessions(self, lo, hi):
+        if self.index is None:
+            yield from self.store.iter_sessions(None, None, lo, hi)
+            return
+        rows = self.index.query(None, None, lo, hi)
+        yield from rows
+        # los meses archivados que no están en memoria
+        seen = {s.uid for s in rows}
+        for _, _, seg in self.store.read_months(self.store.archived_months(lo, hi)):
+            yield from (s for s in filter_sessions(seg, None, None, lo, hi) if s.uid not in seen)
+
+    def add_new(self, s):
+        # True si no existía (y queda registrada: el propio fichero tampoco
+        # puede traerla dos veces)
+        month = month_of(s.start_ts)
+        if month not in self.months:
+            self._load_month(month)
+        key = dedup_key(s)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+
+@timed("importar: leer y deduplicar")
+def read_import(path, store, mapping=None, user=None, task=None, index=None):
+    # Lee el fichero entero por lotes y devuelve un ImportResult con las
+    # sesiones nuevas; no modifica nada (puede ir en un hilo de trabajo)
+    result = ImportResult()
+    index = DedupIndex(store, index)
+    for batch in iter_batches(path, mapping, user or store.user, result):
+        if task is not None:
+            task.check()
+        for s in batch:
+            if index.add_new(s):
+                result.sessions.append(s)
+            else:
+                result.duplicates += 1
+    new = {s.uid for s in result.sessions}
+    result.overlaps = [o for o in find_overlaps(list(index.existing.values()) + result.sessions)
+                       if o[0].uid in new or o[1].uid in new]
+    return result
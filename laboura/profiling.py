@@ -0,0 +1,156 @@
+# laboura/profiling.py
+# Instrumentación opcional de las rutas calientes: tiempos acumulados por
+# nombre (disco, serialización, agregación, tablas) y contadores. Se activa
+# con LABOURA_PROFILE=1; sin activar, timed() devuelve la función tal cual
+# y span() un contexto vacío, así que no cuesta nada.
+# LABOURA_CPROFILE=perfil.prof además perfila el hilo principal con cProfile
+# y lo vuelca al salir (se abre con snakeviz, pstats...).
+# Las cachés del núcleo (formato de tiempos, periodos) se registran aquí con
+# register_cache() y sus aciertos/fallos salen siempre en el informe.
+import cProfile, os, threading, time
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import wraps
+
+CPROFILE_FILE = os.environ.get("LABOURA_CPROFILE") or None
+ENABLED = os.environ.get("LABOURA_PROFILE") == "1" or CPROFILE_FILE is not None
+
+
+# mismos campos que functools.lru_cache().cache_info(); hits/maxsize pueden ser None
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class Stat:
+    __slots__ = ("calls", "total", "max", "last")
+
+    def __init__(self):
+        self.calls, self.total, self.max, self.last = 0, 0.0, 0.0, 0.0
+
+
+class Profiler:
+    def __init__(self):
+        self.stats = {}
+        self.counters = {}
+        self._lock = threading.Lock()  # las tareas en segundo plano también miden
+        self._cprofile = None
+        self.caches = {}  # nombre -> función que devuelve un CacheInfo
+
+    def record(self, name, secs):
+        with self._lock:
+            st = self.stats.get(name)
+            if st is None:
+                st = self.stats[name] = Stat()
+            st.calls += 1
+            st.total += secs
+            st.last = secs
+            if secs > st.max:
+                st.max = secs
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def rows(self):
+        # (nombre, llamadas, total, media, máx, última) en segundos, por total
+        with self._lock:
+            out = [(name, st.calls, st.total, st.total / st.calls, st.max, st.last)
+                   for name, st in self.stats.items()]
+        return sorted(out, key=lambda r: -r[2])
+
+    def cache_rows(self):
+        # (nombre, aciertos, fallos, % aciertos, tamaño, máximo)
+        out = []
+        for name, info in sorted(self.caches.items()):
+            i = info()
+            rate = None if i.hits is None or not i.hits + i.misses else 100 * i.hits / (i.hits + i.misses)
+            out.append((name, i.hits, i.misses, rate, i.currsize, i.maxsize))
+        return out
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.counters.clear()
+
+    def report(self):
+        lines = [f"{'':<34} {'llamadas':>8} {'total ms':>10} {'media ms':>10} {'máx ms':>10}"]
+        for name, calls, total, mean, mx, _ in self.rows():
+            lines.append(f"{name:<34} {calls:>8} {total * 1000:>10.1f} {mean * 1000:>10.2f} {mx * 1000:>10.2f}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<34} {n:>8}")
+        for name, hits, misses, rate, size, maxsize in self.cache_rows():
+            lines.append(f"caché {name:<28} aciertos {'—' if hits is None else hits}, fallos {misses}"
+                         + ("" if rate is None else f" ({rate:.0f}%)")
+                         + f", {size}{'' if maxsize is None else f'/{maxsize}'} entradas")
+        return "\n".join(lines)
+
+    # ---------- cProfile (sólo el hilo que lo inicia) ----------
+    @property
+    def cprofile_running(self):
+        return self._cprofile is not None
+
+    def start_cprofile(self):
+        if self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop_cprofile(self, path):
+        prof, self._cprofile = self._cprofile, None
+        if prof is None:
+            return None
+        prof.disable()
+        prof.dump_stats(path)
+        return path
+
+
+PROFILER = Profiler()
+
+
+def register_cache(name, info):
+    # info(): el cache_info de una función con lru_cache o cualquier tupla
+    # (hits, misses, maxsize, currsize); se guarda como CacheInfo
+    PROFILER.caches[name] = lambda: CacheInfo(*info())
+
+
+def timed(name):
+    # decorador: acumula el tiempo de cada llamada bajo `name`
+    def deco(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                PROFILER.record(name, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        PROFILER.record(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+_NULL = nullcontext()
+
+
+def span(name):
+    # with span("..."): mide un bloque
+    return _Span(name) if ENABLED else _NULL
+
+
+def count(name, n=1):
+    if ENABLED:
+        PROFILER.count(name, n)
@@ -0,0 +1,647 @@
+# laboura/store_json.py
+# Almacén por defecto de un solo proceso: snapshot (data.json) más un diario
+# de cambios (data.journal) que se compacta en segundo plano.
+import sys, os, json, threading, heapq
+from pathlib import Path
+from collections import defaultdict
+from operator import attrgetter
+
+from . import formats
+from .archive import MonthArchive, month_of, _rename_totals
+from .core import (
+    DATA_FILE, JOURNAL_FILE, DATA_FORMAT, RENAME_OPS, Session, DayRollup, FileLock, StoreLocked,
+    current_user, session_uid, filter_sessions, remap_mapping, remap_sessions,
+    save_data, save_header, read_payload,
+)
+from .profiling import timed, count
+
+
+# ============== almacenamiento (snapshot + diario) ==============
+# registros que modifican sesiones ya existentes (pueden estar archivadas)
+EDIT_OPS = ("update", "update_many", "delete", "move")
+
+
+def _record_ids(rec):
+    op = rec["op"]
+    if op == "update":
+        return [rec["session"].get("id")]
+    if op == "update_many":
+        return [d.get("id") for d in rec["sessions"]]
+    return rec["ids"]
+
+
+class JournalStore:
+    # Cada mutación añade una línea JSON al diario; cuando el diario crece,
+    # se compacta en un snapshot nuevo desde un hilo en segundo plano.
+    COMPACT_RECORDS = 500
+    COMPACT_BYTES = 1 << 20
+    # los registros se agrupan durante FLUSH_MS y se escriben juntos con un
+    # solo fsync en segundo plano; la sesión en curso se escribe al momento
+    FLUSH_MS = 50
+    SHARED = False
+
+    def __init__(self, data_file=None, journal_file=None, user=None):
+        self.data_file = Path(data_file or DATA_FILE)
+        self.journal_file = Path(journal_file or JOURNAL_FILE)
+        self.rotated_file = self.journal_file.with_name(self.journal_file.name + ".1")
+        self.head_file = self.data_file.with_suffix(".head.json")
+        self.archive_dir = self.data_file.with_suffix(".archive")
+        self.archive = MonthArchive(self.archive_dir)
+        self.user = user or current_user()
+        # un único proceso escribe data.json; varios usuarios -> SqliteStore
+        self._flock = FileLock(self.data_file.with_name(self.data_file.name + ".lock"))
+        self.seq = 0
+        # formato del snapshot: el detectado al cargar o DATA_FORMAT si es nuevo
+        self.format = DATA_FORMAT
+        self._records = 0
+        self._fh = None
+        self._journal_size = 0
+        # registros en espera de escribirse (en orden de seq)
+        self._queue = []
+        self._flush_timer = None
+        # serializa las escrituras del diario; se toma siempre antes que _lock
+        self._io_lock = threading.Lock()
+        # hasta dónde se ha leído/escrito el diario y la firma del snapshot:
+        # poll_changes() distingue así lo que ha escrito otro programa
+        self._journal_pos = 0
+        self._journal_ino = None
+        self._snap_sig = None
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._source = None
+        # cubo por días, disponible tras load()
+        self.rollup = None
+
+    def attach(self, source):
+        # source() -> (sections, current, sessions, rollup) del estado en memoria
+        self._source = source
+
+    # ---------- carga ----------
+    @timed("load_data (json)")
+    def load(self, archive_old=True):
+        if not self._flock.held and not self._flock.acquire(blocking=False):
+            raise StoreLocked(
+                f"{self.data_file} está abierto por otro proceso; "
+                "para varios usuarios a la vez usa LABOURA_STORE=sqlite")
+        # una recarga tiene que ver también lo que aún no se había escrito
+        self.flush()
+        with self._io_lock, self._lock:
+            # el diario puede haber sido sustituido: el descriptor viejo
+            # escribiría en un fichero que ya nadie lee
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+        sections = defaultdict(lambda: defaultdict(int))
+        current, sessions, declared, rollup = None, [], {}, None
+        snap_seq = 0
+        stale = False  # snapshot leído bien pero con el cubo de una versión anterior
+        if self.data_file.exists():
+            try:
+                raw, self.format = read_payload(self.data_file)
+                sessions = [Session.from_dict(d) for d in raw.get("sessions", [])]
+                current = raw.get("current", None)
+                declared = raw.get("sections", {}) or {}
+                snap_seq = int(raw.get("seq", 0))
+            except Exception as e:
+                # nunca seguir con un estado vacío: la siguiente compactación
+                # sobrescribiría el snapshot y se perdería el histórico
+                raise RuntimeError(f"no se puede leer {self.data_file}: {e}") from e
+            if "rollup" in raw and raw.get("rollup_version", 1) == DayRollup.VERSION:
+                rollup = DayRollup.from_rows(raw["rollup"])
+            else:
+                stale = True
+        self.seq = snap_seq
+        self._records = 0
+        self._snap_sig = self._stat_sig(self.data_file)
+        st = self._stat_sig(self.journal_file)
+        self._journal_ino, self._journal_pos = st[:2] if st else (None, 0)
+        self._journal_size = self._journal_pos
+        # en una recarga el manifiesto puede haber cambiado
+        self.archive = MonthArchive(self.archive_dir)
+        tail = [rec for rec in self._read_journal() if rec.get("seq", 0) > snap_seq]
+        # segmentos con sesiones que el diario edita o borra: se leen para
+        # reaplicar esos registros y se vuelven a archivar abajo
+        touched = self._touched_months(tail, sessions)
+        for _, _, rows in self.archive.read(touched):
+            sessions.extend(rows)
+        for rec in tail:
+            current = self._replay(rec, declared, current, sessions, rollup)
+            if rec.get("op") in RENAME_OPS:
+                self.archive.note_rename(rec)
+            self.seq = rec["seq"]
+            self._records += 1
+        if rollup is None:
+            # snapshot sin cubo o de una versión anterior: se construye una
+            # vez con todas las sesiones, también las archivadas
+            rollup = DayRollup(sessions)
+            rest = [m for m in self.archive.months() if m not in touched]
+            for _, _, rows in self.archive.read(rest):
+                rollup.add_many(rows)
+        self.rollup = rollup
+        # los totales cubren también el histórico archivado
+        sections = self.rollup.totals()
+        # secciones/subdivisiones creadas sin sesiones todavía
+        for sec, subs in declared.items():
+            for sub in subs:
+                sections[sec][sub] += 0
+            _ = sections[sec]
+        if archive_old:
+            sessions = self._archive_old(sessions, sections, current, touched, stale)
+        self._save_header(sections, current, self.seq)
+        return sections, current, sessions
+
+    def _touched_months(self, tail, sessions):
+        known = {s.uid for s in sessions}
+        months, unknown = set(), set()
+        for rec in tail:
+            op = rec.get("op")
+            if op == "add" and rec["session"].get("id"):
+                known.add(session_uid(rec["session"]["id"]))
+            elif op == "import":
+                known.update(session_uid(d["id"]) for d in rec["sessions"] if d.get("id"))
+            elif op in EDIT_OPS:
+                months.update(rec.get("months", ()))
+                unknown.update(u for u in map(session_uid, _record_ids(rec)) if u not in known)
+        months &= set(self.archive.manifest["segments"])
+        if unknown:
+            # registros sin pista de mes (p. ej. de otro programa): se buscan
+            for _, _, rows in self.archive.read(sorted(months)):
+                unknown.difference_update(s.uid for s in rows)
+            if unknown:
+                months.update(self.archive.find(unknown, skip=months))
+        return sorted(months)
+
+    def _archive_old(self, sessions, sections, current, touched, force=False):
+        # meses cerrados (y los segmentos leídos para el diario) fuera de data.json;
+        # force: guardar el snapshot aunque no haya nada que archivar
+        cut = self.archive.cutoff_ts()
+        old = [s for s in sessions if s.start_ts < cut]
+        drops, pending, _ = self.archive.take()
+        if not old and not touched and not pending and not force:
+            return sessions
+        groups = defaultdict(list)
+        for s in old:
+            groups[month_of(s.start_ts)].append(s)
+        self.archive.write(groups, dict.fromkeys(touched), drops, pending, adopt=False)
+        hot = [s for s in sessions if s.start_ts >= cut]
+        save_data(sections, current, hot, seq=self.seq, path=self.data_file,
+                  rollup=self.rollup.rows(), fmt=self.format)
+        self._snap_sig = self._stat_sig(self.data_file)
+        return hot
+
+    def load_header(self):
+        # Secciones y sesión en curso sin leer el snapshot: cabecera + cola del
+        # diario. Es sólo una vista previa; load() sigue siendo la referencia.
+        try:
+            head = json.loads(self.head_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        sections = {sec: dict.fromkeys(subs, 0) for sec, subs in head.get("sections", {}).items()}
+        current = head.get("current")
+        seq = int(head.get("seq", 0))
+        for rec in self._read_journal():
+            if rec.get("seq", 0) <= seq:
+                continue
+            op = rec.get("op")
+            if op in ("add", "update"):
+                s = rec["session"]
+                sections.setdefault(s["section"], {}).setdefault(s["sub"], 0)
+            elif op in ("import", "update_many"):
+                for s in rec["sessions"]:
+                    sections.setdefault(s["section"], {}).setdefault(s["sub"], 0)
+            elif op == "rename_section":
+                subs = sections.pop(rec["old"], None)
+                if subs is not None:
+                    sections.setdefault(rec["new"], {}).update(subs)
+            elif op == "rename_sub":
+                subs = sections.get(rec["section"], {})
+                if subs.pop(rec["old"], None) is not None:
+                    subs.setdefault(rec["new"], 0)
+            elif op == "add_section":
+                sections.setdefault(rec["name"], {})
+            elif op == "add_sub":
+                sections.setdefault(rec["section"], {}).setdefault(rec["name"], 0)
+            elif op == "current":
+                current = rec["current"]
+        return sections, current
+
+    def _save_header(self, sections, current, seq):
+        try:
+            save_header(sections, current, seq, self.head_file)
+        except OSError as e:
+            print("WARN header:", e)
+
+    @staticmethod
+    def _stat_sig(path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _read_journal(self):
+        for path in (self.rotated_file, self.journal_file):
+            if not path.exists():
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        # línea truncada por un cierre inesperado
+                        print("WARN journal:", path, e)
+
+    @staticmethod
+    def _partial_tail(path):
+        # True si el fichero acaba sin salto de línea (registro truncado)
+        try:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    @staticmethod
+    def _replay(rec, declared, current, sessions, rollup=None):
+        op = rec.get("op")
+        if op == "add":
+            new = Session.from_dict(rec["session"])
+            sessions.append(new)
+            if rollup is not None:
+                rollup.add(new)
+        elif op == "import":
+            new = [Session.from_dict(d) for d in rec["sessions"]]
+            sessions.extend(new)
+            if rollup is not None:
+                rollup.add_many(new)
+        elif op == "update":
+            new = Session.from_dict(rec["session"])
+            for i, s in enumerate(sessions):
+                if s.uid == new.uid:
+                    sessions[i] = new
+                    if rollup is not None:
+                        rollup.replace(s, new)
+                    break
+            else:
+                # como apply_change(): una sesión desconocida se añade
+                sessions.append(new)
+                if rollup is not None:
+                    rollup.add(new)
+        elif op == "update_many":
+            new = {s.uid: s for s in map(Session.from_dict, rec["sessions"])}
+            for i, s in enumerate(sessions):
+                if s.uid in new:
+                    sessions[i] = new.pop(s.uid)
+                    if rollup is not None:
+                        rollup.replace(s, sessions[i])
+            sessions.extend(new.values())
+            if rollup is not None:
+                rollup.add_many(list(new.values()))
+        elif op == "delete":
+            uids = {session_uid(i) for i in rec["ids"]}
+            if rollup is not None:
+                rollup.remove_many([s for s in sessions if s.uid in uids])
+            sessions[:] = [s for s in sessions if s.uid not in uids]
+        elif op == "move":
+            uids = {session_uid(i) for i in rec["ids"]}
+            for i, s in enumerate(sessions):
+                if s.uid in uids:
+                    sessions[i] = s.moved(rec["section"], rec["sub"])
+                    if rollup is not None:
+                        rollup.replace(s, sessions[i])
+        elif op == "remap":
+            mapping = remap_mapping(rec["pairs"])
+            remap_sessions(sessions, mapping)
+            if rollup is not None:
+                rollup.remap(mapping)
+            _rename_totals(declared, rec)
+        elif op == "rename_section":
+            new = sys.intern(rec["new"])
+            for s in sessions:
+                if s.section == rec["old"]:
+                    s.section = new
+            if rollup is not None:
+                rollup.rename_section(rec["old"], rec["new"])
+            if rec["old"] in declared:
+                subs = declared.pop(rec["old"])
+                declared.setdefault(rec["new"], {}).update(subs)
+        elif op == "rename_sub":
+            new = sys.intern(rec["new"])
+            for s in sessions:
+                if s.section == rec["section"] and s.sub == rec["old"]:
+                    s.sub = new
+            if rollup is not None:
+                rollup.rename_sub(rec["section"], rec["old"], rec["new"])
+            subs = declared.get(rec["section"], {})
+            if rec["old"] in subs:
+                subs.pop(rec["old"])
+                subs.setdefault(rec["new"], 0)
+        elif op == "add_section":
+            declared.setdefault(rec["name"], {})
+        elif op == "add_sub":
+            declared.setdefault(rec["section"], {}).setdefault(rec["name"], 0)
+        elif op == "current":
+            current = rec["current"]
+        return current
+
+    # ---------- mutaciones ----------
+    def add_session(self, session):
+        self._append({"op": "add", "session": session.to_dict()})
+
+    def import_sessions(self, sessions):
+        # un único registro: la importación entra entera o no entra
+        self._append({"op": "import", "sessions": [s.to_dict() for s in sessions]})
+
+    def update_session(self, session):
+        rec = {"op": "update", "session": session.to_dict()}
+        self._hint(rec, [session.uid])
+        self._append(rec)
+
+    def update_sessions(self, sessions):
+        rec = {"op": "update_many", "sessions": [s.to_dict() for s in sessions]}
+        self._hint(rec, [s.uid for s in sessions])
+        self._append(rec)
+
+    def delete_sessions(self, ids):
+        rec = {"op": "delete", "ids": list(ids)}
+        self._hint(rec, [session_uid(i) for i in rec["ids"]])
+        self._append(rec)
+
+    def rename_section(self, old, new):
+        if old != new:
+            self._append({"op": "rename_section", "old": old, "new": new})
+
+    def rename_sub(self, section, old, new):
+        if old != new:
+            self._append({"op": "rename_sub", "section": section, "old": old, "new": new})
+
+    def remap(self, pairs):
+        # un solo registro para todo el lote (ver remap_mapping)
+        pairs = [list(p) for p in pairs]
+        if remap_mapping(pairs):
+            self._append({"op": "remap", "pairs": pairs})
+
+    def move_sessions(self, ids, section, sub):
+        rec = {"op": "move", "ids": list(ids), "section": section, "sub": sub}
+        self._hint(rec, [session_uid(i) for i in rec["ids"]])
+        self._append(rec)
+
+    def add_section(self, name):
+        self._append({"op": "add_section", "name": name})
+
+    def add_sub(self, section, name):
+        self._append({"op": "add_sub", "section": section, "name": name})
+
+    def set_current(self, current):
+        self._append({"op": "current", "current": current})
+
+    def _hint(self, rec, uids):
+        # meses archivados que guardan estas sesiones: la compactación
+        # reescribe esos segmentos y, tras un cierre inesperado, load() sabe
+        # cuáles leer para reaplicar el registro
+        months = self.archive.hint(uids)
+        if months:
+            rec["months"] = months
+
+    def _append(self, rec):
+        # el estado en memoria (source) ya debe incluir esta mutación: puede
+        # compactarse justo a continuación
+        with self._lock:
+            self.seq += 1
+            rec["seq"] = self.seq
+            count(f"diario: {rec['op']}")
+            if rec["op"] in RENAME_OPS:
+                # los segmentos sin cargar lo aplican al leerse
+                self.archive.note_rename(rec)
+            self._queue.append(rec)
+            # la sesión en curso no puede perderse en un cierre inesperado:
+            # se escribe ya, junto con todo lo anterior (y las importaciones)
+            now = rec["op"] in ("current", "import")
+            if not now and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.FLUSH_MS / 1000, self.flush)
+                self._flush_timer.start()
+            self._records += 1
+            due = (self._records >= self.COMPACT_RECORDS
+                   or self._journal_size >= self.COMPACT_BYTES)
+        if now:
+            self.flush()
+        if due:
+            self.compact()
+
+    def flush(self):
+        # escribe los registros pendientes; vuelve cuando están en disco
+        with self._io_lock:
+            self._write_queue()
+
+    @timed("diario: escritura")
+    def _write_queue(self):
+        # con _io_lock tomado: una sola escritura y un fsync para el lote
+        with self._lock:
+            batch, self._queue = self._queue, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not batch:
+            return
+        data = "".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in batch)
+        if self._fh is None:
+            if self._partial_tail(self.journal_file):
+                # línea a medias de un cierre inesperado: lo nuevo en su propia línea
+                data = "\n" + data
+            self._fh = open(self.journal_file, "a", encoding="utf-8")
+        before = os.fstat(self._fh.fileno())
+        self._fh.write(data)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        count("diario: fsync")
+        with self._lock:
+            self._journal_size = self._fh.tell()
+            if before.st_size == self._journal_pos:
+                # si otro programa añadió algo, poll_changes() lo leerá junto
+                # con este lote (reaplicarlo no cambia nada)
+                self._journal_pos = self._journal_size
+                self._journal_ino = before.st_ino
+
+    # ---------- compactación ----------
+    def compact(self, wait=False):
+        if self._source is None:
+            return
+        with self._io_lock:
+            # lo pendiente va al diario que se rota: el snapshot lo incluye
+            self._write_queue()
+            with self._lock:
+                if self._compactor is not None and self._compactor.is_alive():
+                    return
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                if self.rotated_file.exists():
+                    # quedó una compactación anterior a medias: se reintenta con ambos
+                    if self.journal_file.exists():
+                        with open(self.rotated_file, "a", encoding="utf-8") as dst:
+                            if self._partial_tail(self.rotated_file):
+                                dst.write("\n")
+                            dst.write(self.journal_file.read_text(encoding="utf-8"))
+                        self.journal_file.unlink()
+                elif self.journal_file.exists():
+                    os.replace(self.journal_file, self.rotated_file)
+                self._journal_pos, self._journal_ino, self._journal_size = 0, None, 0
+                sections, current, sessions, rollup = self._source()
+                # copia en el hilo de la GUI; serializar y escribir va en segundo plano
+                snap = (
+                    {s: dict(subs) for s, subs in sections.items()},
+                    dict(current) if current else None,
+                    [s.astuple() for s in sessions],
+                    self.seq,
+                    rollup.rows() if rollup is not None else None,
+                    *self.archive.take(),
+                )
+                self._records = 0
+                self._compactor = threading.Thread(
+                    target=self._write_snapshot, args=snap, name="journal-compact"
+                )
+                self._compactor.start()
+        if wait:
+            self._compactor.join()
+
+    @timed("compactación")
+    def _write_snapshot(self, sections, current, rows, seq, rollup, drops, pending, loaded):
+        try:
+            # data.json sólo guarda los meses calientes; el resto va a su segmento
+            cut = self.archive.cutoff_ts()
+            hot, groups = [], defaultdict(list)
+            for t in rows:
+                s = Session.from_tuple(t)
+                if s.start_ts >= cut:
+                    hot.append(s)
+                else:
+                    groups[month_of(s.start_ts)].append(s)
+            if groups or drops or pending or loaded:
+                self.archive.write(groups, loaded, drops, pending)
+            save_data(sections, current, hot, seq=seq, path=self.data_file, rollup=rollup, fmt=self.format)
+            self._snap_sig = self._stat_sig(self.data_file)
+            self.rotated_file.unlink(missing_ok=True)
+            self._save_header(sections, current, seq)
+        except Exception as e:
+            print("WARN compact:", e)
+
+    # ---------- consultas (sobre el estado en memoria) ----------
+    def query_sessions(self, section=None, sub=None, start_ts=None, end_ts=None):
+        return filter_sessions(self._source()[2], section, sub, start_ts, end_ts)
+
+    def iter_sessions(self, section=None, sub=None, start_ts=None, end_ts=None):
+        # lo que está en memoria mezclado con los meses archivados del rango
+        # sin cargar, que se leen de uno en uno y en orden (cada segmento
+        # sólo tiene sesiones que empiezan en su mes)
+        hot = sorted(self.query_sessions(section, sub, start_ts, end_ts), key=attrgetter("start_ts"))
+        months = self.archive.months(start_ts, end_ts)
+        if not months:
+            return iter(hot)
+        mem = self._source()[2]
+
+        def archived():
+            for m in months:
+                for _, _, seg in self.archive.read([m]):
+                    rows = [s for s in filter_sessions(seg, section, sub, start_ts, end_ts)
+                            if mem.get(s.uid) is None]
+                    rows.sort(key=attrgetter("start_ts"))
+                    yield from rows
+
+        return heapq.merge(hot, archived(), key=attrgetter("start_ts"))
+
+    def totals(self):
+        return self.rollup.totals()
+
+    # ---------- histórico archivado ----------
+    def archived_months(self, start_ts=None, end_ts=None):
+        return self.archive.months(start_ts, end_ts)
+
+    def read_months(self, months):
+        # en un hilo de trabajo; adopt_months() en el de la GUI
+        return self.archive.read(months)
+
+    def adopt_months(self, parts, present):
+        return self.archive.adopt(parts, present)
+
+    def watch_paths(self):
+        return [self.data_file, self.journal_file]
+
+    @timed("poll_changes")
+    def poll_changes(self):
+        # Registros que otro programa (un sincronizador, un script) haya
+        # añadido al diario desde la última lectura o escritura propia. None
+        # si han sustituido el snapshot o el diario y hay que recargar.
+        with self._io_lock, self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return []
+            if self._stat_sig(self.data_file) != self._snap_sig:
+                return None
+            st = self._stat_sig(self.journal_file)
+            ino, size = st[:2] if st else (None, 0)
+            if size < self._journal_pos or (self._journal_pos and ino != self._journal_ino):
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                return None
+            if size == self._journal_pos:
+                return []
+            with open(self.journal_file, "rb") as f:
+                f.seek(self._journal_pos)
+                chunk = f.read(size - self._journal_pos)
+            # la última línea puede estar a medio escribir: se deja para después
+            end = chunk.rfind(b"\n") + 1
+            recs = []
+            for line in chunk[:end].splitlines():
+                try:
+                    rec = json.loads(line)
+                except ValueError as e:
+                    print("WARN journal:", self.journal_file, e)
+                    continue
+                if rec.get("seq", 0) > self.seq:
+                    self.seq = rec["seq"]
+                recs.append(rec)
+            self._journal_pos += end
+            self._journal_ino = ino
+            self._records += len(recs)
+        mem = self._source()[2] if self._source is not None else None
+        unknown = False
+        for rec in recs:
+            op = rec.get("op")
+            if op in RENAME_OPS:
+                self.archive.note_rename(rec)
+            elif op in EDIT_OPS and mem is not None:
+                uids = [session_uid(i) for i in _record_ids(rec)]
+                # una sesión archivada sin cargar: sin la versión anterior no
+                # se pueden corregir totales y cubo, mejor recargar
+                unknown |= any(mem.get(u) is None for u in uids)
+                self.archive.hint(uids)
+        return None if unknown else recs
+
+    def close(self):
+        self.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+        self._flock.release()
+
+
+def convert_data(fmt, path=None):
+    # Reescribe el snapshot en otro formato compactando el diario; sólo con
+    # el almacén cerrado. Devuelve el formato que tenía (None si no había).
+    formats.get_format(fmt)
+    store = JournalStore(path)
+    try:
+        old = read_payload(store.data_file)[1] if store.data_file.exists() else None
+        sections, current, sessions = store.load()
+        store.attach(lambda: (sections, current, sessions, store.rollup))
+        store.format = fmt
+        store.compact(wait=True)
+    finally:
+        store.close()
+    return old
@@ -0,0 +1,572 @@
+# laboura/store_sqlite.py
+# Almacén SQLite (LABOURA_STORE=sqlite): consultas indexadas, varios
+# procesos/usuarios sobre la misma data.db y registro de cambios.
+import time, json, uuid, threading, sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from collections import defaultdict
+
+from .core import (
+    DATA_FILE, JOURNAL_FILE, DB_FILE, SQLITE_WAL, CSV_CHUNK, RENAME_OPS, LONG_SESSION,
+    Session, DayRollup, FileLock, current_user, day_split, remap_mapping,
+)
+from .profiling import timed, span
+from .store_json import JournalStore
+
+
+# ============== almacenamiento (SQLite) ==============
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id        TEXT PRIMARY KEY,
+    section   TEXT NOT NULL,
+    sub       TEXT NOT NULL,
+    start_ts  REAL NOT NULL,
+    end_ts    REAL NOT NULL,
+    seconds   INTEGER NOT NULL,
+    start_iso TEXT,
+    end_iso   TEXT,
+    user      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start_ts);
+CREATE INDEX IF NOT EXISTS idx_sessions_sec_sub ON sessions(section, sub, start_ts);
+-- sesiones de más de LONG_SESSION segundos (mismo literal que LONG_WHERE)
+CREATE INDEX IF NOT EXISTS idx_sessions_long ON sessions(end_ts) WHERE end_ts - start_ts > 86400;
+CREATE TABLE IF NOT EXISTS totals (
+    section TEXT NOT NULL,
+    sub     TEXT NOT NULL,
+    seconds INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (section, sub)
+);
+CREATE TABLE IF NOT EXISTS sections (name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS rollup (
+    day     INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    sub     TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    n       INTEGER NOT NULL,
+    PRIMARY KEY (day, section, sub)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS changes (
+    seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+    writer TEXT NOT NULL,
+    user   TEXT,
+    ts     REAL NOT NULL,
+    data   TEXT NOT NULL
+);
+"""
+
+# las 7 primeras son los campos de Session
+SESSION_COLS = ("id", "section", "sub", "start_ts", "end_ts", "seconds", "user", "start_iso", "end_iso")
+SESSION_SELECT = f"SELECT {', '.join(SESSION_COLS[:7])} FROM sessions"
+LONG_WHERE = f"end_ts - start_ts > {LONG_SESSION}"
+
+
+class SqliteStore:
+    # Misma interfaz que JournalStore, pero cada mutación es una actualización
+    # de filas indexadas y los totales viven materializados en la tabla totals.
+    # Admite varios procesos escribiendo a la vez: cada escritura es una
+    # transacción BEGIN IMMEDIATE bajo un lock de fichero, y además deja una
+    # fila en `changes` que los demás procesos leen con poll_changes().
+    CHANGES_KEEP = 50000
+    BUSY_TIMEOUT = 30
+    IMPORT_LOG_CHUNK = 1000
+    # Los renombrados no conmutan con cambios ajenos todavía sin leer: quien
+    # los use debe escribirlos primero y aplicarlos después vía poll_changes().
+    SHARED = True
+
+    def __init__(self, db_file=None, json_file=None, journal_file=None, user=None):
+        self.db_file = Path(db_file or DB_FILE)
+        self.json_file = Path(json_file or DATA_FILE)
+        self.journal_file = Path(journal_file or JOURNAL_FILE)
+        self.user = user or current_user()
+        self.writer = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._flock = FileLock(self.db_file.with_name(self.db_file.name + ".lock"))
+        self.db = sqlite3.connect(self.db_file, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        if SQLITE_WAL:
+            self.db.execute("PRAGMA journal_mode=WAL")
+        with self._flock:
+            self.db.executescript(SQLITE_SCHEMA)
+            cols = {r["name"] for r in self.db.execute("PRAGMA table_info(sessions)")}
+            if "user" not in cols:
+                # bases anteriores a la atribución por usuario
+                self.db.execute("ALTER TABLE sessions ADD COLUMN user TEXT")
+                self.db.commit()
+        self._change_seq = 0
+        self.rollup = None
+
+    def attach(self, source):
+        pass
+
+    @contextmanager
+    def _write(self):
+        # lock del hilo + lock de fichero entre procesos + BEGIN IMMEDIATE: las
+        # lecturas-modificaciones-escrituras (totales, cubo) no se pisan
+        with span("sqlite: transacción"), self._lock, self._flock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.db.rollback()
+                raise
+            self.db.commit()
+
+    def flush(self):
+        # cada escritura ya es una transacción confirmada: otros procesos
+        # tienen que ver los cambios en orden de commit
+        pass
+
+    def _log(self, rec):
+        self.db.execute(
+            "INSERT INTO changes (writer, user, ts, data) VALUES (?, ?, ?, ?)",
+            (self.writer, self.user, time.time(), json.dumps(rec, ensure_ascii=False)))
+
+    @property
+    def _current_key(self):
+        # cada usuario tiene su propia sesión en curso
+        return f"current:{self.user}"
+
+    # ---------- carga / migración ----------
+    @timed("load_data (sqlite)")
+    def load(self):
+        if self._meta("schema") is None:
+            self._migrate_from_json()
+        if self._meta("rollup") != str(DayRollup.VERSION):
+            # bases anteriores al cubo por días (o a su reparto por
+            # intervalo): se rellena una vez
+            with self._write():
+                rollup = DayRollup(Session(*r) for r in self.db.execute(SESSION_SELECT))
+                self.db.execute("DELETE FROM rollup")
+                self.db.executemany(
+                    "INSERT INTO rollup (day, section, sub, seconds, n) VALUES (?, ?, ?, ?, ?)",
+                    rollup.rows())
+                self._set_meta("rollup", str(DayRollup.VERSION))
+        if self.db.execute("SELECT 1 FROM meta WHERE key = 'current'").fetchone():
+            # la sesión en curso era global: pasa a ser la de este usuario
+            with self._write():
+                if self._meta(self._current_key) is None:
+                    self._set_meta(self._current_key, self._meta("current"))
+                self.db.execute("DELETE FROM meta WHERE key = 'current'")
+        with self._lock:
+            # una sola transacción de lectura: sesiones, totales, cubo y el
+            # último cambio incluido son la misma foto aunque otros escriban
+            self.db.execute("BEGIN")
+            try:
+                self._change_seq = self.db.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+                sessions = [Session(*r) for r in self.db.execute(SESSION_SELECT + " ORDER BY rowid")]
+                self.rollup = DayRollup.from_rows(
+                    tuple(r) for r in self.db.execute("SELECT day, section, sub, seconds, n FROM rollup"))
+                totals = self._totals()
+                cur = self._meta(self._current_key)
+            finally:
+                self.db.commit()
+        self._prune_changes()
+        return totals, (json.loads(cur) if cur else None), sessions
+
+    def load_header(self):
+        # secciones (con totales materializados) y sesión en curso, sin sesiones
+        with self._lock:
+            if self._meta("schema") is None:
+                return None
+            cur = self._meta(self._current_key)
+        return self.totals(), (json.loads(cur) if cur else None)
+
+    def _migrate_from_json(self):
+        # Migración única desde data.json (+ diario); data.json no se toca
+        sections, current, sessions = {}, None, []
+        if self.json_file.exists() or self.journal_file.exists():
+            js = JournalStore(self.json_file, self.journal_file)
+            try:
+                sections, current, sessions = js.load(archive_old=False)
+                # el histórico archivado por meses también pasa a la base
+                present = {s.uid for s in sessions}
+                for _, _, rows in js.read_months(js.archived_months()):
+                    sessions.extend(s for s in rows if s.uid not in present)
+            finally:
+                js.close()
+        with self._write():
+            if self._meta("schema") is not None:
+                return  # otro proceso migró mientras tanto
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO sessions ({', '.join(SESSION_COLS)}) "
+                f"VALUES ({', '.join('?' * len(SESSION_COLS))})",
+                (self._row(s) for s in sessions))
+            self.db.execute("DELETE FROM totals")
+            self.db.execute(
+                "INSERT INTO totals (section, sub, seconds) "
+                "SELECT section, sub, SUM(seconds) FROM sessions GROUP BY section, sub")
+            for sec, subs in sections.items():
+                self.db.execute("INSERT OR IGNORE INTO sections (name) VALUES (?)", (sec,))
+                for sub in subs:
+                    self.db.execute(
+                        "INSERT OR IGNORE INTO totals (section, sub, seconds) VALUES (?, ?, 0)",
+                        (sec, sub))
+            self.db.execute(
+                "INSERT OR IGNORE INTO sections (name) SELECT DISTINCT section FROM totals")
+            self._set_meta(self._current_key, json.dumps(current) if current else None)
+            self._set_meta("schema", "1")
+        if sessions:
+            print(f"INFO: migradas {len(sessions)} sesiones de {self.json_file} a {self.db_file}")
+
+    @staticmethod
+    def _row(s):
+        return (s.id, s.section, s.sub, s.start_ts, s.end_ts, s.seconds, s.user, s.start_iso, s.end_iso)
+
+    def _meta(self, key):
+        r = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return r[0] if r else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _add_total(self, section, sub, seconds):
+        self.db.execute("INSERT OR IGNORE INTO sections (name) VALUES (?)", (section,))
+        self.db.execute(
+            "INSERT INTO totals (section, sub, seconds) VALUES (?, ?, ?) "
+            "ON CONFLICT(section, sub) DO UPDATE SET seconds = seconds + excluded.seconds",
+            (section, sub, int(seconds)))
+
+    def _add_rollup(self, section, sub, start_ts, end_ts, seconds, sign=1):
+        for day, secs in day_split(start_ts, end_ts, int(seconds)):
+            key = (day, section, sub)
+            self.db.execute(
+                "INSERT INTO rollup (day, section, sub, seconds, n) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(day, section, sub) DO UPDATE SET "
+                "seconds = seconds + excluded.seconds, n = n + excluded.n",
+                key + (sign * secs, sign))
+            if sign < 0:
+                self.db.execute(
+                    "DELETE FROM rollup WHERE day = ? AND section = ? AND sub = ? AND n <= 0", key)
+
+    def _add_cube(self, cube):
+        # deltas ya agrupados {(día, sección, sub): [segundos, n]} de una vez
+        self.db.executemany(
+            "INSERT INTO rollup (day, section, sub, seconds, n) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, section, sub) DO UPDATE SET "
+            "seconds = seconds + excluded.seconds, n = n + excluded.n",
+            (key + tuple(v) for key, v in cube.items() if v[0] or v[1]))
+        self.db.executemany(
+            "DELETE FROM rollup WHERE day = ? AND section = ? AND sub = ? AND n <= 0",
+            (key for key, v in cube.items() if v[1] < 0))
+
+    def _apply_deltas(self, removed=(), added=()):
+        # totales y cubo de golpe a partir de filas (sección, sub, inicio, fin, segundos)
+        totals, cube = defaultdict(int), defaultdict(lambda: [0, 0])
+        for rows, sign in ((removed, -1), (added, 1)):
+            for sec, sub, start_ts, end_ts, secs in rows:
+                totals[(sec, sub)] += sign * int(secs)
+                for day, part in day_split(start_ts, end_ts, int(secs)):
+                    v = cube[(day, sec, sub)]
+                    v[0] += sign * part
+                    v[1] += sign
+        for (sec, sub), secs in totals.items():
+            self._add_total(sec, sub, secs)
+        self._add_cube(cube)
+
+    def _id_table(self, ids):
+        # tabla temporal con los ids para usar en WHERE id IN (SELECT id FROM ids)
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY)")
+        self.db.execute("DELETE FROM ids")
+        self.db.executemany("INSERT OR IGNORE INTO ids (id) VALUES (?)", ((i,) for i in ids))
+
+    def _rekey_rollup(self, section, sub, new_section, new_sub):
+        # mueve filas del cubo a otra clave sumando si ya existe; sub=None: toda la sección
+        where = "section = ?" + ("" if sub is None else " AND sub = ?")
+        args = (section,) if sub is None else (section, sub)
+        self.db.execute(
+            "INSERT INTO rollup (day, section, sub, seconds, n) "
+            f"SELECT day, ?, {'sub' if new_sub is None else '?'}, seconds, n FROM rollup "
+            f"WHERE {where} ORDER BY day "
+            "ON CONFLICT(day, section, sub) DO UPDATE SET "
+            "seconds = seconds + excluded.seconds, n = n + excluded.n",
+            (new_section,) + (() if new_sub is None else (new_sub,)) + args)
+        self.db.execute(f"DELETE FROM rollup WHERE {where}", args)
+
+    # ---------- mutaciones ----------
+    def add_session(self, session):
+        with self._write():
+            self.db.execute(
+                f"INSERT INTO sessions ({', '.join(SESSION_COLS)}) "
+                f"VALUES ({', '.join('?' * len(SESSION_COLS))})", self._row(session))
+            self._add_total(session.section, session.sub, session.seconds)
+            self._add_rollup(session.section, session.sub, session.start_ts, session.end_ts,
+                             session.seconds)
+            self._log({"op": "add", "session": session.to_dict()})
+
+    def import_sessions(self, sessions):
+        # una transacción; totales y cubo se suman ya agrupados
+        with self._write():
+            self.db.executemany(
+                f"INSERT INTO sessions ({', '.join(SESSION_COLS)}) "
+                f"VALUES ({', '.join('?' * len(SESSION_COLS))})", map(self._row, sessions))
+            self._apply_deltas(added=[(s.section, s.sub, s.start_ts, s.end_ts, s.seconds)
+                                      for s in sessions])
+            # el registro de cambios en trozos: filas de tamaño razonable
+            for i in range(0, len(sessions), self.IMPORT_LOG_CHUNK):
+                self._log({"op": "import", "sessions": [
+                    s.to_dict() for s in sessions[i:i + self.IMPORT_LOG_CHUNK]]})
+
+    def update_session(self, session):
+        with self._write():
+            old = self.db.execute(
+                "SELECT section, sub, start_ts, end_ts, seconds FROM sessions WHERE id = ?",
+                (session.id,)).fetchone()
+            if old is None:
+                return
+            self.db.execute(
+                f"UPDATE sessions SET {', '.join(c + ' = ?' for c in SESSION_COLS[1:])} WHERE id = ?",
+                self._row(session)[1:] + (session.id,))
+            self._log({"op": "update", "session": session.to_dict()})
+            self._add_total(old["section"], old["sub"], -old["seconds"])
+            self._add_total(session.section, session.sub, session.seconds)
+            self._add_rollup(old["section"], old["sub"], old["start_ts"], old["end_ts"],
+                             old["seconds"], -1)
+            self._add_rollup(session.section, session.sub, session.start_ts, session.end_ts,
+                             session.seconds)
+
+    def delete_sessions(self, ids):
+        ids = list(ids)
+        with self._write():
+            self._log({"op": "delete", "ids": ids})
+            self._id_table(ids)
+            gone = self.db.execute(
+                "SELECT section, sub, start_ts, end_ts, seconds FROM sessions "
+                "WHERE id IN (SELECT id FROM ids)").fetchall()
+            self.db.execute("DELETE FROM sessions WHERE id IN (SELECT id FROM ids)")
+            self._apply_deltas([tuple(r) for r in gone])
+
+    def rename_section(self, old, new):
+        if old == new:
+            return
+        with self._write():
+            self._log({"op": "rename_section", "old": old, "new": new})
+            self.db.execute("UPDATE sessions SET section = ? WHERE section = ?", (new, old))
+            self.db.execute(
+                "INSERT INTO totals (section, sub, seconds) "
+                "SELECT ?, sub, seconds FROM totals WHERE section = ? "
+                "ON CONFLICT(section, sub) DO UPDATE SET seconds = seconds + excluded.seconds",
+                (new, old))
+            self.db.execute("DELETE FROM totals WHERE section = ?", (old,))
+            self.db.execute("DELETE FROM sections WHERE name = ?", (old,))
+            self.db.execute("INSERT OR IGNORE INTO sections (name) VALUES (?)", (new,))
+            self._rekey_rollup(old, None, new, None)
+
+    def rename_sub(self, section, old, new):
+        if old == new:
+            return
+        with self._write():
+            self._log({"op": "rename_sub", "section": section, "old": old, "new": new})
+            self.db.execute(
+                "UPDATE sessions SET sub = ? WHERE section = ? AND sub = ?", (new, section, old))
+            row = self.db.execute(
+                "SELECT seconds FROM totals WHERE section = ? AND sub = ?", (section, old)).fetchone()
+            self.db.execute("DELETE FROM totals WHERE section = ? AND sub = ?", (section, old))
+            self._add_total(section, new, row[0] if row else 0)
+            self._rekey_rollup(section, old, section, new)
+
+    def remap(self, pairs):
+        # todo el lote en una transacción; cada pareja sólo toca sus filas
+        # (índice por sección/subdivisión), exactas primero
+        pairs = [list(p) for p in pairs]
+        mapping = remap_mapping(pairs)
+        if not mapping:
+            return
+        with self._write():
+            self._log({"op": "remap", "pairs": pairs})
+            for (sec, sub), (new_sec, new_sub) in mapping.items():
+                where = "section = ?" + ("" if sub is None else " AND sub = ?")
+                args = (sec,) if sub is None else (sec, sub)
+                self.db.execute(
+                    f"UPDATE sessions SET section = ?, sub = COALESCE(?, sub) WHERE {where}",
+                    (new_sec, new_sub) + args)
+                self.db.execute(
+                    "INSERT INTO totals (section, sub, seconds) "
+                    f"SELECT ?, COALESCE(?, sub), seconds FROM totals WHERE {where} "
+                    "ON CONFLICT(section, sub) DO UPDATE SET seconds = seconds + excluded.seconds",
+                    (new_sec, new_sub) + args)
+                self.db.execute(f"DELETE FROM totals WHERE {where}", args)
+                self.db.execute("INSERT OR IGNORE INTO sections (name) VALUES (?)", (new_sec,))
+                self._rekey_rollup(sec, sub, new_sec, new_sub)
+            # secciones de origen que se han quedado sin subdivisiones
+            self.db.executemany(
+                "DELETE FROM sections WHERE name = ? "
+                "AND NOT EXISTS (SELECT 1 FROM totals WHERE section = ?)",
+                ((sec, sec) for sec in {k[0] for k in mapping}))
+
+    def move_sessions(self, ids, section, sub):
+        # totales y cubo con los deltas agrupados de las sesiones movidas
+        ids = list(ids)
+        with self._write():
+            self._log({"op": "move", "ids": ids, "section": section, "sub": sub})
+            self._id_table(ids)
+            rows = self.db.execute(
+                "SELECT section, sub, start_ts, end_ts, seconds FROM sessions "
+                "WHERE id IN (SELECT id FROM ids)").fetchall()
+            self.db.execute(
+                "UPDATE sessions SET section = ?, sub = ? WHERE id IN (SELECT id FROM ids)",
+                (section, sub))
+            self._add_total(section, sub, 0)
+            self._apply_deltas([tuple(r) for r in rows],
+                               [(section, sub, r["start_ts"], r["end_ts"], r["seconds"]) for r in rows])
+
+    def update_sessions(self, sessions):
+        # varias sesiones editadas en una transacción (p. ej. al recortar
+        # solapes); las que ya no existen se ignoran, como en update_session
+        by_id = {s.id: s for s in sessions}
+        with self._write():
+            self._id_table(by_id)
+            old = self.db.execute(
+                "SELECT id, section, sub, start_ts, end_ts, seconds FROM sessions "
+                "WHERE id IN (SELECT id FROM ids)").fetchall()
+            new = [by_id[r["id"]] for r in old]
+            self.db.executemany(
+                f"UPDATE sessions SET {', '.join(c + ' = ?' for c in SESSION_COLS[1:])} WHERE id = ?",
+                (self._row(s)[1:] + (s.id,) for s in new))
+            self._apply_deltas([tuple(r)[1:] for r in old],
+                               [(s.section, s.sub, s.start_ts, s.end_ts, s.seconds) for s in new])
+            for i in range(0, len(new), self.IMPORT_LOG_CHUNK):
+                self._log({"op": "update_many", "sessions": [
+                    s.to_dict() for s in new[i:i + self.IMPORT_LOG_CHUNK]]})
+
+    def add_section(self, name):
+        with self._write():
+            self.db.execute("INSERT OR IGNORE INTO sections (name) VALUES (?)", (name,))
+            self._log({"op": "add_section", "name": name})
+
+    def add_sub(self, section, name):
+        with self._write():
+            self._add_total(section, name, 0)
+            self._log({"op": "add_sub", "section": section, "name": name})
+
+    def set_current(self, current):
+        with self._write():
+            self._set_meta(self._current_key, json.dumps(current) if current else None)
+
+    # ---------- cambios de otros procesos ----------
+    # ---------- histórico archivado ----------
+    # la base ya consulta por índices: no hay meses fuera de memoria que cargar
+    def archived_months(self, start_ts=None, end_ts=None):
+        return []
+
+    def read_months(self, months):
+        return []
+
+    def adopt_months(self, parts, present):
+        return []
+
+    def watch_paths(self):
+        # con WAL los commits escriben en data.db-wal
+        return [self.db_file, self.db_file.with_name(self.db_file.name + "-wal")]
+
+    @timed("poll_changes")
+    def poll_changes(self):
+        # Cambios desde la última llamada, en orden de commit y con el mismo
+        # formato que los registros del diario. Incluye los propios: reaplicar
+        # todo el registro en orden deja la memoria igual que la base aunque
+        # dos procesos hayan tocado la misma sesión. None si ya se podaron y
+        # hay que recargar entero.
+        with self._lock:
+            first = self.db.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            rows = self.db.execute(
+                "SELECT seq, writer, data FROM changes WHERE seq > ? ORDER BY seq",
+                (self._change_seq,)).fetchall()
+        if first is not None and first > self._change_seq + 1:
+            return None
+        if not rows:
+            return []
+        self._change_seq = rows[-1]["seq"]
+        recs = [json.loads(r["data"]) for r in rows]
+        if (all(r["writer"] == self.writer for r in rows)
+                and not any(rec["op"] in RENAME_OPS for rec in recs)):
+            # sólo escrituras propias, ya aplicadas en memoria en este orden
+            return []
+        return recs
+
+    def _prune_changes(self):
+        with self._lock:
+            lo, hi = self.db.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+        if lo is not None and hi - lo > 2 * self.CHANGES_KEEP:
+            with self._write():
+                self.db.execute("DELETE FROM changes WHERE seq <= ?", (hi - self.CHANGES_KEEP,))
+
+    # ---------- consultas indexadas ----------
+    def _where(self, section, sub, start_ts, end_ts):
+        # mismo criterio que filter_sessions(): las que empezaron antes de
+        # start_ts entran si seguían abiertas. El rango del índice por
+        # start_ts llega hasta LONG_SESSION antes; las más largas las da
+        # _long_before()
+        where, args = [], []
+        for col, op, val in (("section", "=", section), ("sub", "=", sub), ("start_ts", "<=", end_ts)):
+            if val is not None:
+                where.append(f"{col} {op} ?")
+                args.append(val)
+        if start_ts is not None:
+            where.append("start_ts >= ? AND (start_ts >= ? OR end_ts > ?)")
+            args.extend((start_ts - LONG_SESSION, start_ts, start_ts))
+        return where, args
+
+    def _long_before(self, section, sub, start_ts, end_ts):
+        # sesiones largas abiertas en start_ts que empezaron antes del rango
+        # de _where(): el índice parcial sólo tiene esas
+        if start_ts is None:
+            return []
+        where, args = [LONG_WHERE, "end_ts > ?", "start_ts < ?"], [start_ts, start_ts - LONG_SESSION]
+        for col, op, val in (("section", "=", section), ("sub", "=", sub), ("start_ts", "<=", end_ts)):
+            if val is not None:
+                where.append(f"{col} {op} ?")
+                args.append(val)
+        sql = (SESSION_SELECT + " INDEXED BY idx_sessions_long WHERE "
+               + " AND ".join(where) + " ORDER BY start_ts, id")
+        with self._lock:
+            return [Session(*r) for r in self.db.execute(sql, args)]
+
+    def query_sessions(self, section=None, sub=None, start_ts=None, end_ts=None):
+        where, args = self._where(section, sub, start_ts, end_ts)
+        sql = SESSION_SELECT
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        head = self._long_before(section, sub, start_ts, end_ts)
+        with self._lock:
+            return head + [Session(*r) for r in self.db.execute(sql + " ORDER BY start_ts", args)]
+
+    def iter_sessions(self, section=None, sub=None, start_ts=None, end_ts=None, chunk=CSV_CHUNK):
+        # Paginación por clave (start_ts, id): cada página es una consulta corta
+        # bajo el lock, así una exportación larga no bloquea las escrituras y
+        # sólo hay `chunk` filas en memoria a la vez.
+        where, args = self._where(section, sub, start_ts, end_ts)
+        base = SESSION_SELECT + " WHERE "
+        yield from self._long_before(section, sub, start_ts, end_ts)
+        after = None
+        while True:
+            cond = list(where)
+            page_args = list(args)
+            if after is not None:
+                cond.append("(start_ts, id) > (?, ?)")
+                page_args.extend(after)
+            sql = base + (" AND ".join(cond) or "1") + " ORDER BY start_ts, id LIMIT ?"
+            with self._lock:
+                rows = self.db.execute(sql, page_args + [chunk]).fetchall()
+            for r in rows:
+                yield Session(*r)
+            if len(rows) < chunk:
+                return
+            after = (rows[-1]["start_ts"], rows[-1]["id"])
+
+    def totals(self):
+        with self._lock:
+            return self._totals()
+
+    def _totals(self):
+        sections = defaultdict(lambda: defaultdict(int))
+        for (name,) in self.db.execute("SELECT name FROM sections"):
+            _ = sections[name]
+        for sec, sub, secs in self.db.execute("SELECT section, sub, seconds FROM totals"):
+            sections[sec][sub] = secs
+        return sections
+
+    def close(self):
+        with self._lock:
+            self.db.close()
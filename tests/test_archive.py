@@ -0,0 +1,93 @@
+import json
+from datetime import date, datetime, timedelta
+
+from laboura import Session, TotalsAggregate, recalc_totals_from_sessions
+from laboura.archive import month_of
+from laboura.cli import Workspace
+
+
+def month_start(d):
+    return datetime.combine(d.replace(day=1), datetime.min.time()).timestamp()
+
+
+# dos meses cerrados (se archivan) y el mes en curso
+THIS = date.today().replace(day=1)
+PREV = (THIS - timedelta(days=1)).replace(day=1)
+OLD = (PREV - timedelta(days=1)).replace(day=1)
+MONTHS = [month_start(OLD), month_start(PREV), month_start(THIS)]
+
+
+def add(ws, m0, n, section="Trabajo"):
+    for i in range(n):
+        sub = f"x{i % 3}"
+        ws.ensure(section, sub)
+        start = m0 + 3600 + i * 7200
+        ws.add_session(Session.new(section, sub, start, start + 600 + i))
+
+
+def everything(ws):
+    # memoria + todos los meses archivados
+    ws.load_months()
+    return sorted(s.astuple() for s in ws.sessions)
+
+
+def check(ws, tmp_path, expected):
+    assert everything(ws) == expected
+    sessions = [Session.from_tuple(t) for t in expected]
+    full = recalc_totals_from_sessions(sessions)
+    assert ws.totals.mismatches(full) == []
+    assert TotalsAggregate(ws.rollup.totals()).mismatches(full) == []
+    # el manifiesto describe lo que guarda cada segmento
+    manifest = json.loads((tmp_path / "data.archive" / "manifest.json").read_text(encoding="utf-8"))
+    segments = manifest["segments"]
+    assert sorted(segments) == sorted({month_of(t) for t in MONTHS[:2]})
+    for m, seg in segments.items():
+        rows = [s for s in sessions if month_of(s.start_ts) == m]
+        assert seg["count"] == len(rows)
+        assert seg["seconds"] == sum(s.seconds for s in rows)
+        assert TotalsAggregate(seg["totals"]).mismatches(recalc_totals_from_sessions(rows)) == []
+
+
+def test_archived_month_edit_and_rename(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ws = Workspace("json")
+    for m0 in MONTHS:
+        add(ws, m0, 12)
+    add(ws, MONTHS[0], 4, section="Casa")
+    ws.store.compact(wait=True)
+    expected = sorted(s.astuple() for s in ws.sessions)
+    ws.close()
+
+    # al reabrir sólo el mes en curso queda en memoria
+    ws = Workspace("json")
+    assert {month_of(s.start_ts) for s in ws.sessions} == {month_of(MONTHS[2])}
+    check(ws, tmp_path, expected)
+    ws.close()
+
+    ws = Workspace("json")
+    # editar una sesión del mes anterior (cargado bajo demanda)
+    ws.load_months(MONTHS[1], MONTHS[2] - 1)
+    old = next(s for s in ws.sessions if month_of(s.start_ts) == month_of(MONTHS[1]))
+    ws.ensure(old.section, "Informes")
+    new = Session(old.id, old.section, "Informes", old.start_ts, old.end_ts, old.seconds + 120)
+    ws.update_session(new)
+    # renombrar la sección con el mes más antiguo sin cargar
+    ws.mirror("rename_section", "Trabajo", "Oficina")
+    ws.store.rename_section("Trabajo", "Oficina")
+    expected = sorted(
+        (new if s.uid == new.uid else s).moved("Oficina" if s.section == "Trabajo" else s.section,
+                                               "Informes" if s.uid == new.uid else s.sub).astuple()
+        for s in map(Session.from_tuple, expected)
+    )
+    ws.close()
+
+    # recarga desde el diario, sin compactar
+    ws = Workspace("json")
+    check(ws, tmp_path, expected)
+    ws.store.compact(wait=True)
+    ws.close()
+
+    ws = Workspace("json")
+    assert not any(s.section == "Trabajo" for s in ws.sessions)
+    check(ws, tmp_path, expected)
+    ws.close()
@@ -0,0 +1,121 @@
+import random
+import uuid
+from datetime import date, datetime, time as dtime, timedelta
+
+import pytest
+
+from laboura import Session, filter_sessions, remap_mapping, summarize_sessions
+from laboura.core import remap_sessions
+
+columnar = pytest.importorskip("laboura.columnar")
+if columnar.np is None:
+    pytest.skip("numpy no instalado", allow_module_level=True)
+
+SECTIONS = ["Trabajo", "Estudio", "Casa"]
+SUBS = ["General", "Lectura", "Código"]
+DAY0 = date(2024, 3, 1)  # incluye el cambio de hora de finales de marzo
+T0 = datetime.combine(DAY0, dtime.min).timestamp()
+MODES = ["Día", "Semana", "Mes"]
+
+
+def random_session(rng):
+    start = T0 + rng.randrange(0, 90 * 86400)
+    kind = rng.random()
+    if kind < 0.6:
+        dur = rng.randrange(60, 4 * 3600)
+    elif kind < 0.9:
+        # cruza la medianoche
+        midnight = datetime.combine(date.fromtimestamp(start) + timedelta(days=1), dtime.min).timestamp()
+        start = midnight - rng.randrange(60, 6 * 3600)
+        dur = midnight - start + rng.randrange(60, 6 * 3600)
+    else:
+        dur = rng.randrange(86400 + 1, 4 * 86400)  # más de un día
+    # segundos efectivos por debajo de la duración (pausas)
+    secs = int(dur * rng.uniform(0.5, 1.0))
+    return Session(uuid.uuid4().bytes, rng.choice(SECTIONS), rng.choice(SUBS), start, start + dur, secs)
+
+
+def windows(rng):
+    # filtros como los de _collect_filters(): días completos, y alguno suelto
+    out = [(None, None, None, None)]
+    for _ in range(6):
+        d0 = DAY0 + timedelta(days=rng.randrange(-5, 95))
+        d1 = d0 + timedelta(days=rng.randrange(0, 40))
+        lo = datetime.combine(d0, dtime.min).timestamp()
+        hi = datetime.combine(d1, dtime(23, 59, 59)).timestamp()
+        sec = rng.choice(SECTIONS + [None, None])
+        sub = rng.choice(SUBS + [None, None])
+        out.append((sec, sub, lo, hi))
+    out.append((None, None, T0 + rng.randrange(0, 90 * 86400), None))
+    out.append((rng.choice(SECTIONS), None, None, T0 + rng.randrange(0, 90 * 86400)))
+    return out
+
+
+def key(s):
+    return s.start_ts, s.uid
+
+
+def drop(sessions, gone):
+    uids = {s.uid for s in gone}
+    return [s for s in sessions if s.uid not in uids]
+
+
+def check(engine, sessions, rng):
+    assert len(engine) == len(sessions)
+    for sec, sub, lo, hi in windows(rng):
+        ref = filter_sessions(sessions, sec, sub, lo, hi)
+        got = engine.query(sec, sub, lo, hi)
+        assert [s.uid for s in sorted(got, key=key)] == [s.uid for s in sorted(ref, key=key)]
+        assert [s.start_ts for s in got] == sorted(s.start_ts for s in got)
+        for mode in MODES:
+            for merge in (False, True):
+                want = summarize_sessions(ref, mode, merge, start_ts=lo, end_ts=hi)
+                assert engine.summarize(mode, sec, sub, lo, hi, merge) == want, (mode, merge, sec, sub)
+
+
+def test_columnar_matches_reference():
+    rng = random.Random(2024)
+    sessions = [random_session(rng) for _ in range(3000)]
+    engine = columnar.ColumnarEngine(sessions)
+    check(engine, sessions, rng)
+
+    engine.rename_section("Casa", "Hogar")
+    for s in sessions:
+        if s.section == "Casa":
+            s.section = "Hogar"
+    check(engine, sessions, rng)
+
+    engine.rename_sub("Trabajo", "Lectura", "Informes")
+    for s in sessions:
+        if s.section == "Trabajo" and s.sub == "Lectura":
+            s.sub = "Informes"
+    check(engine, sessions, rng)
+
+    mapping = remap_mapping([["Estudio", None, "Trabajo", None], ["Hogar", "General", "Hogar", "Código"]])
+    engine.remap(mapping)
+    remap_sessions(sessions, mapping)
+    check(engine, sessions, rng)
+
+    # pocas bajas: sólo lápidas
+    gone = rng.sample(sessions, 200)
+    engine.remove_many(gone)
+    sessions = drop(sessions, gone)
+    assert engine.dead == 200
+    check(engine, sessions, rng)
+
+    # más de 1024 bajas: remove_many() reconstruye el motor
+    gone = rng.sample(sessions, 1100)
+    engine.remove_many(gone)
+    sessions = drop(sessions, gone)
+    assert engine.dead == 0
+    check(engine, sessions, rng)
+
+    # y sigue al día tras la reconstrucción
+    new = [random_session(rng) for _ in range(300)]
+    engine.add_many(new)
+    sessions += new
+    engine.rename_sub("Hogar", "Código", "Limpieza")
+    for s in sessions:
+        if s.section == "Hogar" and s.sub == "Código":
+            s.sub = "Limpieza"
+    check(engine, sessions, rng)
@@ -0,0 +1,84 @@
+import json
+from datetime import date, datetime, timedelta
+
+from laboura import Session, SessionIndex, write_sessions_csv
+from laboura.cli import Workspace
+from laboura.importer import read_import
+
+# el mes pasado se archiva al reabrir; el actual queda en memoria
+THIS = date.today().replace(day=1)
+PREV = (THIS - timedelta(days=1)).replace(day=1)
+MONTHS = [datetime.combine(d, datetime.min.time()).timestamp() for d in (PREV, THIS)]
+
+
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ws = Workspace("json")
+    for m0 in MONTHS:
+        for i in range(10):
+            sub = f"x{i % 3}"
+            ws.ensure("Trabajo", sub)
+            start = m0 + 3600 + i * 7200
+            ws.add_session(Session.new("Trabajo", sub, start, start + 1800))
+    ws.store.compact(wait=True)
+    ws.close()
+    ws = Workspace("json")
+    assert len(ws.sessions) == 10
+    return ws
+
+
+def row(s):
+    return {"section": s.section, "sub": s.sub, "start": s.start_ts, "end": s.end_ts}
+
+
+def test_reimport_export(tmp_path, monkeypatch):
+    ws = workspace(tmp_path, monkeypatch)
+    path = tmp_path / "export.csv"
+    assert write_sessions_csv(path, ws.store.iter_sessions()) == 20
+    # con y sin índice de lo que hay en memoria
+    for index in (SessionIndex(ws.sessions), None):
+        result = read_import(path, ws.store, index=index)
+        assert (result.read, len(result.sessions), result.duplicates, result.invalid) == (20, 0, 20, 0)
+    ws.close()
+
+
+def test_dedup_against_archived_months(tmp_path, monkeypatch):
+    ws = workspace(tmp_path, monkeypatch)
+    archived = [s for s in ws.store.iter_sessions(end_ts=MONTHS[1] - 1)]
+    assert len(archived) == 10 and ws.store.archived_months()
+    new = [Session.new("Trabajo", "x0", MONTHS[0] + 86400 * 3, MONTHS[0] + 86400 * 3 + 600)]
+    path = tmp_path / "import.jsonl"
+    path.write_text("".join(json.dumps(row(s)) + "\n" for s in archived[:4] + new + new),
+                    encoding="utf-8")
+    result = read_import(path, ws.store, index=SessionIndex(ws.sessions))
+    assert (len(result.sessions), result.duplicates) == (1, 5)
+    ws.import_sessions(result.sessions)
+    # una vez importada también es repetida
+    assert read_import(path, ws.store, index=SessionIndex(ws.sessions)).duplicates == 6
+    ws.close()
+
+
+def test_error_rows(tmp_path, monkeypatch):
+    ws = workspace(tmp_path, monkeypatch)
+    start = MONTHS[1] + 86400
+    good = {"section": "Casa", "sub": "General", "start": start, "end": start + 600}
+    rows = [
+        [["Casa", "General", start, start + 600]],      # no es un objeto
+        good,
+        {**good, "section": ""},
+        {**good, "start": start + 10, "end": start},
+        {**good, "start": "ayer"},
+        {"section": "Casa", "sub": "General", "start": start + 900},
+        7,
+    ]
+    path = tmp_path / "import.json"
+    path.write_text(json.dumps(rows), encoding="utf-8")
+    result = read_import(path, ws.store, index=SessionIndex(ws.sessions))
+    assert (result.read, len(result.sessions), result.invalid) == (7, 1, 6)
+    assert [n for n, _ in result.errors] == [1, 3, 4, 5, 6, 7]
+
+    # ninguna fila es un objeto: todas inválidas, sin excepción
+    path.write_text(json.dumps([[1, 2], "x"]), encoding="utf-8")
+    result = read_import(path, ws.store)
+    assert (result.read, len(result.sessions), result.invalid) == (2, 0, 2)
+    ws.close()
@@ -0,0 +1,99 @@
+import json
+from datetime import date, datetime
+
+import laboura.store_json
+from laboura import JournalStore, Session
+from laboura.cli import Workspace
+
+# dentro del mes en curso: load() no archiva nada
+T0 = datetime.combine(date.today().replace(day=1), datetime.min.time()).timestamp() + 3600
+
+
+def add(ws, n, offset=0):
+    for i in range(n):
+        sub = f"x{i % 3}"
+        ws.ensure("Trabajo", sub)
+        start = T0 + (offset + i) * 600
+        ws.add_session(Session.new("Trabajo", sub, start, start + 300 + i))
+
+
+def state(ws):
+    sessions = sorted(s.astuple() for s in ws.sessions)
+    totals = {sec: dict(subs) for sec, subs in ws.sections.items()}
+    return sessions, totals
+
+
+def crash(ws):
+    # lo que ya está en disco se queda; sólo se suelta el bloqueo
+    ws.store.close()
+
+
+def test_truncated_last_journal_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ws = Workspace("json")
+    add(ws, 20)
+    ws.store.compact(wait=True)
+    add(ws, 5, offset=20)
+    ws.rename_sub("Trabajo", "x1", "y")
+    before = state(ws)
+    # el último registro queda a medias
+    add(ws, 1, offset=40)
+    crash(ws)
+    journal = tmp_path / "data.journal"
+    journal.write_bytes(journal.read_bytes()[:-25])
+
+    ws = Workspace("json")
+    assert state(ws) == before
+    # lo que se escribe detrás de la línea rota también se lee
+    add(ws, 3, offset=50)
+    after = state(ws)
+    crash(ws)
+    assert state(Workspace("json")) == after
+
+
+def test_crash_between_rotation_and_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ws = Workspace("json")
+    add(ws, 20)
+    ws.store.compact(wait=True)
+    add(ws, 5, offset=20)
+
+    def killed(*args, **kwargs):
+        raise OSError("proceso terminado")
+
+    # data.journal ya rotado a data.journal.1, data.json sin renombrar
+    monkeypatch.setattr(laboura.store_json, "save_data", killed)
+    ws.store.compact(wait=True)
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    assert (tmp_path / "data.journal.1").exists()
+    add(ws, 5, offset=30)
+    ws.delete_sessions([next(iter(ws.sessions)).uid])
+    ws.rename_sub("Trabajo", "x2", "z")
+    before = state(ws)
+    crash(ws)
+
+    ws = Workspace("json")
+    assert state(ws) == before
+    # la siguiente compactación junta los dos diarios
+    ws.store.compact(wait=True)
+    assert not (tmp_path / "data.journal.1").exists()
+    crash(ws)
+    assert state(Workspace("json")) == before
+
+
+def test_group_commit_written_on_close(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # la ventana no vence durante la prueba: sólo close() puede escribirlos
+    monkeypatch.setattr(JournalStore, "FLUSH_MS", 60_000)
+    ws = Workspace("json")
+    add(ws, 10)
+    ws.rename_sub("Trabajo", "x1", "y")
+    journal = tmp_path / "data.journal"
+    assert not journal.exists() or journal.stat().st_size == 0
+    before = state(ws)
+    seq = ws.store.seq
+    crash(ws)
+    recs = [json.loads(line) for line in journal.read_text(encoding="utf-8").splitlines()]
+    assert [r["seq"] for r in recs] == list(range(1, seq + 1))
+    assert state(Workspace("json")) == before
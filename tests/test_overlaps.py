@@ -0,0 +1,66 @@
+import random
+
+from laboura import Session, find_overlaps, resolve_overlaps
+
+T0 = 1_700_000_000
+
+
+def s(section, start, end, user="ana", sub="General"):
+    return Session.new(section, sub, T0 + start, T0 + end, user)
+
+
+def span(x):
+    return x.start_ts - T0, x.end_ts - T0, x.seconds
+
+
+def apply(sessions, changed, deleted):
+    new, gone = {x.uid: x for x in changed}, set(deleted)
+    return [new.get(x.uid, x) for x in sessions if x.uid not in gone]
+
+
+def test_same_key_merges_into_first():
+    a, b = s("Trabajo", 0, 1000), s("Trabajo", 500, 1500)
+    assert [(x.uid, y.uid, secs) for x, y, secs in find_overlaps([b, a])] == [(a.uid, b.uid, 500)]
+    changed, deleted = resolve_overlaps([b, a])
+    assert deleted == [b.uid]
+    assert [(x.uid, span(x)) for x in changed] == [(a.uid, (0, 1500, 1500))]
+
+
+def test_fully_covered_is_deleted():
+    a, b = s("Trabajo", 0, 3000), s("Casa", 500, 1000)
+    assert find_overlaps([a, b])[0][2] == 500
+    assert resolve_overlaps([a, b]) == ([], [b.uid])
+
+
+def test_partial_overlap_trims_start():
+    a, b = s("Trabajo", 0, 1000), s("Casa", 600, 1600)
+    changed, deleted = resolve_overlaps([a, b])
+    assert deleted == []
+    assert [(x.uid, span(x)) for x in changed] == [(b.uid, (1000, 1600, 600))]
+
+
+def test_compares_with_furthest_end():
+    # tras fundir a y b, c se recorta hasta el fin de la sesión fundida
+    a, b, c = s("Trabajo", 0, 1000), s("Trabajo", 500, 1500), s("Casa", 1200, 2000)
+    changed, deleted = resolve_overlaps([a, b, c])
+    assert deleted == [b.uid]
+    assert sorted((x.uid, span(x)) for x in changed) == sorted(
+        [(a.uid, (0, 1500, 1500)), (c.uid, (1500, 2000, 500))])
+
+
+def test_other_users_are_ignored():
+    a, b = s("Trabajo", 0, 1000, user="ana"), s("Casa", 500, 1500, user="luis")
+    assert find_overlaps([a, b]) == []
+    assert resolve_overlaps([a, b]) == ([], [])
+
+
+def test_resolved_sessions_do_not_overlap():
+    rng = random.Random(3)
+    sessions = []
+    for _ in range(400):
+        start = rng.randrange(0, 50_000)
+        sessions.append(s(rng.choice(["Trabajo", "Casa"]), start, start + rng.randrange(1, 3000),
+                          user=rng.choice(["ana", "luis"])))
+    found = find_overlaps(sessions)
+    assert found and all(a.user == b.user for a, b, _ in found)
+    assert find_overlaps(apply(sessions, *resolve_overlaps(sessions))) == []
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from laboura import DayRollup, Session, SessionIndex, remap_mapping
+
+SECTIONS = ["Trabajo", "Estudio", "Casa"]
+SUBS = ["General", "Lectura", "Código"]
+T0 = 1_700_000_000
+WINDOW = (None, None, T0 + 5 * 86400, T0 + 20 * 86400)
+
+
+def random_session(rng):
+    start = T0 + rng.randrange(0, 30 * 86400)
+    return Session.new(rng.choice(SECTIONS), rng.choice(SUBS), start, start + rng.randrange(60, 30000))
+
+
+def mutate(rng, engine, sessions):
+    # lo que _mirror() puede hacer mientras un hilo consulta la copia
+    new = [random_session(rng) for _ in range(500)]
+    engine.add_many(new)
+    engine.remove_many(rng.sample(sessions + new, 1500))
+    engine.rename_section("Trabajo", "Oficina")
+    engine.rename_sub("Estudio", "Lectura", "Libros")
+    engine.remap(remap_mapping([["Casa", None, "Hogar", None]]))
+
+
+def uids(rows):
+    return [s.uid for s in rows]
+
+
+def test_index_snapshot_is_independent():
+    rng = random.Random(7)
+    sessions = [random_session(rng) for _ in range(2000)]
+    index = SessionIndex(sessions)
+    snap = index.snapshot()
+    before = [uids(snap.query(*WINDOW)), uids(snap.query("Casa", None, *WINDOW[2:]))]
+    mutate(rng, index, sessions)
+    assert [uids(snap.query(*WINDOW)), uids(snap.query("Casa", None, *WINDOW[2:]))] == before
+
+
+def test_rollup_snapshot_is_independent():
+    rng = random.Random(8)
+    sessions = [random_session(rng) for _ in range(2000)]
+    rollup = DayRollup(sessions)
+    snap = rollup.snapshot()
+    before = snap.summarize("Semana")
+    mutate(rng, rollup, sessions)
+    assert snap.summarize("Semana") == before
+    assert rollup.summarize("Semana") != before
+
+
+def test_columnar_snapshot_survives_compaction():
+    columnar = pytest.importorskip("laboura.columnar")
+    if columnar.np is None:
+        pytest.skip("numpy no instalado")
+    rng = random.Random(9)
+    sessions = [random_session(rng) for _ in range(2000)]
+    engine = columnar.ColumnarEngine(sessions)
+    snap = engine.snapshot()
+    before = [uids(snap.query(*WINDOW)), snap.summarize("Día", *WINDOW)]
+    # más de 1024 borradas: remove_many() reconstruye el motor
+    mutate(rng, engine, sessions)
+    assert engine.dead == 0
+    assert [uids(snap.query(*WINDOW)), snap.summarize("Día", *WINDOW)] == before
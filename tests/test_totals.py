@@ -0,0 +1,109 @@
+import random
+
+from laboura import (
+    DayRollup, Session, SessionList, TotalsAggregate, recalc_totals_from_sessions, remap_mapping,
+)
+from laboura.core import remap_sessions
+
+SECTIONS = ["Trabajo", "Estudio", "Casa"]
+SUBS = ["General", "Lectura", "Código"]
+T0 = 1_700_000_000
+
+
+def random_session(rng):
+    start = T0 + rng.randrange(0, 60 * 86400)
+    return Session.new(rng.choice(SECTIONS), rng.choice(SUBS), start, start + rng.randrange(60, 30000))
+
+
+def retime(rng, old):
+    new = random_session(rng)
+    return Session(old.id, new.section, new.sub, new.start_ts, new.end_ts, new.seconds)
+
+
+def rename_section(sessions, old, new):
+    for s in sessions:
+        if s.section == old:
+            s.section = new
+
+
+def rename_sub(sessions, section, old, new):
+    for s in sessions:
+        if s.section == section and s.sub == old:
+            s.sub = new
+
+
+def test_incremental_totals_match_full_recalc():
+    # secuencia aleatoria de mutaciones; tras cada una los totales
+    # incrementales tienen que coincidir con un recálculo completo
+    rng = random.Random(1234)
+    sessions = SessionList(random_session(rng) for _ in range(50))
+    totals = TotalsAggregate(recalc_totals_from_sessions(sessions))
+    rollup = DayRollup(sessions)
+    aggs = (totals, rollup)
+
+    for step in range(2000):
+        live = list(sessions)
+        op = rng.choice(["add", "add_many", "remove", "remove_many", "replace", "replace_many",
+                         "rename_section", "rename_sub", "remap"])
+        if op == "add":
+            s = random_session(rng)
+            sessions.append(s)
+            for m in aggs:
+                m.add(s)
+        elif op == "add_many":
+            new = [random_session(rng) for _ in range(rng.randrange(1, 8))]
+            sessions.extend(new)
+            for m in aggs:
+                m.add_many(new)
+        elif op == "remove" and live:
+            s = sessions.remove_many([rng.choice(live).uid])[0]
+            for m in aggs:
+                m.remove(s)
+        elif op == "remove_many" and live:
+            gone = sessions.remove_many({s.uid for s in rng.sample(live, min(len(live), 5))})
+            for m in aggs:
+                m.remove_many(gone)
+        elif op == "replace" and live:
+            new = retime(rng, rng.choice(live))
+            old = sessions.replace(new)
+            for m in aggs:
+                m.replace(old, new)
+        elif op == "replace_many" and live:
+            new = [retime(rng, s) for s in rng.sample(live, min(len(live), 4))]
+            old = sessions.replace_many(new)
+            for m in aggs:
+                m.replace_many(old, new)
+        elif op == "rename_section":
+            # también old == new, que no puede duplicar nada
+            old, new = rng.choice(SECTIONS), rng.choice(SECTIONS)
+            rename_section(sessions, old, new)
+            for m in aggs:
+                m.rename_section(old, new)
+        elif op == "rename_sub":
+            sec, old, new = rng.choice(SECTIONS), rng.choice(SUBS), rng.choice(SUBS)
+            rename_sub(sessions, sec, old, new)
+            for m in aggs:
+                m.rename_sub(sec, old, new)
+        elif op == "remap":
+            pairs = [[rng.choice(SECTIONS), rng.choice(SUBS + [None]),
+                      rng.choice(SECTIONS), rng.choice(SUBS + [None])]
+                     for _ in range(rng.randrange(1, 3))]
+            try:
+                mapping = remap_mapping(pairs)
+            except ValueError:
+                continue
+            remap_sessions(sessions, mapping)
+            for m in aggs:
+                m.remap(mapping)
+
+        full = recalc_totals_from_sessions(sessions)
+        assert totals.mismatches(full) == [], (step, op)
+        assert TotalsAggregate(rollup.totals()).mismatches(full) == [], (step, op)
+
+
+def test_rename_to_same_name_keeps_totals():
+    s = Session.new("Trabajo", "General", T0, T0 + 3600)
+    totals = TotalsAggregate(recalc_totals_from_sessions([s]))
+    totals.rename_sub("Trabajo", "General", "General")
+    totals.rename_section("Trabajo", "Trabajo")
+    assert totals.sections["Trabajo"]["General"] == 3600
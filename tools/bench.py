@@ -0,0 +1,292 @@
+# tools/bench.py
+# Banco de pruebas reproducible de las rutas de datos y agregación: genera
+# un histórico sintético con semilla (muchas secciones, subdivisiones y años)
+# y mide carga/guardado, totales, filtros del histórico, agrupación del
+# resumen y exportaciones CSV a varias escalas. Los resultados se guardan en
+# JSON para comparar ejecuciones; la parte de la ventana corre con la
+# plataforma offscreen de Qt.
+#
+#   python tools/bench.py --sizes 10000 100000 --out base.json
+#   python tools/bench.py --sizes 10000 100000 --compare base.json
+#   python tools/bench.py --generate carpeta --sizes 200000   # sólo el data.json
+import argparse, gc, json, os, platform, random, shutil, subprocess, sys, tempfile, time, uuid
+from datetime import date, datetime, time as dtime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from laboura.core import (
+    Session, SessionIndex, DayRollup, day_of, save_data,
+    recalc_totals_from_sessions, filter_sessions, summarize_sessions,
+    write_totals_csv, write_sessions_csv, write_rollup_csv,
+)
+from laboura.store_json import JournalStore
+from laboura.store_sqlite import SqliteStore
+from laboura.columnar import ColumnarEngine, np
+
+PROJECTS = ("Cliente", "Interno", "Formación", "Mantenimiento", "I+D", "Soporte")
+SUBS = ("Diseño", "Desarrollo", "Reuniones", "Pruebas", "Documentación", "Gestión",
+        "Despliegue", "Revisión")
+USERS = ("ana", "luis", "marta", None)
+MODES = ("Día", "Semana", "Mes")
+
+
+# ============== histórico sintético ==============
+def make_history(n, seed=1, sections=24, subs=6, years=5, anchor=None):
+    # n sesiones repartidas en `years` años hasta `anchor` (por defecto hoy a
+    # las 00:00): con la misma semilla y el mismo ancla salen idénticas
+    rnd = random.Random(seed)
+    if anchor is None:
+        anchor = datetime.combine(date.today(), dtime.min)
+    end = anchor.timestamp()
+    start = end - years * 365 * 86400
+    names = [f"{PROJECTS[i % len(PROJECTS)]} {i // len(PROJECTS) + 1:02d}" for i in range(sections)]
+    tree = {sec: rnd.sample(SUBS, min(subs, len(SUBS))) for sec in names}
+    # unas pocas secciones concentran casi todo el tiempo, como en la realidad
+    weights = [1 / (k + 1) for k in range(sections)]
+    starts = sorted(rnd.uniform(start, end) for _ in range(n))
+    out = []
+    for t in starts:
+        sec = rnd.choices(names, weights)[0]
+        secs = int(rnd.triangular(300, 4 * 3600, 45 * 60))
+        uid = uuid.UUID(int=rnd.getrandbits(128), version=4).bytes
+        out.append(Session(uid, sec, rnd.choice(tree[sec]), t, t + secs, secs, rnd.choice(USERS)))
+    return out
+
+
+def write_history(folder, sessions, fmt=None):
+    # data.json como lo dejaría una compactación (con cubo por días)
+    folder.mkdir(parents=True, exist_ok=True)
+    save_data(recalc_totals_from_sessions(sessions), None, sessions,
+              path=folder / "data.json", rollup=DayRollup(sessions).rows(), fmt=fmt)
+
+
+# ============== medición ==============
+def best(fn, repeat):
+    # el mejor de `repeat`: lo menos afectado por el resto de la máquina
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def once(fn):
+    return best(fn, 1)
+
+
+def load_store(cls):
+    def run():
+        store = cls()
+        try:
+            store.load()
+        finally:
+            store.close()
+    return run
+
+
+def bench_core(folder, n, args):
+    res = {}
+    rep = args.repeat
+    sessions = make_history(n, args.seed, args.sections, args.subs, args.years)
+    res["save_data"] = best(lambda: write_history(folder, sessions), rep)
+    # la primera carga archiva los meses cerrados (una sola vez)
+    res["load_data json (archiva)"] = once(load_store(JournalStore))
+    res["load_data json"] = best(load_store(JournalStore), rep)
+    # la primera apertura de SQLite migra data.json + archivo
+    res["load_data sqlite (migra)"] = once(load_store(SqliteStore))
+    res["load_data sqlite"] = best(load_store(SqliteStore), rep)
+
+    res["recalc_totals_from_sessions"] = best(lambda: recalc_totals_from_sessions(sessions), rep)
+    rollup = DayRollup(sessions)
+    res["DayRollup"] = best(lambda: DayRollup(sessions), rep)
+    index = SessionIndex(sessions)
+    res["SessionIndex"] = best(lambda: SessionIndex(sessions), rep)
+
+    # filtros del histórico: el último año de la sección con más sesiones
+    sec = max(rollup.totals().items(), key=lambda kv: sum(kv[1].values()))[0]
+    end_ts = time.time()
+    start_ts = end_ts - 365 * 86400
+    filters = [("todo", (None, None, None, None)),
+               ("sección, 1 año", (sec, None, start_ts, end_ts))]
+    columns = ColumnarEngine(sessions) if np is not None else None
+    for label, f in filters:
+        res[f"filtro índice ({label})"] = best(lambda: index.query(*f), rep)
+        res[f"filtro lineal ({label})"] = best(lambda: filter_sessions(sessions, *f), rep)
+        if columns is not None:
+            res[f"filtro numpy ({label})"] = best(lambda: columns.query(*f), rep)
+
+    # agrupación del resumen (lo que rellena _maybe_fill_summary)
+    rows = filter_sessions(sessions, *filters[1][1])
+    for mode in MODES:
+        res[f"resumen cubo {mode}"] = best(lambda: rollup.summarize(mode), rep)
+        res[f"resumen sesiones {mode}"] = best(lambda: summarize_sessions(sessions, mode), rep)
+        res[f"resumen cubo {mode} (filtrado)"] = best(
+            lambda: rollup.summarize(mode, sec, None, day_of(start_ts), day_of(end_ts)), rep)
+        res[f"resumen sesiones {mode} (filtrado)"] = best(lambda: summarize_sessions(rows, mode), rep)
+        if columns is not None:
+            res[f"resumen numpy {mode}"] = best(lambda: columns.summarize(mode), rep)
+
+    totals = recalc_totals_from_sessions(sessions)
+    summary = rollup.summarize("Mes")
+    for ext in (".csv", ".csv.gz"):
+        out = folder / f"export{ext}"
+        res[f"write_totals_csv{ext}"] = best(lambda: write_totals_csv(out, totals), rep)
+        res[f"write_sessions_csv{ext}"] = best(lambda: write_sessions_csv(out, sessions), rep)
+        res[f"write_rollup_csv{ext}"] = best(lambda: write_rollup_csv(out, summary), rep)
+        out.unlink(missing_ok=True)
+    return res
+
+
+# ============== ventana (Qt offscreen) ==============
+def bench_gui(folder, args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PySide6.QtWidgets import QApplication, QMessageBox
+        from PySide6.QtCore import qInstallMessageHandler
+    except ImportError:
+        print("PySide6 no está instalado: se omite la parte de la ventana")
+        return {}
+    import LabouraTime as L
+
+    # offscreen avisa en cada ventana de lo que no soporta
+    qInstallMessageHandler(
+        lambda mode, ctx, msg: None if "propagateSizeHints" in msg else print(msg, file=sys.stderr))
+
+    def fail(_parent, title, msg, *a, **k):
+        raise RuntimeError(f"{title}: {msg}")
+    QMessageBox.critical = staticmethod(fail)
+    app = QApplication.instance() or QApplication([])
+
+    def settle(cond=lambda: True, timeout=600):
+        # procesa eventos hasta que no quedan tareas en segundo plano
+        limit = time.perf_counter() + timeout
+        while w._tasks or not cond():
+            app.processEvents()
+            if time.perf_counter() > limit:
+                raise TimeoutError("la ventana no terminó a tiempo")
+            time.sleep(0.0005)
+        app.processEvents()
+
+    res = {}
+    t0 = time.perf_counter()
+    w = L.SectionTimerApp()
+    w.show()
+    settle(lambda: w._loaded)
+    res["ventana hasta datos"] = time.perf_counter() - t0
+    try:
+        res["abrir Histórico"] = once(lambda: (w.tabs.setCurrentWidget(w.history_tab), settle()))
+        # todo el rango: la primera vez lee los meses archivados
+        w.date_from.setDate(w.date_from.date().addYears(-(args.years + 1)))
+        res["apply_history_filters (lee meses)"] = once(lambda: (w.apply_history_filters(), settle()))
+        assert len(w.filtered_sessions) == len(w.sessions), "faltan meses por leer"
+        res["apply_history_filters"] = best(lambda: (w.apply_history_filters(), settle()), args.repeat)
+        for i, mode in enumerate(MODES, start=1):
+            w.cmb_group.blockSignals(True)
+            w.cmb_group.setCurrentIndex(i)
+            w.cmb_group.blockSignals(False)
+            res[f"apply_history_filters {mode}"] = best(
+                lambda: (w.apply_history_filters(), settle()), args.repeat)
+            rows = w.summary_model.rows
+            res[f"_maybe_fill_summary {mode}"] = best(lambda: w._maybe_fill_summary(rows), args.repeat)
+        filtered = w.filtered_sessions
+        res["_fill_history_table"] = best(lambda: w._fill_history_table(filtered), args.repeat)
+    finally:
+        w.close()
+        settle()
+    return res
+
+
+# ============== resultados ==============
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, tolerance):
+    # -> nº de casos más lentos que la referencia por encima de la tolerancia
+    slower = 0
+    print(f"\ncomparación con {old['meta'].get('commit')} ({old['meta'].get('date')})")
+    for size, cases in new["results"].items():
+        base = old["results"].get(size, {})
+        for name, secs in cases.items():
+            if name not in base or not base[name]:
+                continue
+            ratio = secs / base[name]
+            mark = ""
+            # por debajo de unos ms el ruido pesa más que el cambio
+            if ratio > tolerance and secs - base[name] > 0.005:
+                mark, slower = "  <-- más lento", slower + 1
+            print(f"{size:>9}  {name:<40} {base[name]:>9.4f}s -> {secs:>9.4f}s  x{ratio:.2f}{mark}")
+    return slower
+
+
+def main():
+    p = argparse.ArgumentParser(description="banco de pruebas de Laboura Time")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--sections", type=int, default=24)
+    p.add_argument("--subs", type=int, default=6, help="subdivisiones por sección")
+    p.add_argument("--years", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3, help="repeticiones (se queda la mejor)")
+    p.add_argument("--no-gui", action="store_true", help="sin la parte de la ventana")
+    p.add_argument("--out", help="guarda los resultados en este JSON")
+    p.add_argument("--compare", help="JSON de una ejecución anterior")
+    p.add_argument("--tolerance", type=float, default=1.25,
+                   help="cociente a partir del cual un caso cuenta como regresión")
+    p.add_argument("--generate", metavar="CARPETA",
+                   help="sólo escribe un data.json sintético (--sizes: el primero)")
+    args = p.parse_args()
+
+    if args.generate:
+        n = args.sizes[0]
+        write_history(Path(args.generate), make_history(n, args.seed, args.sections, args.subs, args.years))
+        print(f"{args.generate}/data.json: {n} sesiones")
+        return 0
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np is not None,
+            "seed": args.seed, "sections": args.sections, "subs": args.subs,
+            "years": args.years, "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    cwd = os.getcwd()
+    for n in args.sizes:
+        folder = Path(tempfile.mkdtemp(prefix=f"laboura-bench-{n}-"))
+        os.chdir(folder)  # los almacenes trabajan sobre la carpeta actual
+        try:
+            print(f"--- {n} sesiones ---", flush=True)
+            res = bench_core(folder, n, args)
+            if not args.no_gui:
+                res.update(bench_gui(folder, args))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(folder, ignore_errors=True)
+        for name, secs in res.items():
+            print(f"{name:<40} {secs:>9.4f}s")
+        report["results"][str(n)] = res
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"resultados: {args.out}")
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(old, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
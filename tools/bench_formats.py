@@ -0,0 +1,84 @@
+# tools/bench_formats.py
+# Compara los formatos del snapshot (data.json) guardando y cargando N
+# sesiones sintéticas: el JSON indentado de antes, JSON compacto (stdlib),
+# orjson y msgpack. Mide escritura, lectura y tamaño en disco.
+#
+#   python tools/bench_formats.py --sizes 10000 100000 1000000
+import argparse, json, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from laboura import formats
+from laboura.core import Session, DayRollup, save_data, read_payload, recalc_totals_from_sessions, _write_atomic
+from bench import make_history
+
+
+def bench_indent(path, sessions, sections, rollup):
+    # el formato anterior: json.dump(indent=2), codificador en Python puro
+    payload = {"seq": 0, "sections": sections, "current": None,
+               "sessions": [s.to_dict() for s in sessions], "rollup": rollup}
+    t0 = time.perf_counter()
+    _write_atomic(path, json.dumps(payload, ensure_ascii=False, indent=2))
+    t1 = time.perf_counter()
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    [Session.from_dict(d) for d in raw["sessions"]]
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def bench_format(path, sessions, sections, rollup, fmt):
+    t0 = time.perf_counter()
+    save_data(sections, None, sessions, path=path, rollup=rollup, fmt=fmt)
+    t1 = time.perf_counter()
+    raw, name = read_payload(path)
+    [Session.from_dict(d) for d in raw["sessions"]]
+    t2 = time.perf_counter()
+    assert name == fmt and len(raw["sessions"]) == len(sessions)
+    return t1 - t0, t2 - t1
+
+
+def main():
+    p = argparse.ArgumentParser(description="formatos del snapshot")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    folder = Path(tempfile.mkdtemp(prefix="laboura-formats-"))
+    cases = [("json indent=2", None)]
+    # stdlib compacto: se fuerza desactivando orjson mientras se mide
+    cases.append(("json compacto", "stdlib"))
+    if formats.orjson is not None:
+        cases.append(("json (orjson)", "json"))
+    if formats.msgpack is not None:
+        cases.append(("msgpack", "msgpack"))
+    missing = [m for m in ("orjson", "msgpack") if getattr(formats, m) is None]
+    if missing:
+        print(f"sin instalar (se omiten): {', '.join(missing)}")
+
+    print(f"{'sesiones':>9}  {'formato':<14} {'guardar':>9} {'cargar':>9} {'tamaño':>10}")
+    for n in args.sizes:
+        sessions = make_history(n, args.seed)
+        sections = recalc_totals_from_sessions(sessions)
+        rollup = DayRollup(sessions).rows()
+        for label, fmt in cases:
+            path = folder / f"data-{n}.bin"
+            if fmt is None:
+                save, load = bench_indent(path, sessions, sections, rollup)
+            elif fmt == "stdlib":
+                saved, formats.orjson = formats.orjson, None
+                try:
+                    save, load = bench_format(path, sessions, sections, rollup, "json")
+                finally:
+                    formats.orjson = saved
+            else:
+                save, load = bench_format(path, sessions, sections, rollup, fmt)
+            size = path.stat().st_size
+            path.unlink()
+            print(f"{n:>9}  {label:<14} {save:>8.3f}s {load:>8.3f}s {size / 1e6:>8.2f}MB")
+    folder.rmdir()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
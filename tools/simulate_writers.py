@@ -0,0 +1,128 @@
+# tools/simulate_writers.py
+# Varios procesos escribiendo a la vez en la misma data.db (SqliteStore): cada
+# uno añade, edita, borra y renombra sesiones con su propio LABOURA_USER y va
+# recogiendo los cambios de los demás con poll_changes(). Al final todos deben
+# tener en memoria exactamente lo mismo que una carga limpia de la base.
+#
+#   python tools/simulate_writers.py --writers 8 --ops 300
+import argparse, hashlib, multiprocessing as mp, os, random, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SECTIONS = ("Dev", "Ops", "Diseño")
+SUBS = ("a", "b", "c", "d")
+
+
+def digest(ws):
+    # huella del estado en memoria: sesiones, totales y cubo por días
+    h = hashlib.sha1()
+    for s in sorted(ws.sessions, key=lambda s: s.id):
+        h.update(repr((s.id, s.section, s.sub, s.start_ts, s.seconds, s.user)).encode())
+    for sec in sorted(ws.sections):
+        for sub, secs in sorted(ws.sections[sec].items()):
+            if secs:
+                h.update(repr((sec, sub, secs)).encode())
+    h.update(repr(sorted(ws.rollup.rows())).encode())
+    return h.hexdigest()
+
+
+def writer(k, ops, folder, seed, barrier, results):
+    os.chdir(folder)
+    os.environ["LABOURA_USER"] = f"user{k}"
+    from laboura.cli import Workspace
+    from laboura.core import Session
+
+    rnd = random.Random(seed * 1000 + k)
+    ws = Workspace("sqlite")
+    counts = dict.fromkeys(("add", "update", "delete", "rename", "poll"), 0)
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        r = rnd.random()
+        live = list(ws.sessions) if r >= 0.55 else None
+        if r < 0.55 or not live:
+            t = time.time() - rnd.randint(0, 86400 * 30)
+            ws.add_session(Session.new(rnd.choice(SECTIONS), rnd.choice(SUBS),
+                                       t, t + rnd.randint(60, 7200), ws.store.user))
+            counts["add"] += 1
+        elif r < 0.70:
+            old = rnd.choice(live)
+            new = Session(old.uid, rnd.choice(SECTIONS), old.sub, old.start_ts,
+                          old.end_ts, old.seconds + rnd.randint(-30, 30), old.user)
+            ws.update_session(new)
+            counts["update"] += 1
+        elif r < 0.80:
+            ws.delete_sessions([s.uid for s in rnd.sample(live, min(3, len(live)))])
+            counts["delete"] += 1
+        elif r < 0.82:
+            old, new = rnd.sample(SUBS, 2)
+            ws.rename_sub(rnd.choice(SECTIONS), old, new)
+            counts["rename"] += 1
+        else:
+            ws.poll()
+            counts["poll"] += 1
+    elapsed = time.perf_counter() - t0
+    barrier.wait()  # todos han terminado de escribir
+    ws.poll()
+    results.put((k, counts, elapsed, len(ws.sessions), digest(ws)))
+    ws.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--writers", type=int, default=8)
+    p.add_argument("--ops", type=int, default=300)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--dir", help="carpeta de la base (por defecto una temporal)")
+    args = p.parse_args()
+
+    folder = args.dir or tempfile.mkdtemp(prefix="laboura-writers-")
+    os.chdir(folder)
+    from laboura.cli import Workspace
+    Workspace("sqlite").close()  # crea/migra la base antes de arrancar
+
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(args.writers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=writer, args=(k, args.ops, folder, args.seed, barrier, results))
+             for k in range(args.writers)]
+    t0 = time.perf_counter()
+    for pr in procs:
+        pr.start()
+    out = sorted(results.get() for _ in procs)
+    for pr in procs:
+        pr.join()
+    wall = time.perf_counter() - t0
+
+    ws = Workspace("sqlite")
+    expected = digest(ws)
+    db = ws.store.db
+    bad_totals = db.execute(
+        "SELECT COUNT(*) FROM totals t LEFT JOIN (SELECT section, sub, SUM(seconds) s "
+        "FROM sessions GROUP BY section, sub) x USING (section, sub) "
+        "WHERE t.seconds != COALESCE(x.s, 0)").fetchone()[0]
+    from laboura.core import DayRollup
+    bad_rollup = sorted(DayRollup(ws.sessions).rows()) != sorted(ws.rollup.rows())
+    changes = db.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+    users = db.execute("SELECT user, COUNT(*) FROM sessions GROUP BY user ORDER BY user").fetchall()
+    ws.close()
+
+    ok = True
+    total_ops = 0
+    print(f"base: {folder}/data.db")
+    for k, counts, elapsed, n, dig in out:
+        same = dig == expected
+        ok &= same
+        total_ops += args.ops
+        print(f"  writer {k}: {counts}  {elapsed:.2f}s  sesiones={n}  {'OK' if same else 'DIFERENTE'}")
+    print(f"sesiones por usuario: {dict(tuple(u) for u in users)}")
+    print(f"cambios registrados: {changes}")
+    print(f"totales materializados incorrectos: {bad_totals}; cubo incorrecto: {bad_rollup}")
+    print(f"{total_ops} operaciones en {wall:.2f}s ({total_ops / wall:.0f} op/s)")
+    ok &= not bad_totals and not bad_rollup
+    print("OK" if ok else "FALLO")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())